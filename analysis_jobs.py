@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import uuid
+import sys
+import socket
+import sqlite3
+import threading
+import subprocess
+
+from upload_spool import DocumentSource, write_source_atomically
+
+# --- Analysis Job Queue ---
+# Durable, SQLite-backed queue of analysis work. The Streamlit pages only enqueue jobs and
+# poll them; separate worker processes (job_worker.py) claim tasks, run the extraction and
+# classification pipeline, and write results back. A job is one upload batch or one
+# re-classification run; each of its files is a task. Uploaded bytes are spooled to
+# JOB_SPOOL_DIR so a worker in another process can read them, and a retry can read them again.
+# Claimed tasks hold a lease that the worker renews while it runs; if a worker dies, its
+# tasks return to the queue once the lease runs out, so work survives restarts.
+DEFAULT_JOB_QUEUE_FILE = "analysis_jobs.db"
+DEFAULT_SPOOL_DIR = "job_spool"
+LEASE_SECONDS = 120  # A claimed task goes back to the queue if its worker stays silent this long
+HEARTBEAT_SECONDS = 15
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 30  # Doubled on every further attempt
+SPOOL_GRACE_SECONDS = 600  # Fresh spool files may belong to a job that is still being enqueued
+JOB_RETENTION_DAYS = 7  # Finished jobs (and their task rows) are deleted after this long
+AUTOSTART_IDLE_EXIT_SECONDS = 300  # A worker the app starts itself exits after this long without work
+
+# Task statuses, in the order a file moves through them. "claimed" means a worker picked the
+# task up but has not started it yet.
+QUEUED_STATUSES = ("queued",)
+ACTIVE_STATUSES = ("claimed", "extracting", "ocr", "classifying")
+FINAL_STATUSES = ("done", "error", "cancelled")
+
+# Task sources: "upload" tasks read a spooled file; "stored" tasks re-classify the text kept in the results store.
+TASK_SOURCES = ("upload", "stored")
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" * len(values))
+
+
+class JobQueue:
+    """
+    SQLite-backed store of analysis jobs and their per-file tasks, shared by the app and every
+    worker process that points at the same file. Claims are atomic (BEGIN IMMEDIATE), so any
+    number of workers can pull from the same queue.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOB_QUEUE_FILE, spool_dir: str = DEFAULT_SPOOL_DIR):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        # Autocommit: single statements commit on their own, claims open an explicit write transaction.
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    created_at REAL NOT NULL,
+                    cancelled INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    content_hash TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    detail TEXT NOT NULL DEFAULT '',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    claimed_by TEXT,
+                    lease_expires REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status_available ON tasks(status, available_at);
+                CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks(job_id);
+                CREATE INDEX IF NOT EXISTS idx_tasks_claimed_by ON tasks(claimed_by);
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    host TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL,
+                    tasks_done INTEGER NOT NULL DEFAULT 0
+                );
+                -- Pipeline metrics and counters each worker published, kept after it exits
+                CREATE TABLE IF NOT EXISTS worker_stats (
+                    worker_id TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL,
+                    metrics TEXT NOT NULL,
+                    counters TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value REAL NOT NULL
+                );
+            """)
+
+    # --- Enqueueing (app) ---
+
+    def spool_path(self, content_hash: str) -> str:
+        return os.path.join(self.spool_dir, content_hash)
+
+    def enqueue_uploads(self, files: list[tuple[str, DocumentSource, str]], options: dict, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        """
+        Creates a job over (filename, source, content_hash) triples and returns its id. Each
+        file is copied to the spool once, in chunks, under its content hash; options go to
+        analyze_documents_pipelined.
+        """
+        for _, source, content_hash in files:
+            path = self.spool_path(content_hash)
+            try:
+                # Reused from an earlier job: touched so that release_spool, which only deletes files
+                # older than SPOOL_GRACE_SECONDS, keeps it until this job's tasks are committed.
+                os.utime(path)
+            except FileNotFoundError:
+                write_source_atomically(source, path)  # Workers never see a half-written file
+        return self._create_job("upload", options, [(filename, content_hash) for filename, _, content_hash in files], max_attempts)
+
+    def enqueue_stored(self, filenames, options: dict, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        """Creates a job that re-classifies documents from the text kept in the results store."""
+        return self._create_job("stored", {**options, "pre_extracted": True}, [(filename, None) for filename in filenames], max_attempts)
+
+    def _create_job(self, kind: str, options: dict, tasks: list[tuple[str, str | None]], max_attempts: int) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._prune_locked(now)
+                self._conn.execute("INSERT INTO jobs (id, kind, options, created_at) VALUES (?, ?, ?, ?)",
+                                   (job_id, kind, json.dumps(options), now))
+                self._conn.executemany("INSERT INTO tasks (job_id, filename, source, content_hash, max_attempts) VALUES (?, ?, ?, ?, ?)",
+                                       [(job_id, filename, kind, content_hash, max_attempts) for filename, content_hash in tasks])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def cancel(self, job_id: str) -> None:
+        """Cancels every task of the job that no worker has started yet; files already running finish."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+            self._conn.execute("UPDATE tasks SET status = 'cancelled', detail = 'Cancelled', finished_at = ? "
+                               "WHERE job_id = ? AND status IN ('queued', 'claimed')", (time.time(), job_id))
+
+    # --- Claiming and reporting (workers) ---
+
+    def claim(self, worker_id: str, limit: int) -> tuple[dict, list[dict]] | None:
+        """
+        Atomically claims up to limit runnable tasks of the oldest job that has any, after
+        returning tasks whose lease expired to the queue. Returns (job, tasks) or None.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(f"""
+                    UPDATE tasks SET claimed_by = NULL, lease_expires = NULL,
+                        status = CASE WHEN attempts >= max_attempts THEN 'error' ELSE 'queued' END,
+                        detail = CASE WHEN attempts >= max_attempts THEN 'Worker stopped responding; giving up'
+                                      ELSE 'Worker stopped responding; retrying' END,
+                        finished_at = CASE WHEN attempts >= max_attempts THEN ? END
+                    WHERE status IN ({_placeholders(ACTIVE_STATUSES)}) AND lease_expires < ?
+                """, (now, *ACTIVE_STATUSES, now))
+                row = self._conn.execute("SELECT job_id FROM tasks WHERE status = 'queued' AND available_at <= ? ORDER BY id LIMIT 1",
+                                         (now,)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job = dict(self._conn.execute("SELECT id, kind, options FROM jobs WHERE id = ?", (row["job_id"],)).fetchone())
+                tasks = self._conn.execute("""
+                    UPDATE tasks SET status = 'claimed', claimed_by = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE id IN (SELECT id FROM tasks WHERE job_id = ? AND status = 'queued' AND available_at <= ? ORDER BY id LIMIT ?)
+                    RETURNING id, filename, source, content_hash, attempts, max_attempts
+                """, (worker_id, now + LEASE_SECONDS, job["id"], now, limit)).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job["options"] = json.loads(job["options"])
+        return job, sorted((dict(task) for task in tasks), key=lambda task: task["id"])
+
+    def heartbeat(self, worker_id: str) -> None:
+        """Renews the leases of the worker's tasks and records that it is alive."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(f"UPDATE tasks SET lease_expires = ? WHERE claimed_by = ? AND status IN ({_placeholders(ACTIVE_STATUSES)})",
+                               (now + LEASE_SECONDS, worker_id, *ACTIVE_STATUSES))
+            self._conn.execute("""
+                INSERT INTO workers (id, host, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+            """, (worker_id, socket.gethostname(), os.getpid(), now, now))
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def task_status(self, task_id: int) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row["status"] if row else None
+
+    def set_task_status(self, task_id: int, status: str, detail: str = "") -> None:
+        """Records a task's progress (extracting, ocr, classifying); ignored once the task is finished."""
+        with self._lock:
+            self._conn.execute(f"UPDATE tasks SET status = ?, detail = ?, started_at = COALESCE(started_at, ?) "
+                               f"WHERE id = ? AND status IN ({_placeholders(ACTIVE_STATUSES)})",
+                               (status, detail, time.time(), task_id, *ACTIVE_STATUSES))
+
+    def complete(self, task_id: int, worker_id: str, record: dict) -> None:
+        """Marks a task done (or error, for records with status Error) and keeps a summary of its record."""
+        now = time.time()
+        failed = record["status"] == "Error"
+        summary = {key: record.get(key) for key in ("category", "confidence", "classifier", "duplicate_of", "context_tokens", "baseline_tokens")}
+        summary["result_status"] = record["status"]
+        with self._lock:
+            self._conn.execute("""
+                UPDATE tasks SET status = ?, detail = ?, result = ?, finished_at = ?, started_at = COALESCE(started_at, ?),
+                    claimed_by = NULL, lease_expires = NULL
+                WHERE id = ?
+            """, ("error" if failed else "done", record["reasoning"] if failed else "", json.dumps(summary), now, now, task_id))
+            self._conn.execute("UPDATE workers SET tasks_done = tasks_done + 1 WHERE id = ?", (worker_id,))
+
+    def retry(self, task_id: int, reason: str) -> bool:
+        """Puts a failed task back in the queue with backoff; returns False when it has no attempts left."""
+        with self._lock:
+            row = self._conn.execute("SELECT attempts, max_attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None or row["attempts"] >= row["max_attempts"]:
+                return False
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (row["attempts"] - 1)
+            self._conn.execute("UPDATE tasks SET status = 'queued', detail = ?, available_at = ?, claimed_by = NULL, lease_expires = NULL "
+                               "WHERE id = ?", (f"Retry {row['attempts'] + 1} of {row['max_attempts']} in {delay:.0f} s: {reason}",
+                                                time.time() + delay, task_id))
+        return True
+
+    def release_task(self, task_id: int) -> None:
+        """Returns a claimed task the worker did not start to the queue, without using up an attempt."""
+        with self._lock:
+            self._conn.execute("UPDATE tasks SET status = 'queued', attempts = attempts - 1, claimed_by = NULL, lease_expires = NULL "
+                               "WHERE id = ? AND status = 'claimed'", (task_id,))
+
+    def release_spool(self) -> int:
+        """Deletes spooled uploads that no unfinished task needs any more. Returns the number deleted."""
+        with self._lock:
+            needed = {row[0] for row in self._conn.execute(
+                f"SELECT DISTINCT content_hash FROM tasks WHERE source = 'upload' AND status NOT IN ({_placeholders(FINAL_STATUSES)})",
+                FINAL_STATUSES)}
+        removed = 0
+        cutoff = time.time() - SPOOL_GRACE_SECONDS
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if name not in needed and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass  # Already removed by another worker
+        return removed
+
+    # --- Polling (app) ---
+
+    def live_workers(self) -> list[dict]:
+        """Workers that sent a heartbeat within the last two heartbeat intervals."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM workers WHERE heartbeat_at >= ? ORDER BY started_at",
+                                      (time.time() - 2 * HEARTBEAT_SECONDS,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending_count(self) -> int:
+        """Tasks waiting for or being processed by a worker, over all jobs."""
+        statuses = QUEUED_STATUSES + ACTIVE_STATUSES
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM tasks WHERE status IN ({_placeholders(statuses)})", statuses).fetchone()[0]
+
+    def snapshot(self, job_id: str) -> dict | None:
+        """Point-in-time view of a job: one row per file plus totals, or None for an unknown job."""
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            tasks = self._conn.execute("SELECT * FROM tasks WHERE job_id = ? ORDER BY id", (job_id,)).fetchall()
+        rows = []
+        for task in tasks:
+            row = {key: task[key] for key in ("filename", "status", "detail", "attempts", "started_at", "finished_at")}
+            row.update(json.loads(task["result"]) if task["result"] else {})
+            rows.append(row)
+        finished_rows = [row for row in rows if row["status"] in FINAL_STATUSES]
+        finished = len(finished_rows) == len(rows)
+        first_result = min((row["finished_at"] for row in finished_rows if row["status"] != "cancelled" and row["finished_at"]), default=None)
+        last_result = max((row["finished_at"] for row in finished_rows if row["finished_at"]), default=None)
+        return {
+            "job_id": job_id, "kind": job["kind"], "files": rows, "total": len(rows), "finished_count": len(finished_rows),
+            "finished": finished, "cancelled": bool(job["cancelled"]),
+            "elapsed_seconds": (last_result if finished and last_result else time.time()) - job["created_at"],
+            "first_result_seconds": first_result - job["created_at"] if first_result else None,
+        }
+
+    # --- Worker statistics ---
+    # Extraction, LLM and cache work happens in the workers, so their pipeline metrics and
+    # counters are published here on every heartbeat and added up by the app's diagnostics.
+
+    def stats_reset_at(self) -> float:
+        """When the diagnostics were last reset (0 if never); workers restart their counters from then."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = 'stats_reset_at'").fetchone()
+        return row["value"] if row else 0.0
+
+    def publish_worker_stats(self, worker_id: str, metrics: dict, counters: dict, reset_seen: float) -> bool:
+        """
+        Stores a worker's metrics (MetricsRegistry.export_state) and counters. Refused, returning
+        False, if the diagnostics were reset after reset_seen, so stale totals never come back.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM settings WHERE key = 'stats_reset_at'").fetchone()
+                accepted = reset_seen >= (row["value"] if row else 0.0)
+                if accepted:
+                    self._conn.execute("""
+                        INSERT INTO worker_stats (worker_id, updated_at, metrics, counters) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(worker_id) DO UPDATE SET updated_at = excluded.updated_at,
+                            metrics = excluded.metrics, counters = excluded.counters
+                    """, (worker_id, time.time(), json.dumps(metrics), json.dumps(counters)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return accepted
+
+    def worker_metrics(self) -> list[dict]:
+        """The published metrics of every worker since the last reset, for MetricsRegistry.merge_state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT metrics FROM worker_stats").fetchall()
+        return [json.loads(row["metrics"]) for row in rows]
+
+    def worker_counters(self) -> dict:
+        """The published counters (LLM calls, retries, cache hits, ...) summed over every worker since the last reset."""
+        with self._lock:
+            rows = self._conn.execute("SELECT counters FROM worker_stats").fetchall()
+        totals = {}
+        for row in rows:
+            for key, value in json.loads(row["counters"]).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def reset_worker_stats(self) -> None:
+        """Drops all published worker statistics; running workers start counting again from now."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM worker_stats")
+                self._conn.execute("INSERT INTO settings (key, value) VALUES ('stats_reset_at', ?) "
+                                   "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (time.time(),))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- Housekeeping ---
+
+    def _prune_locked(self, now: float) -> None:
+        cutoff = now - JOB_RETENTION_DAYS * 24 * 3600
+        old_jobs = [row[0] for row in self._conn.execute(
+            f"SELECT id FROM jobs WHERE created_at < ? AND id NOT IN "
+            f"(SELECT job_id FROM tasks WHERE status NOT IN ({_placeholders(FINAL_STATUSES)}))", (cutoff, *FINAL_STATUSES))]
+        for job_id in old_jobs:
+            self._conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self._conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+        self._conn.execute("DELETE FROM worker_stats WHERE updated_at < ?", (cutoff,))
+
+
+_queue_lock = threading.Lock()
+_job_queue = None
+
+def get_job_queue() -> JobQueue:
+    """Returns this process's connection to the shared job queue."""
+    global _job_queue
+    with _queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(os.environ.get("JOB_QUEUE_FILE", DEFAULT_JOB_QUEUE_FILE),
+                                  os.environ.get("JOB_SPOOL_DIR", DEFAULT_SPOOL_DIR))
+        return _job_queue
+
+
+_autostart_lock = threading.Lock()
+_autostarted_worker = None
+
+def start_local_worker(api_key: str) -> bool:
+    """
+    Starts a job_worker.py process next to the app, so uploads are processed without a
+    separately managed worker. Does nothing when JOB_WORKER_AUTOSTART is "0" or a worker this
+    process started is still running; the worker exits on its own once the queue stays empty.
+    Returns True if a worker was started.
+    """
+    global _autostarted_worker
+    if os.environ.get("JOB_WORKER_AUTOSTART", "1") == "0":
+        return False
+    with _autostart_lock:
+        if _autostarted_worker is not None and _autostarted_worker.poll() is None:
+            return False
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_worker.py")
+        env = {**os.environ, "GOOGLE_API_KEY": api_key} if api_key else dict(os.environ)
+        _autostarted_worker = subprocess.Popen([sys.executable, worker_script, "--idle-exit", str(AUTOSTART_IDLE_EXIT_SECONDS)],
+                                               env=env, stdin=subprocess.DEVNULL, start_new_session=True)
+        return True
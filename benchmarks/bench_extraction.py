@@ -0,0 +1,277 @@
+"""
+Benchmark suite: text extraction throughput for every extractor on a synthetic corpus.
+
+Generates the corpus from benchmarks/synthetic_corpus.py (text, scanned and mixed PDFs, a
+large DOCX, tall and wide XLSX) and runs each applicable extractor in a fresh process so
+peak RSS is measured independently. For each (case, extractor) it reports pages/s (PDFs),
+units/s (pages, paragraphs, blocks or rows), MB/s, peak RSS, whole-document latency percentiles
+over --repeats runs (after --warmup untimed runs) and, for the streaming extractors, time to the first chunk and
+per-unit latency percentiles.
+
+The streaming generators (iter_pdf_pages, iter_pdf_pages_hybrid, iter_docx_paragraphs,
+iter_docx_blocks, iter_xlsx_rows) are timed per unit; extract_text_from_pdf/docx/xlsx, perform_ocr and the
+copy of extract_text_from_pdf in "cr checker.py" are timed per document. OCR cases are
+skipped when tesseract or poppler is not installed.
+
+With --baseline the results are compared with an earlier --json/--save-baseline file;
+a case whose MB/s drops or whose peak RSS grows by more than --tolerance is reported as
+a regression and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_extraction.py --json results.json
+    python benchmarks/bench_extraction.py --save-baseline benchmarks/extraction_baseline.json
+    python benchmarks/bench_extraction.py --baseline benchmarks/extraction_baseline.json --tolerance 0.2
+    python benchmarks/bench_extraction.py --cases text_pdf,tall_xlsx --pdf-pages 200 --repeats 5
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+import importlib.util
+
+import PyPDF2
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import text_extraction
+from synthetic_corpus import generate_corpus
+
+OCR_AVAILABLE = bool(shutil.which("tesseract") and shutil.which("pdftoppm"))
+
+
+_cr_checker_extract = None
+
+def _load_cr_checker_extractor():
+    """Imports "cr checker.py" once; its Streamlit calls are no-ops outside `streamlit run`."""
+    global _cr_checker_extract
+    if _cr_checker_extract is None:
+        logging.getLogger("streamlit").setLevel(logging.ERROR)
+        spec = importlib.util.spec_from_file_location("cr_checker", os.path.join(REPO_DIR, "cr checker.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _cr_checker_extract = module.extract_text_from_pdf
+    return _cr_checker_extract
+
+def cr_checker_extract_text_from_pdf(file_bytes: bytes) -> str:
+    return _load_cr_checker_extractor()(io.BytesIO(file_bytes)) or ""
+
+
+# name: (unit, streams chunks, needs OCR, function of the file bytes)
+EXTRACTORS = {
+    "iter_pdf_pages": ("pages", True, False, text_extraction.iter_pdf_pages),
+    "iter_pdf_pages_hybrid": ("pages", True, False, text_extraction.iter_pdf_pages_hybrid),
+    "extract_text_from_pdf": ("pages", False, False, text_extraction.extract_text_from_pdf),
+    "cr_checker_extract_text_from_pdf": ("pages", False, False, cr_checker_extract_text_from_pdf),
+    "perform_ocr": ("pages", False, True, text_extraction.perform_ocr),
+    "iter_docx_paragraphs": ("paragraphs", True, False, text_extraction.iter_docx_paragraphs),
+    "iter_docx_blocks": ("blocks", True, False, text_extraction.iter_docx_blocks),
+    "extract_text_from_docx": ("blocks", False, False, text_extraction.extract_text_from_docx),
+    "iter_xlsx_rows": ("rows", True, False, lambda file_bytes: text_extraction.iter_xlsx_rows(file_bytes, max_rows_per_sheet=None)),
+    "extract_text_from_xlsx": ("rows", False, False, text_extraction.extract_text_from_xlsx),
+}
+
+CASES = {
+    "text_pdf": ["iter_pdf_pages", "iter_pdf_pages_hybrid", "extract_text_from_pdf", "cr_checker_extract_text_from_pdf"],
+    "scanned_pdf": ["iter_pdf_pages_hybrid", "perform_ocr"],
+    "mixed_pdf": ["iter_pdf_pages", "iter_pdf_pages_hybrid", "extract_text_from_pdf"],
+    "large_docx": ["iter_docx_paragraphs", "iter_docx_blocks", "extract_text_from_docx"],
+    "tall_xlsx": ["iter_xlsx_rows", "extract_text_from_xlsx"],
+    "wide_xlsx": ["iter_xlsx_rows", "extract_text_from_xlsx"],
+}
+# Scanned pages only have text through OCR, so every extractor but the plain text layer is an OCR benchmark there
+OCR_CASES = {"scanned_pdf", "mixed_pdf"}
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _peak_rss_mb() -> float:
+    # On Linux ru_maxrss survives exec, so a spawned worker would inherit the parent's peak
+    # (e.g. from generating the corpus); VmHWM belongs to the new process image only.
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(extractor_name: str, path: str, repeats: int, warmup: int, queue) -> None:
+    _, streams, _, extract = EXTRACTORS[extractor_name]
+    logging.basicConfig(level=logging.ERROR)
+    if extract is cr_checker_extract_text_from_pdf:
+        _load_cr_checker_extractor()  # Importing the app (and Streamlit) is not part of extraction
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    rss_before = _peak_rss_mb()
+    for _ in range(warmup):
+        result = extract(file_bytes)
+        for _ in ([] if isinstance(result, str) else result):
+            pass
+    totals, first_chunk, per_unit = [], [], []
+    units = chars = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if streams:
+            units = chars = 0
+            previous = start
+            for chunk in extract(file_bytes):
+                now = time.perf_counter()
+                if units == 0:
+                    first_chunk.append((now - start) * 1000)
+                else:
+                    per_unit.append((now - previous) * 1000)
+                previous = now
+                units += 1
+                chars += len(chunk)
+        else:
+            chars = len(extract(file_bytes))
+        totals.append((time.perf_counter() - start) * 1000)
+    queue.put({"units": units if streams else None, "chars": chars, "total_ms": totals, "first_chunk_ms": first_chunk,
+               "per_unit_ms": per_unit, "peak_rss_mb": _peak_rss_mb(), "rss_before_mb": rss_before})
+
+
+def _document_units(case: str, path: str) -> int | None:
+    if case.endswith("_pdf"):
+        with open(path, "rb") as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    return None
+
+
+def run_benchmark(paths: dict[str, str], cases: list[str], repeats: int, warmup: int = 1) -> list[dict]:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        path = paths[case]
+        file_mb = os.path.getsize(path) / (1024 * 1024)
+        pages = _document_units(case, path)
+        for extractor_name in CASES[case]:
+            unit, streams, needs_ocr, _ = EXTRACTORS[extractor_name]
+            result = {"case": case, "extractor": extractor_name, "file_mb": round(file_mb, 3), "pages": pages, "unit": unit}
+            if (needs_ocr or case in OCR_CASES and extractor_name != "iter_pdf_pages") and not OCR_AVAILABLE:
+                results.append({**result, "skipped": "tesseract/poppler not installed"})
+                continue
+            queue = context.Queue()
+            process = context.Process(target=_run_case, args=(extractor_name, path, repeats, warmup, queue))
+            process.start()
+            measured = queue.get()
+            process.join()
+            seconds = percentile(measured["total_ms"], 0.5) / 1000
+            units = measured["units"] or pages
+            result.update({
+                "repeats": repeats, "chars": measured["chars"], "units": units,
+                "units_per_sec": round(units / seconds, 1) if units and seconds else None,
+                "pages_per_sec": round(pages / seconds, 1) if pages and seconds else None,
+                "mb_per_sec": round(file_mb / seconds, 3) if seconds else None,
+                "peak_rss_mb": round(measured["peak_rss_mb"], 1), "rss_before_mb": round(measured["rss_before_mb"], 1),
+                "total_ms_p50": round(percentile(measured["total_ms"], 0.5), 2),
+                "total_ms_p95": round(percentile(measured["total_ms"], 0.95), 2),
+            })
+            if streams:
+                result.update({f"{stage}_ms_p{int(fraction * 100)}": round(value, 3) if value is not None else None
+                               for stage, values in (("first_chunk", measured["first_chunk_ms"]), ("per_unit", measured["per_unit_ms"]))
+                               for fraction in (0.5, 0.95, 0.99)
+                               for value in [percentile(values, fraction)]})
+            results.append(result)
+    return results
+
+
+def compare_with_baseline(results: list[dict], baseline: dict, tolerance: float) -> list[dict]:
+    """Returns one row per case measured in both runs, flagging throughput drops and RSS growth beyond tolerance."""
+    previous = {(entry["case"], entry["extractor"]): entry for entry in baseline["results"] if "skipped" not in entry}
+    rows = []
+    for result in results:
+        before = previous.get((result["case"], result["extractor"]))
+        if before is None or "skipped" in result:
+            continue
+        throughput_change = result["mb_per_sec"] / before["mb_per_sec"] - 1 if before.get("mb_per_sec") else 0.0
+        rss_change = result["peak_rss_mb"] / before["peak_rss_mb"] - 1 if before.get("peak_rss_mb") else 0.0
+        rows.append({"case": result["case"], "extractor": result["extractor"],
+                     "throughput_change": throughput_change, "rss_change": rss_change,
+                     "regression": throughput_change < -tolerance or rss_change > tolerance})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma-separated cases to run")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case before the measured repeats")
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--scanned-pages", type=int, default=5)
+    parser.add_argument("--docx-paragraphs", type=int, default=20000)
+    parser.add_argument("--tall-rows", type=int, default=100000)
+    parser.add_argument("--wide-cols", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="Keep the generated corpus here instead of a temporary directory")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write results to this file for later --baseline comparisons")
+    parser.add_argument("--baseline", help="Compare with this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative throughput drop / RSS growth")
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)} (available: {', '.join(CASES)})")
+    corpus = {"pdf_pages": args.pdf_pages, "scanned_pages": args.scanned_pages, "docx_paragraphs": args.docx_paragraphs,
+              "tall_rows": args.tall_rows, "wide_cols": args.wide_cols, "seed": args.seed}
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        paths = generate_corpus(args.corpus_dir or temporary_directory, **corpus)
+        results = run_benchmark(paths, cases, args.repeats, args.warmup)
+    report = {"environment": {"python": platform.python_version(), "platform": platform.platform(),
+                              "cpu_count": os.cpu_count(), "ocr_available": OCR_AVAILABLE},
+              "corpus": corpus, "results": results}
+
+    print(f"{'case':<12} {'extractor':<33} {'MB':>6} {'pages/s':>9} {'units/s':>11} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'unit p95':>9} {'RSS MB':>7}")
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['case']:<12} {result['extractor']:<33} skipped: {result['skipped']}")
+            continue
+        unit_p95 = result.get("per_unit_ms_p95")
+        print(f"{result['case']:<12} {result['extractor']:<33} {result['file_mb']:>6.2f} {result['pages_per_sec'] or '-':>9} "
+              f"{result['units_per_sec'] or '-':>11} {result['mb_per_sec']:>8.2f} {result['total_ms_p50']:>9.1f} "
+              f"{result['total_ms_p95']:>9.1f} {unit_p95 if unit_p95 is not None else '-':>9} {result['peak_rss_mb']:>7.1f}")
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != corpus:
+            print(f"Warning: baseline corpus {baseline.get('corpus')} differs from this run's {corpus}", file=sys.stderr)
+        rows = compare_with_baseline(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for row in rows:
+            print(f"{row['case']:<12} {row['extractor']:<33} MB/s {row['throughput_change']:>+7.1%}  RSS {row['rss_change']:>+7.1%}"
+                  f"{'  REGRESSION' if row['regression'] else ''}")
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Benchmark: per-call Gemini client overhead, model rebuilt per call vs. the shared registry.
+
+"per-call" is what get_gemini_response used to do for every document: genai.configure(),
+a new GenerativeModel and (on first use) a new service client with its own channel.
+"shared" goes through gemini_client.get_generative_model(). Without --live only the
+client-side setup is timed and no request is sent; with --live each iteration also sends
+a tiny generate_content request, so connection setup (DNS, TCP, TLS) shows up in the
+latency.
+
+Usage:
+    python benchmarks/bench_gemini_client.py --calls 200
+    GOOGLE_API_KEY=... python benchmarks/bench_gemini_client.py --live --calls 20 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_client import GeminiBackend, get_generative_model, reset_generative_models, set_llm_backend
+from document_classifier import GEMINI_MODEL_NAME, CLASSIFICATION_GENERATION_CONFIG, CLASSIFICATION_SAFETY_SETTINGS
+
+LIVE_PROMPT = 'Reply with the JSON object {"ok": true}.'
+
+
+def per_call_model(api_key: str) -> genai.GenerativeModel:
+    """The original implementation: reconfigure the SDK and build a new model for every call."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, generation_config=CLASSIFICATION_GENERATION_CONFIG,
+                                 safety_settings=CLASSIFICATION_SAFETY_SETTINGS)
+
+
+def shared_model(api_key: str) -> genai.GenerativeModel:
+    return get_generative_model(api_key, GEMINI_MODEL_NAME, CLASSIFICATION_GENERATION_CONFIG, CLASSIFICATION_SAFETY_SETTINGS)
+
+
+IMPLEMENTATIONS = {"per-call": per_call_model, "shared": shared_model}
+
+
+def run_case(name: str, api_key: str, calls: int, live: bool) -> dict:
+    reset_generative_models()
+    build_model = IMPLEMENTATIONS[name]
+    latencies, clients = [], []
+    for _ in range(calls):
+        start = time.perf_counter()
+        model = build_model(api_key)
+        # generate_content() resolves the service client the same way on its first request
+        clients.append(genai_client.get_default_generative_client())
+        if live:
+            model.generate_content(LIVE_PROMPT)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {"implementation": name, "calls": calls, "live": live, "service_clients": len({id(c) for c in clients}),
+            "mean_ms": statistics.fmean(latencies), "p50_ms": latencies[len(latencies) // 2],
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--live", action="store_true", help="Send a real request per iteration (needs GOOGLE_API_KEY)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if args.live and not api_key:
+        parser.error("--live needs GOOGLE_API_KEY")
+    set_llm_backend(GeminiBackend())  # Measure the real client even if LLM_BACKEND is set
+    results = [run_case(name, api_key or "benchmark-key", args.calls, args.live) for name in IMPLEMENTATIONS]
+
+    print(f"{args.calls} calls ({'live requests' if args.live else 'client setup only'})")
+    print(f"{'implementation':<16} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'clients':>8}")
+    for result in results:
+        print(f"{result['implementation']:<16} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} "
+              f"{result['p95_ms']:>9.3f} {result['service_clients']:>8}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Load test: the full classification pipeline against the offline LLM stand-in.
+
+Generates synthetic text documents and runs them through analyze_documents_pipelined()
+with the fake backend (llm_backends.FakeGeminiBackend), once with a thread per request
+and once with the asyncio path. The stand-in answers deterministically after a lognormal
+delay and can inject server errors and 429s, or enforce its own request quota, so
+scheduler pacing, retries and concurrency can be measured without an API key.
+
+The classification cache is redirected to a temporary file so every document reaches the
+backend; the local pre-classifier and batching are off unless asked for.
+
+Usage:
+    python benchmarks/bench_llm_pipeline.py --documents 300 --latency-ms 800,2000
+    python benchmarks/bench_llm_pipeline.py --documents 500 --throttle-rate 0.05 --server-rpm 600 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ("procedure inspection drawing specification assembly torque tolerance supplier quality "
+         "calibration deviation change request manual installation safety report test plan").split()
+
+
+def synthetic_document(index: int, words: int) -> bytes:
+    body = " ".join(WORDS[(index * 7 + i * i) % len(WORDS)] for i in range(words))
+    return f"DOC-{index:05d} Synthetic controlled document\n\n1. SCOPE\n{body}\n".encode("utf-8")
+
+
+def run_case(name: str, documents: list[tuple[str, bytes]], args) -> dict:
+    from document_classifier import analyze_documents_pipelined, get_api_call_count
+    from gemini_client import set_llm_backend
+    from llm_backends import FakeGeminiBackend, FakeLLMServer
+    import llm_scheduler
+
+    server = FakeLLMServer(median_latency_ms=args.median_ms, p95_latency_ms=args.p95_ms, error_rate=args.error_rate,
+                           throttle_rate=args.throttle_rate, max_concurrency=args.server_concurrency,
+                           requests_per_minute=args.server_rpm, seed=args.seed)
+    set_llm_backend(FakeGeminiBackend(server))
+    llm_scheduler._scheduler = llm_scheduler.LLMCallScheduler(requests_per_minute=args.requests_per_minute,
+                                                              tokens_per_minute=args.tokens_per_minute)
+    calls_before = get_api_call_count()
+    finished_at, errors = [], 0
+    started = time.perf_counter()
+    for _, record in analyze_documents_pipelined(documents, "offline", args.workers, args.llm_concurrency,
+                                                 batch_small_documents=args.batching,
+                                                 preclassify_threshold=80 if args.preclassifier else None,
+                                                 async_llm=name == "async"):
+        finished_at.append(time.perf_counter() - started)
+        errors += record["status"] == "Error"
+    elapsed = time.perf_counter() - started
+    scheduler_stats = llm_scheduler.get_llm_scheduler().snapshot()
+    server_stats = server.snapshot()
+    return {"mode": name, "documents": len(documents), "errors": errors, "seconds": round(elapsed, 2),
+            "docs_per_sec": round(len(documents) / elapsed, 2),
+            "p50_done_s": round(statistics.median(finished_at), 2) if finished_at else None,
+            "llm_calls": get_api_call_count() - calls_before, "server_requests": server_stats["requests"],
+            "server_throttled": server_stats["throttled"], "server_errors": server_stats["errors"],
+            "peak_in_flight": server_stats["peak_in_flight"], "retries": scheduler_stats["retries"],
+            "final_concurrency_limit": scheduler_stats["concurrency_limit"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--words", type=int, default=400, help="Words per synthetic document")
+    parser.add_argument("--modes", default="threads,async", help="Comma-separated: threads, async")
+    parser.add_argument("--latency-ms", default="800,2000", help="Fake response latency as median,p95")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--server-concurrency", type=int, default=0, help="Fake server's concurrent request limit (0: none)")
+    parser.add_argument("--server-rpm", type=int, default=0, help="Fake server's requests per minute quota (0: none)")
+    parser.add_argument("--requests-per-minute", type=int, default=100000, help="Scheduler pacing ceiling")
+    parser.add_argument("--tokens-per-minute", type=int, default=10 ** 9)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--batching", action="store_true")
+    parser.add_argument("--preclassifier", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+    median_ms, _, p95_ms = args.latency_ms.partition(",")
+    args.median_ms, args.p95_ms = float(median_ms), float(p95_ms or median_ms)
+
+    documents = [(f"doc_{i:05d}.txt", synthetic_document(i, args.words)) for i in range(args.documents)]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.modes.split(","):
+            # A fresh cache per mode, so the second run is not answered from the first one's results
+            os.environ["CLASSIFICATION_CACHE_FILE"] = os.path.join(directory, f"cache_{name}.db")
+            import document_classifier
+            document_classifier._classification_cache = None
+            results.append(run_case(name, documents, args))
+
+    print(f"{args.documents} documents, fake latency {args.latency_ms} ms, error rate {args.error_rate}, throttle rate {args.throttle_rate}")
+    print(f"{'mode':<8} {'seconds':>8} {'docs/s':>8} {'errors':>7} {'calls':>6} {'429s':>6} {'retries':>8} {'peak':>5} {'limit':>6}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['seconds']:>8} {result['docs_per_sec']:>8} {result['errors']:>7} {result['llm_calls']:>6} "
+              f"{result['server_throttled']:>6} {result['retries']:>8} {result['peak_in_flight']:>5} {result['final_concurrency_limit']:>6}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: .xlsx text extraction, legacy full-mode reader vs. the streaming read-only reader.
+
+Generates a synthetic BOM-style workbook and runs each implementation in a fresh process
+so peak RSS is measured independently. Reports rows/sec and peak RSS.
+
+Usage:
+    python benchmarks/bench_xlsx_extraction.py --rows 200000 --cols 12
+    python benchmarks/bench_xlsx_extraction.py --rows 500000 --json results.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_extract_text_from_xlsx(file_bytes: bytes) -> str:
+    """The original implementation: full-mode workbook and string concatenation."""
+    workbook = openpyxl.load_workbook(io.BytesIO(file_bytes))
+    text = ""
+    for sheet in workbook.sheetnames:
+        worksheet = workbook[sheet]
+        for row in worksheet.iter_rows():
+            for cell in row:
+                if cell.value:
+                    text += str(cell.value) + " "
+            text += "\n"
+    return text
+
+
+def streaming_extract_text_from_xlsx(file_bytes: bytes) -> str:
+    from text_extraction import extract_text_from_xlsx
+    return extract_text_from_xlsx(file_bytes, max_rows_per_sheet=None)
+
+
+def streaming_budgeted_extract_text_from_xlsx(file_bytes: bytes) -> str:
+    from text_extraction import extract_text_from_xlsx
+    return extract_text_from_xlsx(file_bytes, char_budget=8000)
+
+
+IMPLEMENTATIONS = {
+    "legacy": legacy_extract_text_from_xlsx,
+    "streaming": streaming_extract_text_from_xlsx,
+    "streaming+budget": streaming_budgeted_extract_text_from_xlsx,
+}
+
+
+def generate_workbook(rows: int, cols: int) -> bytes:
+    """Builds a BOM-like workbook with a header row and mixed text/number cells."""
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("BOM")
+    worksheet.append([f"Column {c}" for c in range(cols)])
+    for r in range(rows):
+        worksheet.append([f"PN-{r:07d}" if c == 0 else (r * c) % 997 if c % 2 else f"Item {r} attr {c}" for c in range(cols)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _peak_rss_mb() -> float:
+    # On Linux ru_maxrss survives exec, so a spawned worker would inherit the parent's peak
+    # (here: generating the workbook); VmHWM belongs to the new process image only. Without
+    # /proc there is no per-process peak to report.
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def _run_case(name: str, file_bytes: bytes, queue) -> None:
+    implementation = IMPLEMENTATIONS[name]
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    text = implementation(file_bytes)
+    elapsed = time.perf_counter() - start
+    queue.put({"implementation": name, "seconds": elapsed, "chars": len(text),
+               "lines": text.count("\n"), "peak_rss_mb": _peak_rss_mb(), "rss_before_mb": rss_before})
+
+
+def run_benchmark(rows: int, cols: int) -> list[dict]:
+    file_bytes = generate_workbook(rows, cols)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in IMPLEMENTATIONS:
+        queue = context.Queue()
+        process = context.Process(target=_run_case, args=(name, file_bytes, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result.update({"rows": rows, "cols": cols, "file_mb": len(file_bytes) / (1024 * 1024),
+                       "rows_per_sec": rows / result["seconds"] if result["seconds"] else float("inf")})
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.rows, args.cols)
+    print(f"Workbook: {args.rows} rows x {args.cols} cols ({results[0]['file_mb']:.1f} MB)")
+    print(f"{'implementation':<18} {'seconds':>9} {'rows/sec':>12} {'peak RSS MB':>12} {'chars':>12}")
+    for result in results:
+        print(f"{result['implementation']:<18} {result['seconds']:>9.2f} {result['rows_per_sec']:>12,.0f} "
+              f"{result['peak_rss_mb']:>12.1f} {result['chars']:>12,}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
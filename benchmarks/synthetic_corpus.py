@@ -0,0 +1,178 @@
+"""
+Synthetic document corpora for the extraction benchmarks.
+
+Every generator is deterministic for a given seed and returns the file's bytes:
+text PDFs, scanned (image-only) PDFs, mixed PDFs, large DOCX files and wide or tall
+XLSX workbooks. PDFs are written directly (no PDF library needed): text pages use a
+standard Type 1 font, scanned pages are one full-page JPEG of rendered text.
+
+Usage:
+    python benchmarks/synthetic_corpus.py corpus_dir --pdf-pages 50 --docx-paragraphs 20000
+"""
+import io
+import os
+import sys
+import random
+import argparse
+
+import docx
+import openpyxl
+from PIL import Image, ImageDraw
+
+WORDS = ("the procedure inspection drawing specification assembly torque tolerance supplier quality "
+         "calibration deviation change request manual installation safety report test plan shall be "
+         "verified against revision approved component interface requirement section limit value").split()
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+LINES_PER_PAGE = 48
+SCAN_DPI = 100
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def page_lines(rng: random.Random, page_number: int) -> list[str]:
+    lines = [f"DOC-4711 Synthetic Work Instruction - Page {page_number}", f"{page_number}. SECTION {page_number}"]
+    lines += [_sentence(rng) for _ in range(LINES_PER_PAGE - 2)]
+    return lines
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _scanned_page_jpeg(lines: list[str]) -> bytes:
+    image = Image.new("L", (PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((60, 60 + index * 20), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=75)
+    return buffer.getvalue()
+
+
+def build_pdf(page_kinds: list[str], seed: int = 0) -> bytes:
+    """Writes a PDF whose pages are "text" (a text layer) or "scanned" (only an image of text)."""
+    rng = random.Random(seed)
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    next_id = 4
+    for page_number, kind in enumerate(page_kinds, start=1):
+        lines = page_lines(rng, page_number)
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        if kind == "scanned":
+            image_id = next_id
+            next_id += 1
+            jpeg = _scanned_page_jpeg(lines)
+            width, height = PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72
+            objects[image_id] = (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+                                 f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>\nstream\n").encode() + jpeg + b"\nendstream"
+            content = f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im1 Do Q".encode()
+            resources = f"<< /XObject << /Im1 {image_id} 0 R >> >>"
+        else:
+            content = ("BT /F1 10 Tf 14 TL 50 760 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET").encode("latin-1")
+            resources = "<< /Font << /F1 3 0 R >> >>"
+        objects[content_id] = f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                            f"/Resources {resources} /Contents {content_id} 0 R >>").encode()
+        page_ids.append(page_id)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(f"{object_id} 0 obj\n".encode() + objects[object_id] + b"\nendobj\n")
+    xref_offset = output.tell()
+    output.write(f"xref\n0 {next_id}\n0000000000 65535 f \n".encode())
+    for object_id in range(1, next_id):
+        output.write(f"{offsets[object_id]:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    return output.getvalue()
+
+
+def text_pdf(pages: int, seed: int = 0) -> bytes:
+    return build_pdf(["text"] * pages, seed)
+
+
+def scanned_pdf(pages: int, seed: int = 0) -> bytes:
+    return build_pdf(["scanned"] * pages, seed)
+
+
+def mixed_pdf(pages: int, scanned_every: int = 4, seed: int = 0) -> bytes:
+    """Mostly text pages with every scanned_every-th page scanned (signed cover sheets, stamped drawings)."""
+    return build_pdf(["scanned" if page % scanned_every == 0 else "text" for page in range(pages)], seed)
+
+
+def large_docx(paragraphs: int, table_rows: int = 200, seed: int = 0) -> bytes:
+    """A long Word document: headings every 50 paragraphs, body text and one parts table."""
+    rng = random.Random(seed)
+    document = docx.Document()
+    document.add_heading("Synthetic Work Instruction", level=0)
+    for index in range(paragraphs):
+        if index % 50 == 0:
+            document.add_heading(f"{index // 50 + 1}. Section {index // 50 + 1}", level=1)
+        document.add_paragraph(" ".join(_sentence(rng) for _ in range(3)))
+    table = document.add_table(rows=table_rows, cols=4)
+    for row_index, row in enumerate(table.rows):
+        for col_index, cell in enumerate(row.cells):
+            cell.text = f"PN-{row_index:05d}" if col_index == 0 else rng.choice(WORDS)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def xlsx_workbook(rows: int, cols: int, seed: int = 0) -> bytes:
+    """A BOM-like sheet: part numbers, descriptions and quantities. Tall: many rows; wide: many columns."""
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("BOM")
+    worksheet.append([f"Column {c}" for c in range(cols)])
+    for r in range(rows):
+        worksheet.append([f"PN-{r:07d}" if c == 0 else rng.randint(1, 999) if c % 2 else rng.choice(WORDS) for c in range(cols)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def generate_corpus(directory: str, pdf_pages: int = 50, scanned_pages: int = 5, docx_paragraphs: int = 20000,
+                    tall_rows: int = 100000, wide_cols: int = 300, seed: int = 0) -> dict[str, str]:
+    """Writes the standard corpus to directory and returns {case name: path}."""
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        "text_pdf.pdf": lambda: text_pdf(pdf_pages, seed),
+        "scanned_pdf.pdf": lambda: scanned_pdf(scanned_pages, seed),
+        "mixed_pdf.pdf": lambda: mixed_pdf(pdf_pages, seed=seed),
+        "large_docx.docx": lambda: large_docx(docx_paragraphs, seed=seed),
+        "tall_xlsx.xlsx": lambda: xlsx_workbook(tall_rows, 8, seed),
+        "wide_xlsx.xlsx": lambda: xlsx_workbook(max(100, tall_rows // 50), wide_cols, seed),
+    }
+    paths = {}
+    for filename, generate in files.items():
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as f:
+            f.write(generate())
+        paths[os.path.splitext(filename)[0]] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--scanned-pages", type=int, default=5)
+    parser.add_argument("--docx-paragraphs", type=int, default=20000)
+    parser.add_argument("--tall-rows", type=int, default=100000)
+    parser.add_argument("--wide-cols", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.directory, args.pdf_pages, args.scanned_pages, args.docx_paragraphs,
+                            args.tall_rows, args.wide_cols, args.seed)
+    for name, path in paths.items():
+        print(f"{name:<14} {os.path.getsize(path) / (1024 * 1024):>8.2f} MB  {path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
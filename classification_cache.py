@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- Cache Configuration ---
+DEFAULT_CACHE_FILE = "classification_cache.db"
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_AGE_DAYS = 90
+EVICTION_INTERVAL = 100  # Run eviction every N writes instead of on every write
+
+
+def make_cache_key(text: str, prompt_version: str, model_name: str, document_types: list[str]) -> str:
+    """
+    Builds a content-addressed key for a classification request.
+    Identical text classified with the same prompt, model and category list always maps
+    to the same key, regardless of the uploaded file name.
+    """
+    hasher = hashlib.sha256()
+    for part in (prompt_version, model_name, json.dumps(document_types)):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\x00")
+    hasher.update(text.encode("utf-8", errors="replace"))
+    return hasher.hexdigest()
+
+
+class ClassificationCache:
+    """
+    Disk-backed (SQLite) store of Gemini classification results.
+    Safe to share between threads and Streamlit sessions. Entries older than
+    max_age_days are dropped, and once max_entries is exceeded the least recently
+    used entries are evicted first.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS classifications (
+                    cache_key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_classifications_last_access ON classifications(last_access)")
+            self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> dict | None:
+        """Returns the cached result for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM classifications WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE classifications SET last_access = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict) -> None:
+        """Stores a classification result under key."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO classifications (cache_key, result, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            self._conn.commit()
+            self._writes_since_eviction += 1
+            due_for_eviction = self._writes_since_eviction >= EVICTION_INTERVAL
+        if due_for_eviction:
+            self.evict()
+
+    def evict(self) -> int:
+        """Removes expired entries and trims the cache to max_entries. Returns the number removed."""
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM classifications WHERE created_at < ?", (cutoff,)).rowcount
+            overflow = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM classifications WHERE cache_key IN "
+                    "(SELECT cache_key FROM classifications ORDER BY last_access ASC LIMIT ?)", (overflow,)
+                ).rowcount
+            self._conn.commit()
+            self._writes_since_eviction = 0
+        return removed
+
+    def clear(self) -> None:
+        """Deletes every cached result."""
+        with self._lock:
+            self._conn.execute("DELETE FROM classifications")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
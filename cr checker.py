@@ -1,15 +1,20 @@
 import streamlit as st
 import PyPDF2
 import io
-import google.generativeai as genai
 import os
 from typing import Optional
 
+from gemini_client import get_generative_model
+from llm_scheduler import get_llm_scheduler, estimate_tokens
+from event_loop import submit
+
 # --- API Key Configuration ---
-# Configure Google Generative AI with your API key
+# Google Generative AI is configured with your API key on first use (see gemini_client).
 # It is highly recommended to set your API key as an environment variable (e.g., GOOGLE_API_KEY)
 # For deployment on Streamlit Cloud, set this as a 'secret' named GOOGLE_API_KEY
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+SUMMARY_MODEL_NAME = "gemini-1.5-flash"
+SUMMARY_RESPONSE_TOKENS = 200
 
 # --- Helper Functions ---
 def extract_text_from_pdf(uploaded_file: io.BytesIO) -> Optional[str]:
@@ -45,6 +50,18 @@ def extract_text_from_pdf(uploaded_file: io.BytesIO) -> Optional[str]:
         st.error(f"An unexpected error occurred while processing the PDF: {e}")
         return None
 
+async def generate_summary_async(prompt: str):
+    """Sends the summary prompt with generate_content_async, paced and retried by the shared scheduler."""
+    # Using 'gemini-1.5-flash' as it's generally more available and efficient.
+    # If 'gemini-pro' was desired and not found, it might be a region-specific issue
+    # or require enabling certain APIs in your Google Cloud project.
+    # The model is shared across reruns and sessions instead of being rebuilt per summary.
+    model = get_generative_model(GOOGLE_API_KEY, SUMMARY_MODEL_NAME)
+    return await get_llm_scheduler().call_async(
+        lambda timeout_seconds: model.generate_content_async(prompt, request_options={"timeout": timeout_seconds}),
+        estimated_tokens=estimate_tokens(prompt) + SUMMARY_RESPONSE_TOKENS,
+    )
+
 def summarize_change_request(text_content: str) -> str:
     """
     Summarizes the provided text content using a generative AI model.
@@ -71,11 +88,9 @@ def summarize_change_request(text_content: str) -> str:
     """
 
     try:
-        # Using 'gemini-1.5-flash' as it's generally more available and efficient.
-        # If 'gemini-pro' was desired and not found, it might be a region-specific issue
-        # or require enabling certain APIs in your Google Cloud project.
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
+        # The request runs on the shared background event loop; the scheduler keeps us under the
+        # API quota and retries throttled (429/503) requests. Errors surface here, in the script thread.
+        response = submit(generate_summary_async(prompt)).result()
 
         # Check if the response or its text content is valid
         if response and response.text:
@@ -129,8 +144,9 @@ uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"])
 if uploaded_file is not None:
     st.success("PDF file uploaded successfully! Now processing...")
 
-    # Use a BytesIO object to read the file content, allowing PyPDF2 to process it
-    file_content = io.BytesIO(uploaded_file.read())
+    # The upload is already a seekable file object; PyPDF2 reads it in place instead of from a second in-memory copy
+    uploaded_file.seek(0)
+    file_content = uploaded_file
 
     # Section to preview the extracted text (collapsible for cleaner UI)
     with st.expander("📖 Preview Extracted Text (First 1000 Chars)"):
@@ -177,6 +193,7 @@ with st.expander("⚙️ Important Setup Notes for Developers"):
     2.  **Google API Key:** Obtain a `GOOGLE_API_KEY` from [Google AI Studio](https://aistudio.google.com/app/apikey). This key is essential for the AI summarization functionality.
         * **Local Run:** Set it as an environment variable before running the app (e.g., `export GOOGLE_API_KEY="YOUR_API_KEY"` on Linux/macOS, or `set GOOGLE_API_KEY="YOUR_API_KEY"` on Windows).
         * **Streamlit Cloud Deployment:** Add it as a "secret" named `GOOGLE_API_KEY` in your app's settings on Streamlit Cloud.
+    3.  **Offline testing:** `LLM_BACKEND=fake` answers with deterministic summaries and no API key (latency and errors are set with the `FAKE_LLM_*` variables). `LLM_BACKEND=record` saves real responses to `LLM_RECORDINGS_DIR` and `LLM_BACKEND=replay` serves them back without network access.
     """)
 
 st.markdown("""
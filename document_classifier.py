@@ -0,0 +1,654 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Optional
+import google.generativeai as genai
+
+from text_extraction import extract_text
+from upload_spool import DocumentSource, source_size
+from classification_cache import ClassificationCache, make_cache_key, DEFAULT_CACHE_FILE
+from local_classifier import LocalPreClassifier, DEFAULT_EXAMPLES_FILE, DEFAULT_CONFIDENCE_THRESHOLD
+from results_store import ResultsStore, DEFAULT_RESULTS_FILE
+from gemini_client import get_generative_model, get_llm_backend
+from llm_scheduler import get_llm_scheduler, estimate_tokens
+from prompt_context import build_prompt_context, DEFAULT_CONTEXT_TOKEN_BUDGET
+from event_loop import submit as submit_coroutine
+from near_duplicates import minhash_signature, DEFAULT_SIMILARITY_THRESHOLD
+from pipeline_metrics import get_metrics_registry, document_context
+
+# Classification core shared by the Streamlit app (document_tagger.py) and the batch CLI.
+# Problems are reported through logging; the app forwards them to the page.
+logger = logging.getLogger(__name__)
+
+# --- Predefined PLM/PDM Document Types ---
+PLM_DOCUMENT_TYPES = [
+    "Technical Specification",
+    "Requirements Document (System/Software)",
+    "Bill of Materials (BOM)",
+    "Engineering Change Request (ECR)",
+    "Engineering Change Order (ECO)",
+    "CAD Drawing (2D/3D)",
+    "Failure Mode and Effects Analysis (FMEA)",
+    "Test Plan / Test Case",
+    "Test Report / Validation Report",
+    "User Manual / Operator Guide",
+    "Manufacturing Process Plan",
+    "Quality Inspection Report",
+    "Supplier Qualification Document",
+    "Project Plan",
+    "Risk Analysis Report",
+    "Other"  # Fallback category
+]
+
+# --- Model & Prompt Versioning ---
+# The prompt wording, category list and model are part of classification_fingerprint(), so editing
+# them invalidates cached and stored results on their own. Bump PROMPT_VERSION for changes they do
+# not show (e.g. how responses are parsed).
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+PROMPT_VERSION = "2"
+# Each document is read up to EXTRACTION_CHAR_BUDGET characters; the prompt gets a cleaned and
+# sampled view of that text (see prompt_context) within CONTEXT_TOKEN_BUDGET tokens.
+EXTRACTION_CHAR_BUDGET = 20000
+CONTEXT_TOKEN_BUDGET = DEFAULT_CONTEXT_TOKEN_BUDGET
+EXACT_TOKEN_COUNT_FROM = 0.8  # Contexts estimated above this share of the budget are measured with the model's tokenizer
+BASELINE_PROMPT_CHARS = 8000  # The old fixed prompt window (first 8000 characters), reported for comparison
+
+# --- Pipeline Defaults ---
+# Extraction is CPU/IO bound, LLM calls are network bound, so each stage gets its own pool.
+DEFAULT_EXTRACTION_WORKERS = min(8, os.cpu_count() or 4)
+DEFAULT_LLM_CONCURRENCY = 4
+MAX_LLM_CONCURRENCY = 16
+# Documents at or below BATCH_DOCUMENT_MAX_CHARS can share one Gemini request with other short documents.
+BATCH_DOCUMENT_MAX_CHARS = 2000
+BATCH_TOKEN_BUDGET = 6000
+BATCH_MAX_DOCUMENTS = 10
+RESPONSE_TOKENS_PER_DOCUMENT = 250  # Output tokens reserved per classified document when rate limiting
+
+# --- Shared Resources ---
+# Created once per process and shared by every session, thread and CLI worker.
+_resource_lock = threading.Lock()
+_classification_cache = None
+_local_classifier = None
+_results_store = None
+
+def get_classification_cache() -> ClassificationCache:
+    """Returns the process-wide classification cache."""
+    global _classification_cache
+    with _resource_lock:
+        if _classification_cache is None:
+            _classification_cache = ClassificationCache(os.environ.get("CLASSIFICATION_CACHE_FILE", DEFAULT_CACHE_FILE))
+        return _classification_cache
+
+def get_local_classifier() -> LocalPreClassifier:
+    """Returns the shared local pre-classifier, trained from manually verified documents."""
+    global _local_classifier
+    with _resource_lock:
+        if _local_classifier is None:
+            _local_classifier = LocalPreClassifier(os.environ.get("PRECLASSIFIER_EXAMPLES_FILE", DEFAULT_EXAMPLES_FILE), PLM_DOCUMENT_TYPES)
+        return _local_classifier
+
+def get_results_store() -> ResultsStore:
+    """Returns the persistent store of classified documents, shared by all sessions."""
+    global _results_store
+    with _resource_lock:
+        if _results_store is None:
+            _results_store = ResultsStore(os.environ.get("RESULTS_DB_FILE", DEFAULT_RESULTS_FILE))
+        return _results_store
+
+_api_call_lock = threading.Lock()
+_api_calls = 0
+
+def _count_api_call():
+    global _api_calls
+    with _api_call_lock:
+        _api_calls += 1
+
+def get_api_call_count() -> int:
+    """Number of Gemini generate_content requests made by this process."""
+    return _api_calls
+
+# --- Gemini Classification ---
+
+CLASSIFICATION_GENERATION_CONFIG = {"temperature": 0.2, "response_mime_type": "application/json"}
+CLASSIFICATION_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+def build_classification_model(api_key: str) -> genai.GenerativeModel:
+    """Returns the shared JSON-mode model used for classification (created once per process, see gemini_client)."""
+    # The JSON schema is defined implicitly in the prompt text itself.
+    # We no longer need a separate schema object.
+    return get_generative_model(api_key, GEMINI_MODEL_NAME, CLASSIFICATION_GENERATION_CONFIG, CLASSIFICATION_SAFETY_SETTINGS)
+
+def generate_scheduled(model, prompt: str, expected_output_tokens: int = RESPONSE_TOKENS_PER_DOCUMENT):
+    """
+    Sends prompt through the shared LLM scheduler, which enforces the requests/tokens per minute
+    budget and retries throttled (429/503) calls with backoff until the call deadline.
+    """
+    def send(timeout_seconds: float):
+        _count_api_call()
+        return model.generate_content(prompt, request_options={"timeout": timeout_seconds})
+    estimated_tokens = estimate_tokens(prompt) + expected_output_tokens
+    with get_metrics_registry().timed("llm_call", chars=len(prompt), tokens=estimated_tokens) as span:
+        response = get_llm_scheduler().call(send, estimated_tokens=estimated_tokens)
+        span["tokens"] = _response_token_count(response, estimated_tokens)
+    return response
+
+def _response_token_count(response, estimated_tokens: int) -> int:
+    """Tokens billed for a response according to its usage metadata, else the estimate."""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or estimated_tokens
+
+def _classification_model_name() -> str:
+    # Results from the offline stand-in are labelled with its name so they never pass for real ones.
+    backend = get_llm_backend()
+    return GEMINI_MODEL_NAME if backend.real_responses else f"{GEMINI_MODEL_NAME}@{backend.name}"
+
+def classification_fingerprint() -> str:
+    """
+    Short hash of everything that shapes a classification: prompt version and wording (single
+    and batch), context budget, model and the category list. Every stored record carries the
+    fingerprint it was classified under, so editing the prompt or PLM_DOCUMENT_TYPES marks the
+    existing results stale; the app re-classifies them as a queued job (JobQueue.enqueue_stored).
+    """
+    hasher = hashlib.sha256()
+    for part in (PROMPT_VERSION, str(CONTEXT_TOKEN_BUDGET), _classification_model_name(), json.dumps(PLM_DOCUMENT_TYPES),
+                 build_classification_prompt(""), build_batch_classification_prompt([""])):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()[:16]
+
+def _classification_cache_key(text: str) -> str:
+    # The context is derived from the text, so the text and the fingerprint identify the request.
+    return make_cache_key(text[:EXTRACTION_CHAR_BUDGET], classification_fingerprint(), _classification_model_name(), PLM_DOCUMENT_TYPES)
+
+def _model_token_counter(model) -> Callable[[str], int]:
+    """Token counter for the context builder: the cheap estimate, or the model's tokenizer when close to the budget."""
+    def count_tokens(text: str) -> int:
+        estimate = estimate_tokens(text)
+        if estimate < CONTEXT_TOKEN_BUDGET * EXACT_TOKEN_COUNT_FROM:
+            return estimate
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            logger.info(f"Token counting failed ({e}); using an estimate.")
+            return estimate
+    return count_tokens
+
+def build_classification_prompt(context: str) -> str:
+    return f"""
+        You are an expert in Product Lifecycle Management (PLM) and document control.
+        Your task is to analyze the provided technical document text and classify it.
+        
+        Based on the text content, perform the following actions and provide your response ONLY as a valid JSON object with the following keys: "category", "confidence_score", "tags", "reasoning".
+        1.  **category**: From the following list, choose the single most likely document type: {json.dumps(PLM_DOCUMENT_TYPES)}. If none fit, use 'Other'.
+        2.  **confidence_score**: Provide an integer score from 0 to 100 indicating how confident you are.
+        3.  **tags**: Generate a list of 5 to 7 relevant keywords.
+        4.  **reasoning**: Briefly explain your choice in one or two sentences.
+        
+        Here is the document to analyze. Long documents are condensed to their title, headings, table/figure captions, opening section and excerpts; running headers, footers and revision tables are removed.
+        ---
+        {context}
+        ---
+        """
+
+def _parse_classification_response(response, context_tokens: int) -> dict:
+    # The Gemini model with response_mime_type="application/json" should return a clean JSON string.
+    # The .text attribute contains that string.
+    with get_metrics_registry().timed("json_parse") as span:
+        span["chars"] = len(response.text)
+        result_json = json.loads(response.text)
+    if isinstance(result_json, dict):
+        result_json["context_tokens"] = context_tokens
+    return result_json
+
+def _log_classification_error(e: Exception) -> None:
+    if isinstance(e, genai.types.generation_types.StopCandidateException):
+        logger.error(f"AI analysis was stopped. This can happen if the content is flagged by safety filters. Details: {e}")
+    else:
+        logger.error(f"An error occurred with the AI analysis: {e}. This might be due to an invalid API key, network issues, or API limits.")
+
+def get_gemini_response(api_key: str, text_content: str) -> dict | None:
+    """Analyzes document text using the Gemini API and returns a structured response."""
+    if not text_content:
+        logger.warning("Document appears to be empty or unreadable. Could not extract text for analysis.")
+        return None
+
+    cache = get_classification_cache()
+    cache_key = _classification_cache_key(text_content)
+    cached_result = cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    try:
+        model = build_classification_model(api_key)
+        with get_metrics_registry().timed("prompt_build") as span:
+            context, context_tokens = build_prompt_context(text_content[:EXTRACTION_CHAR_BUDGET], CONTEXT_TOKEN_BUDGET, _model_token_counter(model))
+            prompt = build_classification_prompt(context)
+            span.update(chars=len(prompt), tokens=context_tokens)
+
+        # Only the prompt is sent: the expected JSON shape is spelled out in the prompt text.
+        response = generate_scheduled(model, prompt)
+        result_json = _parse_classification_response(response, context_tokens)
+        cache.put(cache_key, result_json)
+        return result_json
+
+    except Exception as e:
+        _log_classification_error(e)
+        return None
+
+# --- Async Gemini Classification ---
+# Same requests and results as above, awaited on the shared background event loop
+# (event_loop.submit) instead of holding a thread per request.
+
+async def generate_scheduled_async(model, prompt: str, expected_output_tokens: int = RESPONSE_TOKENS_PER_DOCUMENT):
+    """generate_scheduled() on generate_content_async, paced by the same shared scheduler."""
+    async def send(timeout_seconds: float):
+        _count_api_call()
+        return await model.generate_content_async(prompt, request_options={"timeout": timeout_seconds})
+    estimated_tokens = estimate_tokens(prompt) + expected_output_tokens
+    with get_metrics_registry().timed("llm_call", chars=len(prompt), tokens=estimated_tokens) as span:
+        response = await get_llm_scheduler().call_async(send, estimated_tokens=estimated_tokens)
+        span["tokens"] = _response_token_count(response, estimated_tokens)
+    return response
+
+async def get_gemini_response_async(api_key: str, text_content: str) -> dict | None:
+    """asyncio version of get_gemini_response: same cache, result dict and error handling (None on failure)."""
+    if not text_content:
+        logger.warning("Document appears to be empty or unreadable. Could not extract text for analysis.")
+        return None
+
+    cache = get_classification_cache()
+    cache_key = _classification_cache_key(text_content)
+    cached_result = cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    try:
+        model = build_classification_model(api_key)
+        # Building the context is CPU work and may call the blocking token counter, so it runs off the loop.
+        with get_metrics_registry().timed("prompt_build") as span:
+            context, context_tokens = await asyncio.get_running_loop().run_in_executor(
+                None, build_prompt_context, text_content[:EXTRACTION_CHAR_BUDGET], CONTEXT_TOKEN_BUDGET, _model_token_counter(model))
+            prompt = build_classification_prompt(context)
+            span.update(chars=len(prompt), tokens=context_tokens)
+        response = await generate_scheduled_async(model, prompt)
+        result_json = _parse_classification_response(response, context_tokens)
+        cache.put(cache_key, result_json)
+        return result_json
+
+    except Exception as e:
+        _log_classification_error(e)
+        return None
+
+def _is_valid_classification(result) -> bool:
+    """Checks that a parsed AI result has the fields build_document_record relies on."""
+    return (isinstance(result, dict) and isinstance(result.get("category"), str)
+            and isinstance(result.get("confidence_score"), (int, float)) and isinstance(result.get("tags", []), list))
+
+def pack_classification_batches(documents: list[tuple[str, str]], token_budget: int = BATCH_TOKEN_BUDGET,
+                                max_documents: int = BATCH_MAX_DOCUMENTS) -> list[list[tuple[str, str]]]:
+    """Greedily packs (doc_id, text) pairs into batches that stay within token_budget and max_documents."""
+    batches, current, current_tokens = [], [], 0
+    for doc_id, text in documents:
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_documents):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((doc_id, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_classification_prompt(contexts: list[str]) -> str:
+    documents_block = "\n".join(
+        f"=== DOCUMENT id={index} ===\n{context}\n=== END DOCUMENT id={index} ===" for index, context in enumerate(contexts)
+    )
+    return f"""
+        You are an expert in Product Lifecycle Management (PLM) and document control.
+        Your task is to classify each of the {len(contexts)} technical documents below independently.
+        
+        Provide your response ONLY as a valid JSON array containing exactly one object per document, each with the keys: "document_id", "category", "confidence_score", "tags", "reasoning".
+        1.  **document_id**: The integer id shown in the document's header.
+        2.  **category**: From the following list, choose the single most likely document type: {json.dumps(PLM_DOCUMENT_TYPES)}. If none fit, use 'Other'.
+        3.  **confidence_score**: Provide an integer score from 0 to 100 indicating how confident you are.
+        4.  **tags**: Generate a list of 5 to 7 relevant keywords.
+        5.  **reasoning**: Briefly explain your choice in one or two sentences.
+        
+        Here are the documents to analyze:
+        {documents_block}
+        """
+
+def get_gemini_batch_response(api_key: str, documents: list[tuple[str, str]]) -> dict[str, dict | None]:
+    """
+    Classifies several short documents with a single Gemini request.
+    documents is a list of (doc_id, text). Cached results are reused; the remaining documents
+    are sent together and the returned JSON array is split back out by document id. Any entry
+    that is missing or malformed falls back to an individual get_gemini_response call.
+    """
+    cache = get_classification_cache()
+    results = {}
+    uncached = []
+    for doc_id, text in documents:
+        cached_result = cache.get(_classification_cache_key(text))
+        if cached_result is not None:
+            results[doc_id] = cached_result
+        else:
+            uncached.append((doc_id, text))
+
+    if len(uncached) == 1:
+        doc_id, text = uncached[0]
+        with document_context(doc_id):
+            results[doc_id] = get_gemini_response(api_key, text)
+        return results
+
+    if uncached:
+        # Short documents only get whitespace and header/footer cleanup; they already fit the budget.
+        with get_metrics_registry().timed("prompt_build") as span:
+            contexts = [build_prompt_context(text, CONTEXT_TOKEN_BUDGET) for _, text in uncached]
+            prompt = build_batch_classification_prompt([context for context, _ in contexts])
+            span.update(chars=len(prompt), tokens=sum(context_tokens for _, context_tokens in contexts))
+        parsed = {}
+        try:
+            response = generate_scheduled(build_classification_model(api_key), prompt,
+                                          expected_output_tokens=RESPONSE_TOKENS_PER_DOCUMENT * len(uncached))
+            with get_metrics_registry().timed("json_parse", chars=len(response.text)):
+                batch_json = json.loads(response.text)
+            if isinstance(batch_json, dict):
+                batch_json = batch_json.get("documents", [])
+            for entry in batch_json if isinstance(batch_json, list) else []:
+                try:
+                    index = int(entry.get("document_id"))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+                if 0 <= index < len(uncached) and _is_valid_classification(entry):
+                    parsed[index] = {key: entry[key] for key in ("category", "confidence_score", "tags", "reasoning") if key in entry}
+                    parsed[index]["context_tokens"] = contexts[index][1]
+        except Exception as e:
+            logger.warning(f"Batched AI analysis failed ({e}). Falling back to one request per document.")
+
+        for index, (doc_id, text) in enumerate(uncached):
+            if index in parsed:
+                cache.put(_classification_cache_key(text), parsed[index])
+                results[doc_id] = parsed[index]
+            else:
+                with document_context(doc_id):
+                    results[doc_id] = get_gemini_response(api_key, text)
+    return results
+
+# --- Batch Processing Pipeline ---
+
+def build_document_record(filename: str, text: str, ai_result: dict | None) -> dict:
+    """Turns the extraction/AI outcome for one file into a results record."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not text:
+        file_extension = os.path.splitext(filename)[1].lower()
+        return {
+            "filename": filename, "category": "Unreadable", "confidence": 0, "tags": [],
+            "reasoning": f"Could not extract text from the {file_extension} file. It might be empty, corrupted, or require special handling (e.g., OCR).",
+            "status": "Error", "timestamp": timestamp
+        }
+    if not ai_result:
+        # The text is kept so a later re-classification can retry without reading the file again.
+        return {
+            "filename": filename, "category": "Error", "confidence": 0, "tags": [],
+            "reasoning": "AI analysis failed. Please review manually.", "status": "Error",
+            "timestamp": timestamp, "extracted_text": text
+        }
+    confidence = ai_result.get("confidence_score", 0)
+    status = "Auto-Classified" if confidence >= 50 else "Needs Verification"
+    record = {
+        "filename": filename, "category": ai_result.get("category", "N/A"),
+        "confidence": confidence, "tags": ai_result.get("tags", []),
+        "reasoning": ai_result.get("reasoning", "No reasoning provided."),
+        "status": status, "timestamp": timestamp,
+        "classifier": ai_result.get("classifier", "gemini"), "extracted_text": text,
+        "fingerprint": classification_fingerprint()
+    }
+    if ai_result.get("duplicate_of"):
+        record["duplicate_of"] = ai_result["duplicate_of"]
+    if ai_result.get("context_tokens") is not None:
+        # Document tokens sent to the AI, next to what the old first-8000-characters prompt would have sent.
+        record["context_tokens"] = ai_result["context_tokens"]
+        record["baseline_tokens"] = estimate_tokens(text[:BASELINE_PROMPT_CHARS])
+    return record
+
+def _extract_document(filename: str, source, on_ocr_progress: Optional[Callable[[str, int, int], None]] = None) -> str:
+    """Extraction stage of the pipeline: reads at most EXTRACTION_CHAR_BUDGET characters, which the prompt context is sampled from."""
+    metrics = get_metrics_registry()
+    with document_context(filename):
+        if callable(source):
+            with metrics.timed("read") as span:
+                source = source()
+                span["bytes"] = len(source)
+        report_progress = None
+        if on_ocr_progress:
+            report_progress = lambda pages_done, total_pages: on_ocr_progress(filename, pages_done, total_pages)
+        with metrics.timed("extract", bytes=source_size(source)) as span:
+            text = extract_text(filename, source, char_budget=EXTRACTION_CHAR_BUDGET, on_ocr_progress=report_progress)
+            span["chars"] = len(text)
+            if not text:
+                span["outcome"] = "empty"
+        return text
+
+def find_inherited_classification(filename: str, signature: bytes, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                                  store: ResultsStore | None = None) -> dict | None:
+    """
+    Looks up the closest already-classified near-duplicate of a document (see
+    ResultsStore.find_near_duplicate) and, if it is at least threshold similar, returns its
+    category and tags as a result marked "inherited", shaped like the Gemini response.
+    """
+    match = (store or get_results_store()).find_near_duplicate(signature, threshold, classification_fingerprint(), exclude_filename=filename)
+    if match is None:
+        return None
+    source, similarity = match
+    source_confidence = 100 if source["status"] == "Manually Verified" else source["confidence"]
+    return {
+        "category": source["category"], "confidence_score": min(source_confidence, int(100 * similarity)), "tags": source["tags"],
+        "reasoning": f"Inherited from near-duplicate '{source['filename']}' ({similarity:.0%} similar). {source['reasoning'] or ''}".strip(),
+        "classifier": "inherited", "duplicate_of": source["filename"]
+    }
+
+def _prepare_document(filename: str, source, on_ocr_progress: Optional[Callable[[str, int, int], None]] = None,
+                      near_duplicate_threshold: float | None = None, pre_extracted: bool = False,
+                      on_stage: Optional[Callable[[str, str], None]] = None) -> tuple[str, bytes | None, dict | None]:
+    """
+    First stage of the pipeline: the document's text, its MinHash signature (b"" when the text
+    is too short to index, None when there is no text) and, with near_duplicate_threshold, the
+    classification inherited from a near-duplicate, if any.
+    """
+    if on_stage and not pre_extracted:
+        on_stage(filename, "extracting")
+    text = source if pre_extracted else _extract_document(filename, source, on_ocr_progress)
+    if not text:
+        return text, None, None
+    with document_context(filename), get_metrics_registry().timed("near_duplicate", chars=len(text)) as span:
+        signature = minhash_signature(text) or b""
+        inherited = None
+        if signature and near_duplicate_threshold is not None:
+            inherited = find_inherited_classification(filename, signature, near_duplicate_threshold)
+        span["outcome"] = "inherited" if inherited else "ok"
+    return text, signature, inherited
+
+def _classify_document(api_key: str, filename: str, text: str) -> dict:
+    """LLM stage of the pipeline: classifies already-extracted text."""
+    started = time.perf_counter()
+    with document_context(filename):
+        ai_result = get_gemini_response(api_key, text)
+    get_local_classifier().record_llm_call(time.perf_counter() - started)
+    return build_document_record(filename, text, ai_result)
+
+async def _classify_document_async(api_key: str, filename: str, text: str) -> dict:
+    """LLM stage of the pipeline on the asyncio path."""
+    started = time.perf_counter()
+    with document_context(filename):
+        ai_result = await get_gemini_response_async(api_key, text)
+    get_local_classifier().record_llm_call(time.perf_counter() - started)
+    return build_document_record(filename, text, ai_result)
+
+def _classify_document_batch(api_key: str, documents: list[tuple[str, str]]) -> list[tuple[str, dict]]:
+    """LLM stage for a batch of short documents that share one Gemini request."""
+    started = time.perf_counter()
+    with document_context(f"batch of {len(documents)} ({documents[0][0]}, ...)", file_type="batch"):
+        ai_results = get_gemini_batch_response(api_key, documents)
+    get_local_classifier().record_llm_call(time.perf_counter() - started)
+    return [(filename, build_document_record(filename, text, ai_results.get(filename))) for filename, text in documents]
+
+def analyze_documents_pipelined(files: Iterable[tuple[str, DocumentSource | Callable[[], bytes]]], api_key: str,
+                                extraction_workers: int = DEFAULT_EXTRACTION_WORKERS,
+                                llm_concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                                batch_small_documents: bool = True,
+                                preclassify_threshold: int | None = DEFAULT_CONFIDENCE_THRESHOLD,
+                                thread_initializer: Optional[Callable[[], None]] = None,
+                                on_ocr_progress: Optional[Callable[[str, int, int], None]] = None,
+                                max_in_flight: int | None = None,
+                                async_llm: bool = False,
+                                pre_extracted: bool = False,
+                                near_duplicate_threshold: float | None = None,
+                                on_stage: Optional[Callable[[str, str], None]] = None):
+    """
+    Runs extraction and classification as two overlapping stages.
+    Extraction runs on one thread pool; as soon as a file's text is ready it is handed
+    to a second, bounded pool for the Gemini call. With batch_small_documents, short
+    texts are held back briefly and packed into shared batch requests instead.
+    Unless preclassify_threshold is None, the local pre-classifier answers obvious
+    documents first and only the ambiguous remainder reaches Gemini.
+
+    files may be a lazy iterable of (doc_id, source) or (doc_id, loader) pairs, where a
+    source is bytes, a path or a binary stream (see upload_spool.DocumentSource); paths are
+    read in place rather than loaded whole. At most max_in_flight documents are read and held
+    in memory at once. thread_initializer runs
+    in every worker thread (the app uses it to attach the Streamlit script context).
+    With async_llm, single-document Gemini calls run as coroutines on the shared event loop
+    instead of the thread pool, so the number in flight is bounded only by the scheduler's
+    adaptive concurrency limit and max_in_flight rather than llm_concurrency.
+    With pre_extracted, files yields (doc_id, text) pairs of already extracted text and the
+    extraction stage is skipped (used to re-classify stored documents).
+    Unless near_duplicate_threshold is None, a document whose text is at least that similar
+    to an already classified one in the results store inherits its classification without
+    any AI call. Every record with text carries its MinHash signature under "minhash".
+    on_stage(doc_id, stage) is called, possibly from a worker thread, as a document starts
+    "extracting" and when it is handed to the AI ("classifying").
+    Yields (doc_id, record) in completion order so callers can store results as each
+    file finishes.
+    """
+    if max_in_flight is None:
+        max_in_flight = 4 * (extraction_workers + llm_concurrency)
+    extraction_pool = ThreadPoolExecutor(max_workers=max(1, extraction_workers), thread_name_prefix="extract", initializer=thread_initializer)
+    llm_pool = ThreadPoolExecutor(max_workers=max(1, llm_concurrency), thread_name_prefix="gemini", initializer=thread_initializer)
+    pending = {}
+    signatures = {}
+
+    def with_signature(filename: str, record: dict) -> tuple[str, dict]:
+        signature = signatures.pop(filename, None)
+        if signature is not None:
+            record["minhash"] = signature
+        return filename, record
+
+    try:
+        batch_buffer = []
+        in_flight = 0
+        files_iter = iter(files)
+        files_exhausted = False
+
+        while True:
+            # Keep the extraction stage fed without reading the whole input up front.
+            while not files_exhausted and in_flight < max_in_flight:
+                next_file = next(files_iter, None)
+                if next_file is None:
+                    files_exhausted = True
+                    break
+                filename, file_bytes = next_file
+                pending[extraction_pool.submit(_prepare_document, filename, file_bytes, on_ocr_progress,
+                                               near_duplicate_threshold, pre_extracted, on_stage)] = ("extract", filename, None)
+                in_flight += 1
+
+            # Send the buffered short documents once a batch is full, or once no more extractions can add to it.
+            if batch_buffer:
+                extraction_running = not files_exhausted or any(stage == "extract" for stage, _, _ in pending.values())
+                batches = pack_classification_batches(batch_buffer)
+                if extraction_running and len(batches[-1]) < BATCH_MAX_DOCUMENTS:
+                    batch_buffer = batches.pop()
+                else:
+                    batch_buffer = []
+                for batch in batches:
+                    pending[llm_pool.submit(_classify_document_batch, api_key, batch)] = ("classify_batch", None, batch)
+
+            if not pending:
+                if not batch_buffer:
+                    if files_exhausted:
+                        break
+                    continue
+                # Everything in flight is waiting in the batch buffer; flush it so the input can advance.
+                for batch in pack_classification_batches(batch_buffer):
+                    pending[llm_pool.submit(_classify_document_batch, api_key, batch)] = ("classify_batch", None, batch)
+                batch_buffer = []
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, filename, text = pending.pop(future)
+                if stage == "extract":
+                    try:
+                        text, signatures[filename], local_result = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected error while extracting '{filename}': {e}")
+                        text, local_result = "", None
+                    if text and not local_result and preclassify_threshold is not None:
+                        local_result = get_local_classifier().classify(filename, text, preclassify_threshold)
+                    if not text or local_result:
+                        in_flight -= 1
+                        yield with_signature(filename, build_document_record(filename, text, local_result))
+                        continue
+                    if on_stage:
+                        on_stage(filename, "classifying")
+                    if batch_small_documents and len(text) <= BATCH_DOCUMENT_MAX_CHARS:
+                        batch_buffer.append((filename, text))
+                    elif async_llm:
+                        pending[submit_coroutine(_classify_document_async(api_key, filename, text))] = ("classify", filename, text)
+                    else:
+                        pending[llm_pool.submit(_classify_document, api_key, filename, text)] = ("classify", filename, text)
+                elif stage == "classify_batch":
+                    batch = text
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected error while classifying a batch of {len(batch)} documents: {e}")
+                        records = [(batch_filename, build_document_record(batch_filename, batch_text, None)) for batch_filename, batch_text in batch]
+                    for batch_filename, record in records:
+                        in_flight -= 1
+                        yield with_signature(batch_filename, record)
+                else:
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected error while classifying '{filename}': {e}")
+                        record = build_document_record(filename, text, None)
+                    in_flight -= 1
+                    yield with_signature(filename, record)
+    finally:
+        # Drop queued work if the caller stops early (e.g., the script is rerun).
+        for future in pending:
+            future.cancel()
+        extraction_pool.shutdown(wait=False, cancel_futures=True)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+
+def index_near_duplicates(store: ResultsStore | None = None):
+    """
+    Computes MinHash signatures for stored documents classified before near-duplicate
+    detection existed, from their stored text, so new uploads can match them. Yields each
+    indexed filename.
+    """
+    store = store or get_results_store()
+    for filename, text in store.iter_unindexed():
+        store.set_minhash(filename, minhash_signature(text) or b"")
+        yield filename
@@ -1,17 +1,20 @@
 import streamlit as st
-import os
-import io
-import json
-import PyPDF2
-from datetime import datetime
-import google.generativeai as genai
-# New imports for new file types
-import docx
-import openpyxl
-# Imports for OCR functionality
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_bytes
+import time
+import logging
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+# Extraction and classification live in plain modules so they can be reused outside Streamlit (see document_tagger_cli.py)
+from document_classifier import (
+    PLM_DOCUMENT_TYPES, DEFAULT_EXTRACTION_WORKERS, DEFAULT_LLM_CONCURRENCY, MAX_LLM_CONCURRENCY,
+    BATCH_DOCUMENT_MAX_CHARS, BATCH_MAX_DOCUMENTS, DEFAULT_CONFIDENCE_THRESHOLD, DEFAULT_SIMILARITY_THRESHOLD,
+    get_classification_cache, get_local_classifier, get_results_store,
+    classification_fingerprint, index_near_duplicates
+)
+from results_store import normalize_tag
+from llm_scheduler import get_llm_scheduler
+from gemini_client import get_llm_backend
+from pipeline_metrics import MetricsRegistry, get_metrics_registry, serve_metrics_from_env
+from analysis_jobs import get_job_queue, start_local_worker
+from upload_spool import hash_source
 
 
 # --- App Configuration ---
@@ -21,31 +24,37 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Predefined PLM/PDM Document Types ---
-PLM_DOCUMENT_TYPES = [
-    "Technical Specification",
-    "Requirements Document (System/Software)",
-    "Bill of Materials (BOM)",
-    "Engineering Change Request (ECR)",
-    "Engineering Change Order (ECO)",
-    "CAD Drawing (2D/3D)",
-    "Failure Mode and Effects Analysis (FMEA)",
-    "Test Plan / Test Case",
-    "Test Report / Validation Report",
-    "User Manual / Operator Guide",
-    "Manufacturing Process Plan",
-    "Quality Inspection Report",
-    "Supplier Qualification Document",
-    "Project Plan",
-    "Risk Analysis Report",
-    "Other"  # Fallback category
-]
+# --- Streamlit Log Bridge ---
+class StreamlitLogHandler(logging.Handler):
+    """Shows log records from the helper modules as st.info/st.warning/st.error messages."""
+    def emit(self, record):
+        if get_script_run_ctx() is None:
+            return  # Shared threads (e.g. the async LLM event loop) belong to no page; the record still reaches the server log
+        message = self.format(record)
+        if record.levelno >= logging.ERROR:
+            st.error(message)
+        elif record.levelno >= logging.WARNING:
+            st.warning(message)
+        else:
+            st.info(message)
+
+def install_streamlit_log_bridge(logger_names: list[str]):
+    """Attaches one StreamlitLogHandler per logger; safe to call on every rerun."""
+    for name in logger_names:
+        module_logger = logging.getLogger(name)
+        module_logger.setLevel(logging.INFO)
+        if not any(handler.get_name() == "streamlit_bridge" for handler in module_logger.handlers):
+            handler = StreamlitLogHandler()
+            handler.set_name("streamlit_bridge")
+            module_logger.addHandler(handler)
+install_streamlit_log_bridge(["text_extraction", "document_classifier"])
 
 # --- Session State Initialization ---
 def init_session_state():
     """Initializes session state variables if they don't exist."""
+    # Classified documents live in the shared results store (see get_results_store), not in the session.
     defaults = {
-        'processed_documents': {},
+        'results_page': 1,
         'edit_mode': {} # Tracks which document is in edit mode, e.g., {'filename.pdf': True}
     }
     for key, value in defaults.items():
@@ -53,149 +62,149 @@ def init_session_state():
             st.session_state[key] = value
 init_session_state()
 
-# --- Helper Functions for Text Extraction ---
-
-def perform_ocr(file_bytes: bytes) -> str:
-    """Performs OCR on a PDF if it's image-based."""
-    st.info("Standard text extraction failed. Attempting OCR on the document. This may be slow for large files.")
-    try:
-        images = convert_from_bytes(file_bytes)
-        ocr_text = ""
-        for i, image in enumerate(images):
-            st.write(f"Processing page {i+1} with OCR...")
-            ocr_text += pytesseract.image_to_string(image) + "\n"
-        return ocr_text
-    except Exception as e:
-        st.error(f"OCR processing failed. Please ensure Tesseract is installed and configured correctly. Error: {e}")
-        return ""
-
-
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Extracts text from a PDF, falling back to OCR if needed."""
-    text = ""
+def get_api_key() -> str | None:
+    """The Google AI API key from the Streamlit secrets, or None if it is not configured."""
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        
-        if len(text.strip()) < 50: # Arbitrary threshold to detect scanned PDFs
-            ocr_text = perform_ocr(file_bytes)
-            return ocr_text if ocr_text else text
-        return text
-        
-    except Exception as e:
-        st.error(f"Error reading PDF file: {e}. Attempting OCR as a fallback.")
-        return perform_ocr(file_bytes)
-
-def extract_text_from_docx(file_bytes: bytes) -> str:
-    """Extracts text from a .docx file."""
-    try:
-        document = docx.Document(io.BytesIO(file_bytes))
-        return "\n".join([para.text for para in document.paragraphs])
-    except Exception as e:
-        st.error(f"Error reading Word document: {e}")
-        return ""
-
-def extract_text_from_xlsx(file_bytes: bytes) -> str:
-    """Extracts text from all cells in an .xlsx file."""
-    try:
-        workbook = openpyxl.load_workbook(io.BytesIO(file_bytes))
-        text = ""
-        for sheet in workbook.sheetnames:
-            worksheet = workbook[sheet]
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.value:
-                        text += str(cell.value) + " "
-                text += "\n"
-        return text
-    except Exception as e:
-        st.error(f"Error reading Excel file: {e}")
-        return ""
-        
-def extract_text_from_txt(file_bytes: bytes) -> str:
-    """Extracts text from a .txt file."""
-    try:
-        return file_bytes.decode('utf-8')
-    except Exception as e:
-        st.error(f"Error reading text file: {e}")
-        return ""
-
-
-def get_gemini_response(api_key: str, text_content: str) -> dict | None:
-    """Analyzes document text using the Gemini API and returns a structured response."""
-    if not text_content:
-        st.warning("Document appears to be empty or unreadable. Could not extract text for analysis.")
-        return None
-        
-    try:
-        genai.configure(api_key=api_key)
-        
-        generation_config = {"temperature": 0.2, "response_mime_type": "application/json"}
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-        
-        # The JSON schema is defined implicitly in the prompt text itself.
-        # We no longer need a separate schema object.
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-        
-        prompt = f"""
-        You are an expert in Product Lifecycle Management (PLM) and document control.
-        Your task is to analyze the provided technical document text and classify it.
-        
-        Based on the text content, perform the following actions and provide your response ONLY as a valid JSON object with the following keys: "category", "confidence_score", "tags", "reasoning".
-        1.  **category**: From the following list, choose the single most likely document type: {json.dumps(PLM_DOCUMENT_TYPES)}. If none fit, use 'Other'.
-        2.  **confidence_score**: Provide an integer score from 0 to 100 indicating how confident you are.
-        3.  **tags**: Generate a list of 5 to 7 relevant keywords.
-        4.  **reasoning**: Briefly explain your choice in one or two sentences.
-        
-        Here is the document text to analyze (first 8000 characters):
-        ---
-        {text_content[:8000]}
-        ---
-        """
-
-        # *** FIX APPLIED HERE ***
-        # The schema object is removed from the generate_content call.
-        # We now only pass the prompt.
-        response = model.generate_content(prompt)
-        
-        # The Gemini model with response_mime_type="application/json" should return a clean JSON string.
-        # The .text attribute contains that string.
-        result_json = json.loads(response.text)
-        return result_json
-
-    except genai.types.generation_types.StopCandidateException as e:
-        st.error(f"AI analysis was stopped. This can happen if the content is flagged by safety filters. Details: {e}")
-        return None
-    except Exception as e:
-        st.error(f"An error occurred with the AI analysis: {e}. This might be due to an invalid API key, network issues, or API limits.")
+        return st.secrets["google_api_key"]
+    except (KeyError, FileNotFoundError):
         return None
 
 # --- UI Rendering Functions ---
 
+def render_job_summary(rows: list[dict]):
+    """Summarizes how many documents of a job skipped the AI call and the AI latency that saved."""
+    classified = [row for row in rows if row.get("classifier")]
+    if not classified:
+        return
+    local = sum(1 for row in classified if row["classifier"] == "local")
+    inherited = sum(1 for row in classified if row["classifier"] == "inherited")
+    ai_seconds = [row["finished_at"] - row["started_at"] for row in classified
+                  if row["classifier"] == "gemini" and row["started_at"] and row["finished_at"]]
+    average_ai_seconds = sum(ai_seconds) / len(ai_seconds) if ai_seconds else 0.0
+    skipped = local + inherited
+    st.caption(f"{skipped} of {len(classified)} documents ({100 * skipped / len(classified):.0f}%) classified without an AI call: "
+               f"{local} by the local pre-classifier, {inherited} inherited from near-duplicates. "
+               f"Estimated AI latency saved: {skipped * average_ai_seconds:.1f} s.")
+
+def render_token_report(rows: list[dict]):
+    """Per-document prompt token counts for this job, against the old first-8000-characters prompt."""
+    sent = [row for row in rows if row.get("context_tokens") is not None]
+    if not sent:
+        return
+    context_tokens = sum(row["context_tokens"] for row in sent)
+    baseline_tokens = sum(row["baseline_tokens"] for row in sent)
+    saved = 100 * (1 - context_tokens / baseline_tokens) if baseline_tokens else 0.0
+    st.caption(f"Prompt context: {context_tokens:,} document tokens sent to the AI for {len(sent)} documents "
+               f"(the first-8000-characters prompt would have sent about {baseline_tokens:,}, {saved:.0f}% less).")
+    with st.expander("Tokens per document"):
+        st.dataframe([{"File": row["filename"], "Context tokens": row["context_tokens"], "First 8000 chars (est.)": row["baseline_tokens"]}
+                      for row in sent], hide_index=True)
+
+JOB_POLL_SECONDS = 1.0
+FILE_STATUS_LABELS = {"queued": "⏳ Queued", "claimed": "📥 Picked up", "extracting": "📖 Extracting", "ocr": "🔍 OCR",
+                      "classifying": "🤖 Classifying", "done": "✅ Done", "error": "❌ Error", "cancelled": "⏹️ Cancelled"}
+
+def _current_job_id() -> str | None:
+    return st.session_state.get("analysis_job") or st.query_params.get("job")
+
+def _show_analysis_job(job_id: str):
+    # Kept in the URL as well, so a reloaded tab reattaches to the job.
+    st.session_state.analysis_job = job_id
+    st.query_params["job"] = job_id
+
+def _dismiss_analysis_job():
+    st.session_state.pop("analysis_job", None)
+    st.query_params.pop("job", None)
+
+def _job_running(job_id: str | None) -> bool:
+    snapshot = get_job_queue().snapshot(job_id) if job_id else None
+    return snapshot is not None and not snapshot["finished"]
+
+def analysis_options(extraction_workers: int = DEFAULT_EXTRACTION_WORKERS, llm_concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                     batch_small_documents: bool = True, preclassify_threshold: int | None = DEFAULT_CONFIDENCE_THRESHOLD,
+                     async_llm: bool = False, near_duplicate_threshold: float | None = DEFAULT_SIMILARITY_THRESHOLD,
+                     requests_per_minute: float | None = None, tokens_per_minute: float | None = None) -> dict:
+    """Options of an analysis job: the processing settings plus the AI quota the workers share (the scheduler's by default)."""
+    scheduler = get_llm_scheduler()
+    return {"extraction_workers": extraction_workers, "llm_concurrency": llm_concurrency,
+            "batch_small_documents": batch_small_documents, "preclassify_threshold": preclassify_threshold, "async_llm": async_llm,
+            "near_duplicate_threshold": near_duplicate_threshold,
+            "requests_per_minute": requests_per_minute or scheduler.requests_per_minute,
+            "tokens_per_minute": tokens_per_minute or scheduler.tokens_per_minute}
+
+def _saved_analysis_options() -> dict:
+    """The processing settings last chosen on the upload page, or the defaults if it was not opened this session."""
+    return st.session_state.get("analysis_options") or analysis_options()
+
+def _enqueue_job(enqueue, api_key: str | None, *args) -> str:
+    """Enqueues a job and makes sure a worker will pick it up."""
+    queue = get_job_queue()
+    job_id = enqueue(*args)
+    if not queue.live_workers() and start_local_worker(api_key):
+        st.toast("Started a background worker for the analysis.")
+    return job_id
+
+def render_job_progress(job_id: str, was_running: bool):
+    """Live per-file status table of an analysis job; re-run on a timer while the job is running."""
+    queue = get_job_queue()
+    snapshot = queue.snapshot(job_id)
+    if snapshot is None:
+        st.info("That analysis is no longer available. Its results are on the 'Classification Results' page.")
+        _dismiss_analysis_job()
+        return
+    if was_running and snapshot["finished"]:
+        st.rerun()  # Full rerun: stops the polling timer and shows the final reports
+    total, finished_count = snapshot["total"], snapshot["finished_count"]
+    first_result = f" · first result after {snapshot['first_result_seconds']:.1f} s" if snapshot["first_result_seconds"] is not None else ""
+    st.progress(finished_count / total if total else 1.0,
+                text=f"Processed {finished_count} of {total} files in {snapshot['elapsed_seconds']:.0f} s{first_result}")
+    if not snapshot["finished"]:
+        workers = queue.live_workers()
+        if workers:
+            st.caption(f"{len(workers)} worker{'s' if len(workers) != 1 else ''} processing the queue "
+                       f"({queue.pending_count()} files waiting or in progress over all jobs).")
+        else:
+            st.warning("No worker is running, so this job is waiting in the queue. Start one with `python job_worker.py`.")
+    now = time.time()
+    st.dataframe([{
+        "File": row["filename"], "Status": FILE_STATUS_LABELS.get(row["status"], row["status"]),
+        "Detail": row["detail"] or (f"near-duplicate of {row['duplicate_of']}" if row.get("duplicate_of") else row.get("result_status")),
+        "Category": row.get("category"), "Confidence": row.get("confidence"),
+        "Seconds": round((row["finished_at"] or now) - row["started_at"], 1) if row["started_at"] else None,
+    } for row in snapshot["files"]], hide_index=True,
+        column_config={"Confidence": st.column_config.ProgressColumn("Confidence", min_value=0, max_value=100, format="%d%%")})
+    if not snapshot["finished"]:
+        if st.button("Stop analysis", key=f"cancel_job_{job_id}"):
+            queue.cancel(job_id)
+
+def render_analysis_job(job_id: str):
+    """Shows a queued analysis job (also after a reload or app restart), updating as workers complete its files."""
+    running = _job_running(job_id)
+    st.subheader("Analysis progress")
+    st.fragment(render_job_progress, run_every=JOB_POLL_SECONDS if running else None)(job_id, running)
+    snapshot = get_job_queue().snapshot(job_id)
+    if snapshot is None or running:
+        return
+    render_job_summary(snapshot["files"])
+    render_token_report(snapshot["files"])
+    failed = sum(1 for row in snapshot["files"] if row["status"] == "error")
+    if snapshot["cancelled"]:
+        st.warning("The analysis was stopped. Files that had already started were completed.")
+    elif failed:
+        st.warning(f"Analysis complete, but {failed} files could not be processed. Check the 'Classification Results' page for details.")
+    else:
+        st.success("Analysis complete! Check the 'Classification Results' page for details.")
+    st.button("Dismiss", on_click=_dismiss_analysis_job, key=f"dismiss_job_{job_id}")
+
 def render_upload_page():
     """Renders the main page for uploading and analyzing documents."""
     st.title("📄 AI-Powered Document Classification & Tagging")
     
-    api_key_configured = False
-    try:
-        if st.secrets["google_api_key"]:
-            api_key_configured = True
-    except KeyError:
-        api_key_configured = False
+    api_key = get_api_key()
+    api_key_configured = bool(api_key)
 
-    if not api_key_configured:
+    llm_backend = get_llm_backend()
+    if not api_key_configured and llm_backend.needs_api_key:
         st.error("🚨 Google AI API Key not configured!")
         st.markdown("""
             Please add your `google_api_key` to your Streamlit secrets for this app.
@@ -209,6 +218,10 @@ def render_upload_page():
         """)
         return
 
+    if llm_backend.name != "gemini":
+        st.info(f"AI backend: **{llm_backend.name}** (set by LLM_BACKEND). "
+                + ("Responses are synthetic, for testing only." if not llm_backend.real_responses else "Requests are answered from or saved to recordings on disk."))
+
     st.markdown("""
     ### Welcome! Make Your Document Management Smarter.
     This tool uses Google's Gemini AI to automatically process and organize your technical documents.
@@ -232,116 +245,301 @@ def render_upload_page():
         accept_multiple_files=True
     )
     
-    if st.button("Start Analysis", disabled=(not uploaded_files)):
-        with st.spinner("Analyzing documents... This may take a moment."):
-            for file in uploaded_files:
-                if file.name in st.session_state.processed_documents:
-                    st.info(f"'{file.name}' has already been processed. Skipping.")
-                    continue
-                
-                st.write(f"--- \n**Processing: {file.name}**")
-                file_bytes = file.getvalue()
-                
-                text = ""
-                file_extension = os.path.splitext(file.name)[1].lower()
-                
-                if file_extension == ".pdf":
-                    text = extract_text_from_pdf(file_bytes)
-                elif file_extension == ".docx":
-                    text = extract_text_from_docx(file_bytes)
-                elif file_extension == ".xlsx":
-                    text = extract_text_from_xlsx(file_bytes)
-                elif file_extension == ".txt":
-                    text = extract_text_from_txt(file_bytes)
-
-                if text:
-                    ai_result = get_gemini_response(st.secrets["google_api_key"], text)
-                    if ai_result:
-                        confidence = ai_result.get("confidence_score", 0)
-                        status = "Auto-Classified" if confidence >= 50 else "Needs Verification"
-                        st.session_state.processed_documents[file.name] = {
-                            "filename": file.name, "category": ai_result.get("category", "N/A"),
-                            "confidence": confidence, "tags": ai_result.get("tags", []),
-                            "reasoning": ai_result.get("reasoning", "No reasoning provided."),
-                            "status": status, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        st.success(f"'{file.name}' analyzed. Status: {status}")
-                    else:
-                        st.session_state.processed_documents[file.name] = {
-                            "filename": file.name, "category": "Error", "confidence": 0, "tags": [],
-                            "reasoning": "AI analysis failed. Please review manually.", "status": "Error",
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                else:
-                    st.session_state.processed_documents[file.name] = {
-                        "filename": file.name, "category": "Unreadable", "confidence": 0, "tags": [],
-                        "reasoning": f"Could not extract text from the {file_extension} file. It might be empty, corrupted, or require special handling (e.g., OCR).",
-                        "status": "Error",
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-        st.success("Analysis complete! Check the 'Classification Results' page for details.")
+    with st.expander("⚙️ Processing Settings"):
+        extraction_workers = st.slider("Parallel extraction workers", min_value=1, max_value=max(DEFAULT_EXTRACTION_WORKERS, 16), value=DEFAULT_EXTRACTION_WORKERS,
+                                       help="Number of files whose text is extracted (PDF/OCR, Word, Excel) at the same time.")
+        llm_concurrency = st.slider("Concurrent AI requests", min_value=1, max_value=MAX_LLM_CONCURRENCY, value=DEFAULT_LLM_CONCURRENCY,
+                                    help="Maximum number of Gemini calls in flight. Raise it for large batches, lower it if you hit API rate limits.")
+        scheduler = get_llm_scheduler()
+        col1, col2 = st.columns(2)
+        requests_per_minute = col1.number_input("API requests per minute", min_value=1, value=int(scheduler.requests_per_minute),
+                                                help="Your Gemini quota. Requests are paced to stay at this ceiling; throttled calls are retried automatically.")
+        tokens_per_minute = col2.number_input("API tokens per minute", min_value=1000, step=10000, value=int(scheduler.tokens_per_minute))
+        scheduler.configure(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+        worker_counters = get_job_queue().worker_counters()
+        st.caption(f"AI request scheduler: the quota is shared between the running workers. "
+                   f"{worker_counters.get('llm_calls', 0)} calls, {worker_counters.get('llm_retries', 0)} retries and "
+                   f"{worker_counters.get('llm_throttled', 0)} throttled responses in the workers since diagnostics were last reset.")
+        async_llm = st.checkbox("Send AI requests asynchronously", value=False,
+                                help="Runs Gemini calls on a shared asyncio event loop instead of one thread per request, so many more can be in flight. "
+                                     "Concurrency then follows the request scheduler's adaptive limit rather than the slider above.")
+        batch_small_documents = st.checkbox("Batch short documents into shared AI requests", value=True,
+                                            help=f"Documents with up to {BATCH_DOCUMENT_MAX_CHARS} characters of text are classified up to {BATCH_MAX_DOCUMENTS} at a time, cutting the number of API calls.")
+        use_preclassifier = st.checkbox("Classify obvious documents locally before calling the AI", value=True,
+                                        help="Keyword rules plus a model trained from documents you marked as verified. Only ambiguous documents are sent to Gemini.")
+        preclassify_threshold = st.slider("Local classification confidence threshold", min_value=50, max_value=99, value=DEFAULT_CONFIDENCE_THRESHOLD,
+                                          disabled=not use_preclassifier)
+        st.caption(f"Local pre-classifier trained on {get_local_classifier().example_count} manually verified documents.")
+        reuse_near_duplicates = st.checkbox("Reuse classifications of near-duplicate documents", value=True,
+                                            help="Revisions and re-exports whose text is nearly identical to an already classified document inherit its category and tags instead of calling the AI.")
+        near_duplicate_similarity = st.slider("Near-duplicate similarity threshold (%)", min_value=70, max_value=99,
+                                              value=int(DEFAULT_SIMILARITY_THRESHOLD * 100), disabled=not reuse_near_duplicates)
+        unindexed = get_results_store().count_unindexed()
+        if unindexed and st.button(f"Index {unindexed} earlier documents for near-duplicate detection"):
+            with st.spinner("Indexing stored documents..."):
+                indexed = sum(1 for _ in index_near_duplicates())
+            st.success(f"Indexed {indexed} documents.")
+        cache = get_classification_cache()
+        st.caption(f"Classification cache: {len(cache)} stored results ({worker_counters.get('cache_hits', 0)} hits / "
+                   f"{worker_counters.get('cache_misses', 0)} misses in the workers since diagnostics were last reset).")
+        if st.button("Clear Classification Cache"):
+            cache.clear()
+            st.success("Classification cache cleared.")
+    # Kept in the session so jobs started from other pages (e.g. re-classifying stale results) use the same settings.
+    st.session_state.analysis_options = analysis_options(
+        extraction_workers, llm_concurrency, batch_small_documents, preclassify_threshold if use_preclassifier else None,
+        async_llm, near_duplicate_similarity / 100 if reuse_near_duplicates else None, requests_per_minute, tokens_per_minute)
+
+    if st.button("Start Analysis", disabled=(not uploaded_files) or _job_running(_current_job_id())):
+        # Deduplicate by content, not by name: identical bytes under a new name reuse the
+        # earlier result, while a different file that reuses a name is analyzed again.
+        store = get_results_store()
+        files_to_process = []
+        queued_hashes = {}
+        for file in uploaded_files:
+            # The upload is hashed here and copied to the job spool in chunks, never duplicated in memory.
+            read_started = time.perf_counter()
+            content_hash = hash_source(file)
+            get_metrics_registry().record("read", time.perf_counter() - read_started, document=file.name, bytes=file.size)
+            existing = store.get(file.name)
+            if existing and existing.get("content_hash") == content_hash:
+                st.info(f"'{file.name}' has already been processed. Skipping.")
+                continue
+            duplicate_of = store.find_by_content_hash(content_hash)
+            if duplicate_of:
+                store.copy(duplicate_of["filename"], file.name)
+                st.info(f"'{file.name}' is identical to '{duplicate_of['filename']}'. Reusing its classification.")
+                continue
+            if content_hash in queued_hashes:
+                st.info(f"'{file.name}' is identical to '{queued_hashes[content_hash]}' in this batch. Skipping.")
+                continue
+            if existing:
+                st.info(f"'{file.name}' has changed since it was last processed. Analyzing it again.")
+            queued_hashes[content_hash] = file.name
+            files_to_process.append((file.name, file, content_hash))
+
+        if files_to_process:
+            _show_analysis_job(_enqueue_job(get_job_queue().enqueue_uploads, api_key, files_to_process, _saved_analysis_options()))
+        else:
+            st.success("Nothing new to analyze. Check the 'Classification Results' page for details.")
+
+    job_id = _current_job_id()
+    if job_id:
+        render_analysis_job(job_id)
+
+RESULTS_PAGE_SIZES = [25, 50, 100, 250]
+RESULT_STATUSES = ["Auto-Classified", "Needs Verification", "Manually Verified", "Error"]
+RESULT_SORT_OPTIONS = {"Newest first": ("timestamp", True), "Oldest first": ("timestamp", False),
+                       "Lowest confidence": ("confidence", False), "Highest confidence": ("confidence", True),
+                       "Category": ("category", False), "Filename": ("filename", False)}
+
+def _reset_results_page():
+    st.session_state.results_page = 1
+
+def render_results_filters(store) -> dict:
+    """Renders the search/filter controls and returns the matching store.query() arguments."""
+    search = st.text_input("Search tags, categories and reasoning", key="results_search", on_change=_reset_results_page,
+                           placeholder='e.g. brake caliper OR rotor*   ·   "torque wrench"',
+                           help="Words must all match; OR separates alternatives; a trailing * matches a prefix; quotes match a whole tag.")
+    if search.strip() and not search.strip().endswith("*"):
+        last_word = search.split()[-1].strip('"')
+        suggestions = [term for term in store.suggest_terms(last_word, limit=8) if term != normalize_tag(last_word)]
+        if suggestions:
+            st.caption("Matching terms: " + ", ".join(suggestions))
+    col1, col2, col3 = st.columns([2, 3, 2])
+    statuses = col1.multiselect("Status", RESULT_STATUSES, key="results_filter_status", on_change=_reset_results_page)
+    categories = col2.multiselect("Category", store.categories(), key="results_filter_category", on_change=_reset_results_page)
+    min_confidence, max_confidence = col3.slider("Confidence", 0, 100, (0, 100), key="results_filter_confidence", on_change=_reset_results_page)
+    return {
+        "search": search.strip() or None,
+        "status": statuses or None, "category": categories or None,
+        "min_confidence": min_confidence if min_confidence > 0 else None,
+        "max_confidence": max_confidence if max_confidence < 100 else None,
+    }
+
+def render_edit_form(store, details: dict):
+    """Edit form for one document's category and tags; saving marks it as Manually Verified."""
+    filename = details['filename']
+    st.write(f"**Editing Classification Details** for `{filename}`")
+    # Work on a copy: the shared category list feeds the AI prompt and the cache keys.
+    category_options = list(PLM_DOCUMENT_TYPES)
+    if details['category'] not in category_options:
+        category_options.append(details['category'])
+    current_cat_index = category_options.index(details['category'])
+    
+    new_category = st.selectbox("Document Category", options=category_options, index=current_cat_index, key=f"cat_edit_{filename}")
+    new_tags = st.text_area("Tags (comma-separated)", value=", ".join(details['tags']), key=f"tags_edit_{filename}")
+
+    col1, col2, _ = st.columns([1, 1, 4])
+    if col1.button("Save Changes", key=f"save_{filename}", type="primary"):
+        tags = [tag.strip() for tag in new_tags.split(",") if tag.strip()]
+        store.update_classification(filename, new_category, tags, "Manually Verified")
+        extracted_text = store.get(filename, include_text=True).get('extracted_text')
+        if extracted_text:
+            get_local_classifier().add_example(extracted_text, new_category, tags)
+        st.session_state.edit_mode[filename] = False
+        st.rerun()
+    if col2.button("Cancel", key=f"cancel_{filename}"):
+        st.session_state.edit_mode[filename] = False
+        st.rerun()
+
+def render_result_card(store, details: dict):
+    """Detailed expander view of one document (card mode)."""
+    filename = details['filename']
+    is_editing = st.session_state.edit_mode.get(filename, False)
+
+    status_color = "green" if details['status'] == "Auto-Classified" else \
+                   "blue" if details['status'] == "Manually Verified" else \
+                   "orange" if details['status'] == "Needs Verification" else "red"
+    
+    with st.expander(f"**{details['filename']}** | Status: :{status_color}[{details['status']}]", expanded=is_editing):
+        if is_editing:
+            render_edit_form(store, details)
+        else:
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                st.metric("Suggested Category", details['category'])
+                st.metric("Confidence Score", f"{details['confidence']}%" if details['status'] != "Manually Verified" else "N/A")
+            with col2:
+                st.write("**Suggested Tags**")
+                st.write(", ".join(details['tags']) or "—")
+                st.write(f"**Processed:** {details['timestamp']}")
+                if details.get('duplicate_of'):
+                    st.write(f"**Near-duplicate of:** `{details['duplicate_of']}` (classification inherited)")
+            
+            st.write("**AI Reasoning**")
+            st.info(details['reasoning'])
+
+            if st.button("Edit", key=f"edit_{filename}"):
+                st.session_state.edit_mode[filename] = True
+                st.rerun()
+
+def render_results_table(store, rows: list[dict]):
+    """Compact mode: the whole page is one dataframe; only the selected row gets an edit form."""
+    table = [{
+        "Filename": details['filename'], "Status": details['status'], "Category": details['category'],
+        "Confidence": details['confidence'] if details['status'] != "Manually Verified" else None,
+        "Tags": ", ".join(details['tags']), "Processed": details['timestamp'], "Duplicate of": details.get('duplicate_of'),
+        "Reasoning": details['reasoning'],
+    } for details in rows]
+    selection = st.dataframe(
+        table, hide_index=True, on_select="rerun", selection_mode="single-row",
+        key=f"results_table_{st.session_state.results_page}",
+        column_config={"Confidence": st.column_config.ProgressColumn("Confidence", min_value=0, max_value=100, format="%d%%")},
+    )
+    selected_rows = selection.selection.rows if selection else []
+    if selected_rows:
+        render_edit_form(store, rows[selected_rows[0]])
+    else:
+        st.caption("Select a row to edit its category and tags.")
+
+def render_stale_results(store):
+    """Offers to re-classify documents classified under an older prompt, category list or model, as a queued job."""
+    job_id = _current_job_id()
+    stale_count = store.count_stale(classification_fingerprint())
+    if stale_count:
+        col1, col2 = st.columns([4, 1])
+        col1.warning(f"{stale_count} documents were classified with an older prompt, category list or model. "
+                     "Re-classifying reuses their stored text, so only the AI calls are repeated; manually verified documents are kept.")
+        api_key = get_api_key()
+        if col2.button("Re-classify stale", disabled=(not api_key and get_llm_backend().needs_api_key) or _job_running(job_id)):
+            stale_filenames = [filename for filename, _ in store.iter_stale(classification_fingerprint())]
+            _show_analysis_job(_enqueue_job(get_job_queue().enqueue_stored, api_key, stale_filenames, _saved_analysis_options()))
+            st.rerun()
+    snapshot = get_job_queue().snapshot(job_id) if job_id else None
+    if snapshot is not None and snapshot["kind"] == "stored":
+        render_analysis_job(job_id)
+
+def render_duplicate_clusters(store):
+    """Lists groups of near-duplicate documents that share one classification."""
+    clusters = store.duplicate_clusters()
+    if not clusters:
+        return
+    with st.expander(f"🧬 Near-duplicate clusters ({len(clusters)})"):
+        st.caption("Documents that inherited their classification from a nearly identical one, grouped by the original.")
+        st.dataframe([{"Original": cluster["filename"], "Near-duplicates": len(cluster["duplicates"]),
+                       "Files": ", ".join(cluster["duplicates"])} for cluster in clusters], hide_index=True)
 
 def render_results_page():
-    """Renders the page displaying the classification results."""
+    """Renders the page displaying the classification results: filtered, sorted and paginated in the results store."""
     st.title("📊 Classification Results")
+    store = get_results_store()
     
-    if not st.session_state.processed_documents:
+    if not len(store):
         st.info("No documents have been processed yet. Please go to the 'Upload Document' page to begin.")
         return
 
     st.markdown("Review the analysis results below. For documents marked 'Needs Verification', you can manually edit the category and tags.")
-    
-    for filename, details in st.session_state.processed_documents.items():
-        is_editing = st.session_state.edit_mode.get(filename, False)
-
-        status_color = "green" if details['status'] == "Auto-Classified" else \
-                       "blue" if details['status'] == "Manually Verified" else \
-                       "orange" if details['status'] == "Needs Verification" else "red"
-        
-        with st.expander(f"**{details['filename']}** | Status: :{status_color}[{details['status']}]", expanded=is_editing):
-            if is_editing:
-                st.write("**Editing Classification Details**")
-                try:
-                    current_cat_index = PLM_DOCUMENT_TYPES.index(details['category'])
-                except ValueError:
-                    if details['category'] not in PLM_DOCUMENT_TYPES: PLM_DOCUMENT_TYPES.append(details['category'])
-                    current_cat_index = PLM_DOCUMENT_TYPES.index(details['category'])
-                
-                new_category = st.selectbox("Document Category", options=PLM_DOCUMENT_TYPES, index=current_cat_index, key=f"cat_edit_{filename}")
-                new_tags = st.text_area("Tags (comma-separated)", value=", ".join(details['tags']), key=f"tags_edit_{filename}")
-
-                col1, col2, _ = st.columns([1, 1, 4])
-                if col1.button("Save Changes", key=f"save_{filename}", type="primary"):
-                    st.session_state.processed_documents[filename]['category'] = new_category
-                    st.session_state.processed_documents[filename]['tags'] = [tag.strip() for tag in new_tags.split(",") if tag.strip()]
-                    st.session_state.processed_documents[filename]['status'] = "Manually Verified"
-                    st.session_state.edit_mode[filename] = False
-                    st.rerun()
-                if col2.button("Cancel", key=f"cancel_{filename}"):
-                    st.session_state.edit_mode[filename] = False
-                    st.rerun()
-            else:
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    st.metric("Suggested Category", details['category'])
-                    st.metric("Confidence Score", f"{details['confidence']}%" if details['status'] != "Manually Verified" else "N/A")
-                with col2:
-                    st.write("**Suggested Tags**")
-                    st.multiselect("Tags", options=details['tags'], default=details['tags'], disabled=True, label_visibility="collapsed", key=f"tags_view_{filename}")
-                    st.write(f"**Processed:** {details['timestamp']}")
-                
-                st.write("**AI Reasoning**")
-                st.info(details['reasoning'])
-
-                if st.button("Edit", key=f"edit_{filename}"):
-                    st.session_state.edit_mode[filename] = True
-                    st.rerun()
+    render_stale_results(store)
+    render_duplicate_clusters(store)
+
+    filters = render_results_filters(store)
+    col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+    sort_label = col1.selectbox("Sort by", list(RESULT_SORT_OPTIONS), key="results_sort", on_change=_reset_results_page)
+    view_mode = col2.radio("View", ["Table", "Cards"], horizontal=True, key="results_view")
+    page_size = col3.selectbox("Per page", RESULTS_PAGE_SIZES, key="results_page_size", on_change=_reset_results_page)
+
+    started = time.perf_counter()
+    total_documents = store.count(**filters)
+    if not total_documents:
+        st.info("No documents match the current filters.")
+        return
+    page_count = (total_documents + page_size - 1) // page_size
+    st.session_state.results_page = min(st.session_state.results_page, page_count)
+    page = col4.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key="results_page")
+    st.caption(f"{total_documents} matching documents")
+
+    order_by, descending = RESULT_SORT_OPTIONS[sort_label]
+    rows = store.query(**filters, order_by=order_by, descending=descending, limit=page_size, offset=(page - 1) * page_size)
+    if filters["search"]:
+        st.caption(f"Search took {(time.perf_counter() - started) * 1000:.1f} ms")
+    if view_mode == "Table":
+        render_results_table(store, rows)
+    else:
+        for details in rows:
+            render_result_card(store, details)
+
+def get_combined_metrics() -> MetricsRegistry:
+    """This server's pipeline metrics plus the ones the job workers published (see job_worker.publish_stats)."""
+    combined = MetricsRegistry()
+    combined.merge_state(get_metrics_registry().export_state(trace_events=None))
+    for worker_metrics in get_job_queue().worker_metrics():
+        combined.merge_state(worker_metrics)
+    return combined
+
+def render_diagnostics_sidebar():
+    """Sidebar panel with per-stage timings of the pipeline, by file type, plus Prometheus and trace exports."""
+    metrics = get_combined_metrics()
+    with st.sidebar.expander("🩺 Pipeline Diagnostics"):
+        rows = metrics.snapshot()
+        if not rows:
+            st.caption("No documents processed since diagnostics were last reset.")
+            return
+        st.caption("This server plus every job worker, since diagnostics were last reset.")
+        file_types = sorted({row["file_type"] for row in rows})
+        selected_types = st.multiselect("File types", file_types, default=file_types, key="diagnostics_file_types")
+        st.dataframe([{"Stage": row["stage"], "Type": row["file_type"], "Count": row["count"], "Errors": row["errors"],
+                       "p50 ms": row["p50_ms"], "p95 ms": row["p95_ms"], "p99 ms": row["p99_ms"], "Total s": row["total_seconds"],
+                       "MB": round(row["bytes"] / (1024 * 1024), 2), "Chars": row["chars"], "Tokens": row["tokens"]}
+                      for row in rows if row["file_type"] in selected_types], hide_index=True)
+        slowest = max((row for row in rows if row["file_type"] in selected_types), key=lambda row: row["total_seconds"], default=None)
+        if slowest:
+            st.caption(f"Most time spent in **{slowest['stage']}** ({slowest['file_type']}): {slowest['total_seconds']:.1f} s over {slowest['count']} runs.")
+        col1, col2 = st.columns(2)
+        col1.download_button("Prometheus", metrics.to_prometheus(), file_name="pipeline_metrics.prom", mime="text/plain")
+        col2.download_button("Trace (JSONL)", metrics.trace_jsonl(), file_name="pipeline_trace.jsonl", mime="application/x-ndjson")
+        if st.button("Reset diagnostics"):
+            get_metrics_registry().reset()
+            get_job_queue().reset_worker_stats()
+            st.rerun()
 
 # --- Main App Logic ---
 
 # Removed the API Key input from the sidebar. The app now relies on st.secrets.
+serve_metrics_from_env(lambda: get_combined_metrics().to_prometheus())  # Once per server process; no-op unless PIPELINE_METRICS_PORT is set
 st.sidebar.title("Navigation")
 app_mode = st.sidebar.radio("Choose a page:", ["Upload Document", "Classification Results"])
+render_diagnostics_sidebar()
 
 if app_mode == "Upload Document":
     render_upload_page()
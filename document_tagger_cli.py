@@ -0,0 +1,188 @@
+"""
+Headless batch classifier for document-control shares.
+
+Walks a directory tree, classifies every supported file with the same extraction and
+Gemini pipeline as the Streamlit app, and appends one JSON line per file to the output.
+The output file doubles as the checkpoint: rerunning the same command skips every file
+already recorded with the same size and modification time, so an interrupted run resumes
+where it stopped. Files recorded with status Error are tried again; the last line written
+for a path is its current result.
+
+Usage:
+    export GOOGLE_API_KEY="YOUR_API_KEY"
+    python document_tagger_cli.py /mnt/doc-control --output results.jsonl --workers 8 --llm-concurrency 8
+
+    # Offline load test: no API key or network, deterministic answers with injected latency and 429s
+    FAKE_LLM_LATENCY_MS=800,2500 FAKE_LLM_THROTTLE_RATE=0.05 python document_tagger_cli.py ./samples --llm-backend fake
+"""
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import logging
+
+from document_classifier import (
+    DEFAULT_EXTRACTION_WORKERS, DEFAULT_LLM_CONCURRENCY, DEFAULT_CONFIDENCE_THRESHOLD,
+    analyze_documents_pipelined, get_classification_cache, get_local_classifier, get_api_call_count
+)
+from llm_scheduler import get_llm_scheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from pipeline_metrics import get_metrics_registry, serve_metrics_from_env
+from gemini_client import LLM_BACKEND_NAMES, create_llm_backend, get_llm_backend, set_llm_backend
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".xlsx", ".txt")
+CHECKPOINT_FSYNC_INTERVAL = 50  # fsync the output every N results so a crash loses little work
+
+logger = logging.getLogger("document_tagger_cli")
+
+
+def file_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def load_checkpoint(output_path: str) -> dict:
+    """
+    Returns {relative_path: fingerprint} for every result already written to the output.
+    Error results (failed AI calls, quota or network errors) are left out, so a resumed run
+    tries those files again; the new line supersedes the old one.
+    """
+    completed = {}
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A torn last line from an interrupted run; the file is simply redone
+            if entry.get("status") == "Error":
+                completed.pop(entry["path"], None)
+            else:
+                completed[entry["path"]] = {"size": entry.get("size"), "mtime": entry.get("mtime")}
+    return completed
+
+
+def iter_documents(root: str, extensions: tuple[str, ...]):
+    """Yields relative paths of supported files under root, in a stable order."""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.relpath(os.path.join(directory, filename), root)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Directory tree to classify")
+    parser.add_argument("--output", default="classification_results.jsonl", help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google AI API key (default: $GOOGLE_API_KEY)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_EXTRACTION_WORKERS, help="Parallel extraction workers")
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_LLM_CONCURRENCY, help="Concurrent Gemini requests")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="Gemini request quota to pace calls at")
+    parser.add_argument("--tokens-per-minute", type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="Gemini token quota to pace calls at")
+    parser.add_argument("--llm-backend", choices=LLM_BACKEND_NAMES, help="gemini, fake (offline stand-in), record or replay (default: $LLM_BACKEND or gemini)")
+    parser.add_argument("--async-llm", action="store_true", help="Run Gemini calls on an asyncio event loop instead of a thread per request")
+    parser.add_argument("--no-batching", action="store_true", help="Send every document in its own Gemini request")
+    parser.add_argument("--no-preclassifier", action="store_true", help="Send every document to Gemini, even obvious ones")
+    parser.add_argument("--preclassifier-threshold", type=int, default=DEFAULT_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--extensions", default=",".join(SUPPORTED_EXTENSIONS), help="Comma-separated file extensions to include")
+    parser.add_argument("--metrics-file", help="Write per-stage metrics in Prometheus text format to this file when done")
+    parser.add_argument("--trace-file", help="Append one JSON line per pipeline stage execution to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.llm_backend:
+        set_llm_backend(create_llm_backend(args.llm_backend))
+    if not args.api_key and get_llm_backend().needs_api_key:
+        parser.error("No API key. Set GOOGLE_API_KEY or pass --api-key.")
+    if not os.path.isdir(args.root):
+        parser.error(f"Not a directory: {args.root}")
+
+    extensions = tuple(ext.strip().lower() if ext.strip().startswith(".") else "." + ext.strip().lower()
+                       for ext in args.extensions.split(",") if ext.strip())
+    completed = load_checkpoint(args.output)
+    fingerprints = {}
+    skipped = 0
+
+    def pending_documents():
+        nonlocal skipped
+        for relative_path in iter_documents(args.root, extensions):
+            full_path = os.path.join(args.root, relative_path)
+            try:
+                fingerprint = file_fingerprint(full_path)
+            except OSError as e:
+                logger.warning(f"Skipping '{relative_path}': {e}")
+                continue
+            if completed.get(relative_path) == fingerprint:
+                skipped += 1
+                continue
+            fingerprints[relative_path] = fingerprint
+            yield relative_path, pathlib.Path(full_path)  # Read in place by the extractors, never loaded whole
+
+    metrics = get_metrics_registry()
+    serve_metrics_from_env()
+    if args.trace_file:
+        metrics.set_trace_file(args.trace_file)
+    scheduler = get_llm_scheduler()
+    scheduler.configure(requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute)
+    cache = get_classification_cache()
+    local_classifier = get_local_classifier()
+    cache_hits_before, api_calls_before = cache.hits, get_api_call_count()
+    local_hits_before = local_classifier.snapshot()["hits"]
+    processed = errors = bytes_processed = 0
+    context_tokens = baseline_tokens = 0
+    started = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as output:
+        results = analyze_documents_pipelined(
+            pending_documents(), args.api_key or "offline", args.workers, args.llm_concurrency,
+            batch_small_documents=not args.no_batching,
+            preclassify_threshold=None if args.no_preclassifier else args.preclassifier_threshold,
+            async_llm=args.async_llm,
+        )
+        try:
+            for relative_path, record in results:
+                fingerprint = fingerprints.pop(relative_path)
+                record.pop("extracted_text", None)
+                record.pop("minhash", None)
+                output.write(json.dumps({"path": relative_path, **fingerprint, **record}) + "\n")
+                processed += 1
+                errors += record["status"] == "Error"
+                bytes_processed += fingerprint["size"]
+                context_tokens += record.get("context_tokens") or 0
+                baseline_tokens += record.get("baseline_tokens") or 0
+                if processed % CHECKPOINT_FSYNC_INTERVAL == 0:
+                    output.flush()
+                    os.fsync(output.fileno())
+                    elapsed = time.perf_counter() - started
+                    print(f"{processed} files done ({processed / elapsed:.1f} files/s)", file=sys.stderr)
+        except KeyboardInterrupt:
+            print("Interrupted. Rerun the same command to resume.", file=sys.stderr)
+        finally:
+            results.close()
+            output.flush()
+            os.fsync(output.fileno())
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(json.dumps({
+        "processed": processed, "skipped_from_checkpoint": skipped, "errors": errors,
+        "seconds": round(elapsed, 2), "files_per_sec": round(processed / elapsed, 2),
+        "mb_per_sec": round(bytes_processed / (1024 * 1024) / elapsed, 2),
+        "llm_calls": get_api_call_count() - api_calls_before, "cache_hits": cache.hits - cache_hits_before,
+        "local_classifier_hits": local_classifier.snapshot()["hits"] - local_hits_before,
+        "prompt_context_tokens": context_tokens, "first_8000_chars_tokens_estimate": baseline_tokens,
+        "llm_retries": scheduler.snapshot()["retries"], "llm_throttled": scheduler.snapshot()["throttled"],
+        "llm_backend": get_llm_backend().name,
+        "stages": {f"{row['stage']}/{row['file_type']}": {key: row[key] for key in ("count", "errors", "p50_ms", "p95_ms", "total_seconds")}
+                   for row in metrics.snapshot()},
+    }, indent=2))
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
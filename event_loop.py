@@ -0,0 +1,27 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Coroutine
+
+# --- Background Event Loop ---
+# One asyncio loop per process, running in a daemon thread and shared by every session.
+# Synchronous code (Streamlit scripts and callbacks, the pipeline coordinator, the CLI)
+# hands coroutines to it with submit() and gets a concurrent.futures.Future back, so
+# hundreds of LLM requests can be in flight on a single thread.
+
+_loop_lock = threading.Lock()
+_loop = None
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+def submit(coroutine: Coroutine) -> Future:
+    """Schedules coroutine on the shared loop; the returned Future works with concurrent.futures.wait()."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_background_loop())
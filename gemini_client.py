@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+import google.generativeai as genai
+
+from llm_backends import LLMBackend, FakeGeminiBackend, RecordingBackend, ReplayBackend, DEFAULT_RECORDINGS_DIR
+
+# --- Shared Gemini Models ---
+# genai.configure() throws away the SDK's cached service clients (and with them the open
+# gRPC channel), so calling it per document meant a new connection and TLS handshake for
+# every request. Models are instead created once per (model, generation config, safety
+# settings) and reused by every document, session and Streamlit rerun in the process.
+# The SDK keeps one API key per process, so switching keys reconfigures it and drops the
+# models bound to the old key.
+
+def _registry_key(model_name: str, generation_config, safety_settings) -> tuple:
+    return (model_name, json.dumps(generation_config, sort_keys=True, default=str),
+            json.dumps(safety_settings, sort_keys=True, default=str))
+
+class GeminiBackend(LLMBackend):
+    """The Gemini API through google.generativeai."""
+    name = "gemini"
+    needs_api_key = True
+    real_responses = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured_api_key = None
+        self._models = {}
+
+    def get_model(self, api_key, model_name, generation_config=None, safety_settings=None) -> genai.GenerativeModel:
+        key = _registry_key(model_name, generation_config, safety_settings)
+        with self._lock:
+            if api_key != self._configured_api_key:
+                genai.configure(api_key=api_key)
+                self._configured_api_key = api_key
+                self._models.clear()
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config,
+                                              safety_settings=safety_settings)
+                self._models[key] = model
+            return model
+
+    def reset(self) -> None:
+        with self._lock:
+            self._configured_api_key = None
+            self._models.clear()
+
+# --- Backend Selection ---
+# LLM_BACKEND picks the process-wide backend: "gemini" (default), "fake" (offline stand-in,
+# see llm_backends.FakeLLMServer for its FAKE_LLM_* settings), "record" (real API, responses
+# saved to LLM_RECORDINGS_DIR) or "replay" (answers from LLM_RECORDINGS_DIR, no network).
+LLM_BACKEND_NAMES = ("gemini", "fake", "record", "replay")
+
+_backend_lock = threading.Lock()
+_backend = None
+
+def create_llm_backend(name: str, recordings_dir: str | None = None) -> LLMBackend:
+    recordings_dir = recordings_dir or os.environ.get("LLM_RECORDINGS_DIR", DEFAULT_RECORDINGS_DIR)
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "fake":
+        return FakeGeminiBackend()
+    if name == "record":
+        return RecordingBackend(GeminiBackend(), recordings_dir)
+    if name == "replay":
+        return ReplayBackend(recordings_dir)
+    raise ValueError(f"Unknown LLM backend '{name}', expected one of {', '.join(LLM_BACKEND_NAMES)}")
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_llm_backend(os.environ.get("LLM_BACKEND", "gemini").strip().lower())
+        return _backend
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    """Replaces the process-wide backend (for benchmarks and load tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def get_generative_model(api_key: str, model_name: str, generation_config: dict | None = None,
+                         safety_settings: list | None = None) -> genai.GenerativeModel:
+    """Returns the shared model for this configuration from the active backend (see LLM_BACKEND)."""
+    return get_llm_backend().get_model(api_key, model_name, generation_config, safety_settings)
+
+def reset_generative_models() -> None:
+    """Drops every shared model of the active backend (the next call reconfigures the client)."""
+    get_llm_backend().reset()
@@ -0,0 +1,236 @@
+"""
+Analysis worker: claims tasks from the durable job queue (analysis_jobs.py), runs them
+through the same extraction and classification pipeline as the app, and writes each result
+to the results store. The Streamlit app only enqueues uploads and polls their progress.
+
+Run one or more workers next to the app, pointing at the same JOB_QUEUE_FILE, JOB_SPOOL_DIR
+and RESULTS_DB_FILE. Each --processes worker claims its own tasks, so adding workers adds
+throughput; a worker that dies leaves its tasks to be picked up again once their lease ends.
+
+Usage:
+    export GOOGLE_API_KEY="YOUR_API_KEY"
+    python job_worker.py --processes 2
+"""
+import os
+import sys
+import uuid
+import pathlib
+import time
+import signal
+import socket
+import argparse
+import logging
+import threading
+import multiprocessing
+
+from analysis_jobs import get_job_queue, HEARTBEAT_SECONDS
+from document_classifier import (
+    DEFAULT_EXTRACTION_WORKERS, DEFAULT_LLM_CONCURRENCY,
+    analyze_documents_pipelined, get_classification_cache, get_local_classifier, get_results_store
+)
+from gemini_client import LLM_BACKEND_NAMES, create_llm_backend, get_llm_backend, set_llm_backend
+from llm_scheduler import get_llm_scheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from pipeline_metrics import get_metrics_registry
+
+POLL_SECONDS = 2.0
+# Job options a worker passes on to analyze_documents_pipelined; anything else in a job is ignored.
+PIPELINE_OPTIONS = ("extraction_workers", "llm_concurrency", "batch_small_documents", "preclassify_threshold",
+                    "async_llm", "pre_extracted", "near_duplicate_threshold")
+
+logger = logging.getLogger("job_worker")
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def apply_quota_share(queue, options: dict) -> None:
+    """
+    Paces this process at its share of the job's quota: the requests and tokens per minute set
+    in the app (or the defaults) divided by the number of live workers, so together they stay
+    within the quota however many workers run.
+    """
+    workers = max(1, len(queue.live_workers()))
+    requests_per_minute = options.get("requests_per_minute") or DEFAULT_REQUESTS_PER_MINUTE
+    tokens_per_minute = options.get("tokens_per_minute") or DEFAULT_TOKENS_PER_MINUTE
+    get_llm_scheduler().configure(requests_per_minute=requests_per_minute / workers, tokens_per_minute=tokens_per_minute / workers)
+
+
+def _worker_counters() -> dict:
+    scheduler = get_llm_scheduler().snapshot()
+    cache = get_classification_cache()
+    return {"llm_calls": scheduler["calls"], "llm_retries": scheduler["retries"], "llm_throttled": scheduler["throttled"],
+            "cache_hits": cache.hits, "cache_misses": cache.misses}
+
+
+def publish_stats(queue, worker_id: str, state: dict) -> None:
+    """
+    Publishes this process's pipeline metrics and counters to the job queue, where the app's
+    diagnostics add up all workers. state holds the last reset seen and the counters at that
+    time; after a reset in the app the registry is cleared and counting starts over.
+    """
+    reset_at = queue.stats_reset_at()
+    counters = _worker_counters()
+    if reset_at > state["reset_seen"]:
+        get_metrics_registry().reset()
+        state["reset_seen"], state["baseline"] = reset_at, counters
+    published = {key: value - state["baseline"].get(key, 0) for key, value in counters.items()}
+    queue.publish_worker_stats(worker_id, get_metrics_registry().export_state(), published, state["reset_seen"])
+
+
+def process_claimed_tasks(queue, store, api_key: str, worker_id: str, job: dict, tasks: list[dict]) -> int:
+    """Runs one claimed batch of a job through the pipeline. Returns the number of tasks finished."""
+    tasks_by_name = {}
+    for task in tasks:
+        if task["filename"] in tasks_by_name:
+            queue.release_task(task["id"])  # Same name twice in a job: the second one waits for the next claim
+        else:
+            tasks_by_name[task["filename"]] = task
+    started = set()
+
+    def documents():
+        for filename, task in tasks_by_name.items():
+            if queue.task_status(task["id"]) != "claimed":
+                continue  # Cancelled since it was claimed
+            started.add(filename)
+            if task["source"] == "upload":
+                yield filename, pathlib.Path(queue.spool_path(task["content_hash"]))  # Read in place, not loaded whole
+                continue
+            stored = store.get(filename, include_text=True)
+            if stored and stored.get("extracted_text"):
+                yield filename, stored["extracted_text"]
+            else:
+                queue.complete(task["id"], worker_id, {"status": "Error", "category": "Error", "confidence": 0,
+                                                        "reasoning": "The document or its stored text no longer exists."})
+
+    def on_stage(filename: str, stage: str):
+        queue.set_task_status(tasks_by_name[filename]["id"], stage)
+
+    def on_ocr_progress(filename: str, pages_done: int, total_pages: int):
+        if pages_done < total_pages:
+            queue.set_task_status(tasks_by_name[filename]["id"], "ocr", f"OCR page {pages_done + 1} of {total_pages}")
+        else:
+            queue.set_task_status(tasks_by_name[filename]["id"], "extracting")
+
+    apply_quota_share(queue, job["options"])
+    options = {key: value for key, value in job["options"].items() if key in PIPELINE_OPTIONS}
+    results = analyze_documents_pipelined(documents(), api_key, on_stage=on_stage, on_ocr_progress=on_ocr_progress, **options)
+    finished = 0
+    try:
+        for filename, record in results:
+            task = tasks_by_name[filename]
+            if record["category"] == "Error" and queue.retry(task["id"], record["reasoning"]):
+                continue  # The AI call failed; the file is tried again later, possibly by another worker
+            if task["content_hash"]:
+                record["content_hash"] = task["content_hash"]
+            else:
+                previous = store.get(filename)
+                record["content_hash"] = previous.get("content_hash") if previous else None
+            store.upsert(record)
+            queue.complete(task["id"], worker_id, record)
+            finished += 1
+    finally:
+        results.close()
+        for filename, task in tasks_by_name.items():
+            if filename not in started:
+                queue.release_task(task["id"])  # Claimed but never started (e.g. on shutdown)
+    return finished
+
+
+def run_worker(api_key: str, claim_size: int, idle_exit_seconds: float | None = None) -> None:
+    """Claims and processes tasks until interrupted, or until the queue stays empty for idle_exit_seconds."""
+    queue = get_job_queue()
+    store = get_results_store()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stopping = threading.Event()
+    stats_state = {"reset_seen": queue.stats_reset_at(), "baseline": {}}
+    current_job = {}  # Options of the job being processed, to re-share its quota as workers come and go
+
+    def send_heartbeats():
+        while not stopping.is_set():
+            try:
+                queue.heartbeat(worker_id)
+                publish_stats(queue, worker_id, stats_state)
+                if "options" in current_job:
+                    apply_quota_share(queue, current_job["options"])
+            except Exception as e:
+                logger.warning(f"Heartbeat failed: {e}")
+            stopping.wait(HEARTBEAT_SECONDS)
+
+    heartbeat_thread = threading.Thread(target=send_heartbeats, name="heartbeat", daemon=True)
+    heartbeat_thread.start()
+    logger.info(f"Worker {worker_id} started")
+    idle_since = time.monotonic()
+    try:
+        while True:
+            get_local_classifier().refresh()
+            claimed = queue.claim(worker_id, claim_size)
+            if claimed is None:
+                if idle_exit_seconds is not None and time.monotonic() - idle_since > idle_exit_seconds:
+                    logger.info(f"Worker {worker_id} idle for {idle_exit_seconds:.0f} s; exiting")
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            job, tasks = claimed
+            current_job["options"] = job["options"]
+            finished = process_claimed_tasks(queue, store, api_key, worker_id, job, tasks)
+            logger.info(f"Job {job['id']}: finished {finished} of {len(tasks)} claimed tasks")
+            queue.release_spool()
+            idle_since = time.monotonic()
+    except KeyboardInterrupt:
+        logger.info(f"Worker {worker_id} stopping")
+    finally:
+        stopping.set()
+        heartbeat_thread.join()
+        try:
+            publish_stats(queue, worker_id, stats_state)  # The totals outlive the worker
+        except Exception as e:
+            logger.warning(f"Could not publish final statistics: {e}")
+        queue.unregister_worker(worker_id)
+
+
+def _worker_process(api_key: str, claim_size: int, idle_exit_seconds: float | None, llm_backend: str | None, verbose: bool) -> None:
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    if llm_backend:
+        set_llm_backend(create_llm_backend(llm_backend))
+    run_worker(api_key, claim_size, idle_exit_seconds)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google AI API key (default: $GOOGLE_API_KEY)")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to run")
+    parser.add_argument("--claim-size", type=int, default=2 * (DEFAULT_EXTRACTION_WORKERS + DEFAULT_LLM_CONCURRENCY),
+                        help="Tasks a worker claims at a time")
+    parser.add_argument("--idle-exit", type=float, help="Exit after the queue has been empty this many seconds (default: run until stopped)")
+    parser.add_argument("--llm-backend", choices=LLM_BACKEND_NAMES, help="gemini, fake (offline stand-in), record or replay (default: $LLM_BACKEND or gemini)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.llm_backend:
+        set_llm_backend(create_llm_backend(args.llm_backend))
+    if not args.api_key and get_llm_backend().needs_api_key:
+        parser.error("No API key. Set GOOGLE_API_KEY or pass --api-key.")
+
+    worker_args = (args.api_key or "offline", args.claim_size, args.idle_exit, args.llm_backend, args.verbose)
+    if args.processes <= 1:
+        _worker_process(*worker_args)
+        return 0
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_process, args=worker_args, name=f"job-worker-{index}") for index in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
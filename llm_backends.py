@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import time
+import math
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter, deque
+from types import SimpleNamespace
+
+from google.api_core import exceptions as api_exceptions
+
+from llm_scheduler import estimate_tokens
+
+# --- LLM Backends ---
+# Everything that talks to the LLM gets its model from gemini_client.get_generative_model(),
+# which asks the active backend. A backend hands out model objects with the subset of the
+# google.generativeai GenerativeModel API the apps use:
+#     generate_content(prompt, request_options=None) -> response with .text and .usage_metadata
+#     generate_content_async(prompt, request_options=None) -> the same, awaitable
+#     count_tokens(text) -> object with .total_tokens
+# Select one with LLM_BACKEND=gemini (default) | fake | record | replay.
+
+DEFAULT_RECORDINGS_DIR = "llm_recordings"
+
+
+class LLMBackend:
+    """Base class: returns models for a (model, generation config, safety settings) configuration."""
+    name = "base"
+    needs_api_key = False
+    # False for synthetic output, which must not end up in the classification cache next to real results
+    real_responses = False
+
+    def get_model(self, api_key: str, model_name: str, generation_config: dict | None = None, safety_settings: list | None = None):
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Drops any shared models or state."""
+
+
+def request_fingerprint(model_name: str, generation_config, prompt: str) -> str:
+    """Stable id of a request, used to derive fake output and to name recordings."""
+    payload = json.dumps([model_name, generation_config, prompt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FakeResponse:
+    """Stands in for GenerateContentResponse: .text, .candidates, .prompt_feedback and .usage_metadata."""
+
+    def __init__(self, text: str, prompt_tokens: int = 0):
+        self.text = text
+        self.candidates = [text] if text else []
+        self.prompt_feedback = None
+        output_tokens = estimate_tokens(text)
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+                                              total_token_count=prompt_tokens + output_tokens)
+
+
+# --- Offline Stand-in ---
+
+_WORD = re.compile(r"[a-zA-Z][a-zA-Z\-]{3,}")
+_CATEGORY_LIST = re.compile(r'\[\s*"[^\]]*"\s*\]')
+_DOCUMENT_BLOCK = re.compile(r"=== DOCUMENT id=(\d+) ===\n(.*?)\n=== END DOCUMENT id=\1 ===", re.S)
+_DELIMITED_TEXT = re.compile(r"---\n(.*)\n\s*---", re.S)
+_DATE = re.compile(r"\b\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\b")
+_COMMON_WORDS = frozenset("this that with from have will shall should were been into their there which document page text "
+                          "title headings section opening excerpts captions table figure".split())  # Includes prompt_context labels
+
+
+def _stable_int(*parts) -> int:
+    return int(hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _top_words(text: str, count: int) -> list[str]:
+    words = Counter(word.lower() for word in _WORD.findall(text) if word.lower() not in _COMMON_WORDS)
+    return [word for word, _ in sorted(words.items(), key=lambda item: (-item[1], item[0]))[:count]]
+
+
+def fake_classification(text: str, categories: list[str]) -> dict:
+    """Deterministic classification: the category sharing most words with the text, else one picked by hash."""
+    digest = _stable_int(text)
+    words = Counter(word.lower() for word in _WORD.findall(text))
+    scores = [(sum(words[word.lower()] for word in _WORD.findall(category)), category) for category in categories]
+    best_score, category = max(scores, key=lambda item: item[0]) if scores else (0, "Other")
+    if not best_score and categories:
+        category = categories[digest % len(categories)]
+    confidence = (55 + digest % 41) if best_score else (25 + digest % 40)
+    return {"category": category, "confidence_score": confidence, "tags": _top_words(text, 6) or ["document"],
+            "reasoning": f"Offline stand-in: {best_score} words in common with '{category}'."}
+
+
+def fake_summary(text: str) -> str:
+    """Deterministic change request summary in the format the CR summarizer asks for."""
+    first_line = next((line.strip() for line in text.splitlines() if len(line.strip()) > 10), "N/A")
+    date = _DATE.search(text)
+    affected = ", ".join(_top_words(text, 3)) or "N/A"
+    return (f"This change request is due to {first_line[:80].rstrip('.')}, reported by N/A from N/A on "
+            f"{date.group() if date else 'N/A'}. It affects {affected}.")
+
+
+def fake_response_text(prompt: str, generation_config: dict | None) -> str:
+    """Derives the response from the prompt: JSON for classification prompts (batched or not), prose otherwise."""
+    json_mode = (generation_config or {}).get("response_mime_type") == "application/json"
+    document_match = _DELIMITED_TEXT.findall(prompt)
+    document_text = document_match[-1] if document_match else prompt
+    if not json_mode:
+        return fake_summary(document_text)
+    category_match = _CATEGORY_LIST.search(prompt)
+    categories = json.loads(category_match.group()) if category_match else ["Other"]
+    blocks = _DOCUMENT_BLOCK.findall(prompt)
+    if blocks:
+        return json.dumps([{"document_id": int(document_id), **fake_classification(text, categories)} for document_id, text in blocks])
+    return json.dumps(fake_classification(document_text, categories))
+
+
+class FakeLLMServer:
+    """
+    Shared state of the offline stand-in: latency distribution, injected failures and an
+    optional server-side quota (requests/min and concurrent requests) that answers 429 like
+    the real API. Draws are seeded from the request fingerprint and how often that request
+    was seen, so the outcome of each call does not depend on thread scheduling.
+    """
+
+    def __init__(self, median_latency_ms: float = 800, p95_latency_ms: float = 2000, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, max_concurrency: int = 0, requests_per_minute: int = 0, seed: int = 0):
+        self.median_latency_ms = median_latency_ms
+        # Lognormal latency: p95 = median * exp(1.645 * sigma)
+        self.latency_sigma = math.log(max(p95_latency_ms, median_latency_ms) / median_latency_ms) / 1.645 if median_latency_ms > 0 else 0.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._attempts = Counter()
+        self._window = deque()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "succeeded": 0, "throttled": 0, "errors": 0, "peak_in_flight": 0}
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMServer":
+        median_ms, _, p95_ms = os.environ.get("FAKE_LLM_LATENCY_MS", "800,2000").partition(",")
+        return cls(median_latency_ms=float(median_ms), p95_latency_ms=float(p95_ms or median_ms),
+                   error_rate=float(os.environ.get("FAKE_LLM_ERROR_RATE", "0")),
+                   throttle_rate=float(os.environ.get("FAKE_LLM_THROTTLE_RATE", "0")),
+                   max_concurrency=int(os.environ.get("FAKE_LLM_MAX_CONCURRENCY", "0")),
+                   requests_per_minute=int(os.environ.get("FAKE_LLM_REQUESTS_PER_MINUTE", "0")),
+                   seed=int(os.environ.get("FAKE_LLM_SEED", "0")))
+
+    def begin(self, fingerprint: str) -> float:
+        """Admits a request (or raises the injected error) and returns its latency in seconds."""
+        with self._lock:
+            attempt = self._attempts[fingerprint]
+            self._attempts[fingerprint] += 1
+            self.stats["requests"] += 1
+            rng = random.Random(f"{self.seed}:{fingerprint}:{attempt}")
+            now = time.monotonic()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            over_quota = ((self.max_concurrency and self.in_flight >= self.max_concurrency)
+                          or (self.requests_per_minute and len(self._window) >= self.requests_per_minute))
+            if over_quota or rng.random() < self.throttle_rate:
+                self.stats["throttled"] += 1
+                raise api_exceptions.ResourceExhausted("Fake LLM backend: quota exceeded")
+            if rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                raise api_exceptions.InternalServerError("Fake LLM backend: injected server error")
+            self._window.append(now)
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        return self.median_latency_ms / 1000.0 * math.exp(self.latency_sigma * rng.gauss(0, 1))
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["succeeded"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, in_flight=self.in_flight)
+
+
+class FakeGenerativeModel:
+    def __init__(self, server: FakeLLMServer, model_name: str, generation_config: dict | None):
+        self.server = server
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def _respond(self, prompt: str) -> FakeResponse:
+        return FakeResponse(fake_response_text(prompt, self.generation_config), estimate_tokens(prompt))
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        latency = self.server.begin(request_fingerprint(self.model_name, self.generation_config, prompt))
+        try:
+            time.sleep(latency)
+            return self._respond(prompt)
+        finally:
+            self.server.end()
+
+    async def generate_content_async(self, prompt: str, request_options=None) -> FakeResponse:
+        latency = self.server.begin(request_fingerprint(self.model_name, self.generation_config, prompt))
+        try:
+            await asyncio.sleep(latency)
+            return self._respond(prompt)
+        finally:
+            self.server.end()
+
+    def count_tokens(self, text: str):
+        return SimpleNamespace(total_tokens=estimate_tokens(text))
+
+
+class FakeGeminiBackend(LLMBackend):
+    """Offline stand-in for the Gemini API with deterministic output (see FakeLLMServer for latency and failures)."""
+    name = "fake"
+
+    def __init__(self, server: FakeLLMServer | None = None):
+        self.server = server or FakeLLMServer.from_env()
+
+    def get_model(self, api_key, model_name, generation_config=None, safety_settings=None):
+        return FakeGenerativeModel(self.server, model_name, generation_config)
+
+
+# --- Record / Replay ---
+
+def _write_recording(directory: str, fingerprint: str, entry: dict) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{fingerprint}.json")
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(temporary_path, path)
+
+
+class RecordingModel:
+    def __init__(self, model, directory: str, model_name: str, generation_config: dict | None):
+        self.model = model
+        self.directory = directory
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def _record(self, prompt: str, response, started: float) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        _write_recording(self.directory, request_fingerprint(self.model_name, self.generation_config, prompt), {
+            "model": self.model_name, "text": response.text, "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "prompt_tokens": getattr(usage, "prompt_token_count", None), "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    def generate_content(self, prompt: str, request_options=None):
+        started = time.perf_counter()
+        response = self.model.generate_content(prompt, request_options=request_options)
+        self._record(prompt, response, started)
+        return response
+
+    async def generate_content_async(self, prompt: str, request_options=None):
+        started = time.perf_counter()
+        response = await self.model.generate_content_async(prompt, request_options=request_options)
+        self._record(prompt, response, started)
+        return response
+
+    def count_tokens(self, text: str):
+        return self.model.count_tokens(text)
+
+
+class RecordingBackend(LLMBackend):
+    """Passes requests to another backend (normally the real API) and saves every successful response to directory."""
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, directory: str = DEFAULT_RECORDINGS_DIR):
+        self.inner = inner
+        self.directory = directory
+        self.needs_api_key = inner.needs_api_key
+        self.real_responses = inner.real_responses
+
+    def get_model(self, api_key, model_name, generation_config=None, safety_settings=None):
+        return RecordingModel(self.inner.get_model(api_key, model_name, generation_config, safety_settings),
+                              self.directory, model_name, generation_config)
+
+    def reset(self) -> None:
+        self.inner.reset()
+
+
+class ReplayMissError(LookupError):
+    """Raised when replaying a request that was never recorded."""
+
+
+class ReplayModel:
+    def __init__(self, backend: "ReplayBackend", model_name: str, generation_config: dict | None):
+        self.backend = backend
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def _lookup(self, prompt: str) -> tuple[dict, FakeResponse]:
+        fingerprint = request_fingerprint(self.model_name, self.generation_config, prompt)
+        path = os.path.join(self.backend.directory, f"{fingerprint}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(f"No recorded response for request {fingerprint[:12]} in '{self.backend.directory}'") from None
+        return entry, FakeResponse(entry["text"], entry.get("prompt_tokens") or estimate_tokens(prompt))
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        entry, response = self._lookup(prompt)
+        if self.backend.replay_latency:
+            time.sleep(entry.get("latency_ms", 0) / 1000.0)
+        return response
+
+    async def generate_content_async(self, prompt: str, request_options=None) -> FakeResponse:
+        entry, response = self._lookup(prompt)
+        if self.backend.replay_latency:
+            await asyncio.sleep(entry.get("latency_ms", 0) / 1000.0)
+        return response
+
+    def count_tokens(self, text: str):
+        return SimpleNamespace(total_tokens=estimate_tokens(text))
+
+
+class ReplayBackend(LLMBackend):
+    """Answers from responses saved by RecordingBackend, optionally with their recorded latency; no network."""
+    name = "replay"
+    real_responses = True
+
+    def __init__(self, directory: str = DEFAULT_RECORDINGS_DIR, replay_latency: bool = True):
+        self.directory = directory
+        self.replay_latency = replay_latency
+
+    def get_model(self, api_key, model_name, generation_config=None, safety_settings=None):
+        return ReplayModel(self, model_name, generation_config)
@@ -0,0 +1,331 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- Scheduler Defaults ---
+# Quotas are per API key and per project, so one scheduler is shared by every thread and
+# session in the process. Override them with the environment variables to match your tier.
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", "1000"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", "4000000"))
+# Ceiling for the adaptive concurrency limit. Thread-based callers are bounded by their pool
+# size anyway; the asyncio path can keep hundreds of requests in flight.
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "256"))
+ASYNC_POLL_SECONDS = 0.01  # How often coroutines waiting for a concurrency slot re-check
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_CALL_DEADLINE_SECONDS = 180.0  # Overall budget for one logical call, retries included
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 60.0
+
+RATE_DECREASE_FACTOR = 0.7  # Share of the current request rate kept after a throttling response
+RATE_INCREASE_STEP = 0.02  # Share of the configured rate regained per successful call
+MIN_RATE_FACTOR = 0.05
+
+THROTTLE_STATUS_CODES = {429, 503}  # The service is telling us to slow down
+RETRYABLE_STATUS_CODES = THROTTLE_STATUS_CODES | {500, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for rate limiting and packing batches."""
+    return len(text) // 4 + 1
+
+
+class CallDeadlineExceeded(TimeoutError):
+    """Raised when a call could not be started or completed before its deadline."""
+
+
+def error_status_code(error: BaseException) -> Optional[int]:
+    """HTTP status code of a Google API error (429 for ResourceExhausted, 503 for ServiceUnavailable, ...)."""
+    if isinstance(error, api_exceptions.GoogleAPICallError):
+        return error.code
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute. It holds at most burst_seconds
+    worth of tokens, so calls are paced evenly instead of spending a whole minute's quota
+    in the first second (which per-minute quotas reject for the rest of the minute).
+    acquire() blocks until the requested amount is available. A request larger than the
+    bucket waits for a full bucket and is then charged in full, leaving the balance negative;
+    later callers wait until that debt is refilled, so throughput never exceeds the rate.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 1.0):
+        self._lock = threading.Lock()
+        self.burst_seconds = burst_seconds
+        self.rate_per_minute = rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate_per_minute * self.burst_seconds / 60.0)
+
+    def set_rate(self, rate_per_minute: float) -> None:
+        with self._lock:
+            self._refill()
+            self.rate_per_minute = rate_per_minute
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Takes amount tokens and returns 0, or returns how many seconds to wait before trying again."""
+        with self._lock:
+            self._refill()
+            required = min(amount, self.capacity)  # An oversized request waits for a full bucket, then goes into debt
+            if self._tokens >= required:
+                self._tokens -= amount
+                return 0.0
+            return (required - self._tokens) * 60.0 / self.rate_per_minute
+
+    @staticmethod
+    def _check_deadline(wait_seconds: float, deadline: Optional[float]) -> None:
+        if deadline is not None and time.monotonic() + wait_seconds > deadline:
+            raise CallDeadlineExceeded("Rate limit would delay the call past its deadline")
+
+    def acquire(self, amount: float = 1.0, deadline: Optional[float] = None) -> None:
+        """Takes amount tokens, waiting as needed; raises CallDeadlineExceeded if that would pass deadline (monotonic)."""
+        while wait_seconds := self.try_acquire(amount):
+            self._check_deadline(wait_seconds, deadline)
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, amount: float = 1.0, deadline: Optional[float] = None) -> None:
+        while wait_seconds := self.try_acquire(amount):
+            self._check_deadline(wait_seconds, deadline)
+            await asyncio.sleep(wait_seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: every success raises the limit by 1/limit (about +1 per round of
+    requests), every throttling response halves it. Until the first throttle each success
+    adds a whole slot (slow start, doubling per round), so the asyncio path reaches hundreds
+    of requests in flight quickly. Only throttles from requests started after the last
+    decrease count, so one burst of 429s halves the limit once, not N times.
+    """
+
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = DEFAULT_MAX_CONCURRENCY):
+        self._condition = threading.Condition()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._slow_start = True
+
+    def try_acquire(self) -> Optional[float]:
+        """Takes a slot without waiting; returns the start time, or None if none is free."""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def acquire_async(self, deadline: Optional[float] = None) -> float:
+        while (started := self.try_acquire()) is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise CallDeadlineExceeded("No concurrency slot became free before the call deadline")
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+        return started
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Waits for a free slot and returns the start time to pass to on_success/on_throttle."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise CallDeadlineExceeded("No concurrency slot became free before the call deadline")
+                self._condition.wait(timeout)
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self.limit = min(self.max_limit, self.limit + (1.0 if self._slow_start else 1.0 / self.limit))
+            self._condition.notify_all()
+
+    def on_throttle(self, started: float) -> bool:
+        """Halves the limit unless the request predates the last decrease; returns whether it did."""
+        with self._condition:
+            if started < self._last_decrease:
+                return False
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = time.monotonic()
+            self._slow_start = False
+            return True
+
+
+class LLMCallScheduler:
+    """
+    Runs LLM calls under a requests/min and tokens/min budget with adaptive concurrency.
+    The configured rates are a ceiling: a throttling response (429/503) also cuts the pacing
+    rate to RATE_DECREASE_FACTOR of its current value, and each success wins back
+    RATE_INCREASE_STEP of the ceiling, so a quota set too high converges on the real one.
+    Throttling and transient server errors are retried with full-jitter exponential
+    backoff until max_retries or the call deadline; other errors are raised immediately.
+    """
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                 deadline_seconds: float = DEFAULT_CALL_DEADLINE_SECONDS):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._rate_factor = 1.0
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimiter(initial_limit=min(4, max_concurrency), max_limit=max_concurrency)
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0}
+
+    def configure(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        """Sets the quota ceilings (None keeps the current value)."""
+        with self._stats_lock:
+            if requests_per_minute and requests_per_minute != self.requests_per_minute:
+                self.requests_per_minute = requests_per_minute
+                self._rate_factor = 1.0
+            if tokens_per_minute and tokens_per_minute != self.tokens_per_minute:
+                self.tokens_per_minute = tokens_per_minute
+                self._rate_factor = 1.0
+            self._apply_rate_locked()
+
+    def _apply_rate_locked(self) -> None:
+        self.request_bucket.set_rate(self.requests_per_minute * self._rate_factor)
+        self.token_bucket.set_rate(self.tokens_per_minute * self._rate_factor)
+
+    def _on_success(self) -> None:
+        self.concurrency.on_success()
+        with self._stats_lock:
+            self.stats["succeeded"] += 1
+            if self._rate_factor < 1.0:
+                self._rate_factor = min(1.0, self._rate_factor + RATE_INCREASE_STEP)
+                self._apply_rate_locked()
+
+    def _on_throttle(self, started: float) -> None:
+        decreased = self.concurrency.on_throttle(started)
+        with self._stats_lock:
+            self.stats["throttled"] += 1
+            if decreased:
+                self._rate_factor = max(MIN_RATE_FACTOR, self._rate_factor * RATE_DECREASE_FACTOR)
+                self._apply_rate_locked()
+        if decreased:
+            logger.info(f"LLM service is throttling; reducing concurrency to {int(self.concurrency.limit)} "
+                        f"and pacing to {self.request_bucket.rate_per_minute:.0f} requests/min.")
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _handle_failure(self, error: Exception, attempt: int, started: float, deadline: float) -> Optional[float]:
+        """Books a failed attempt; returns the backoff before retrying, or None if the error should be raised."""
+        status = error_status_code(error)
+        if status in THROTTLE_STATUS_CODES:
+            self._on_throttle(started)
+        delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+        if status not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            self._count("failed")
+            return None
+        self._count("retries")
+        logger.info(f"LLM call failed with status {status}; retry {attempt + 1} of {self.max_retries} in {delay:.1f}s.")
+        return delay
+
+    def call(self, fn: Callable[[float], T], estimated_tokens: int = 1, deadline_seconds: Optional[float] = None) -> T:
+        """
+        Calls fn(remaining_seconds) once it fits the rate limits and concurrency limit and
+        returns its result. remaining_seconds is the time left before the deadline, for use
+        as the request timeout.
+        """
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                self.request_bucket.acquire(1, deadline)
+                self.token_bucket.acquire(estimated_tokens, deadline)
+                started = self.concurrency.acquire(deadline)
+            except CallDeadlineExceeded:
+                self._count("failed")
+                raise
+            try:
+                result = fn(max(1.0, deadline - time.monotonic()))
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, started, deadline)
+                if delay is None:
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            attempt += 1
+            time.sleep(delay)
+
+    async def call_async(self, fn: Callable[[float], Awaitable[T]], estimated_tokens: int = 1,
+                         deadline_seconds: Optional[float] = None) -> T:
+        """call() for coroutines: waits on the event loop instead of blocking a thread."""
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                await self.request_bucket.acquire_async(1, deadline)
+                await self.token_bucket.acquire_async(estimated_tokens, deadline)
+                started = await self.concurrency.acquire_async(deadline)
+            except CallDeadlineExceeded:
+                self._count("failed")
+                raise
+            try:
+                result = await fn(max(1.0, deadline - time.monotonic()))
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, started, deadline)
+                if delay is None:
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({"concurrency_limit": int(self.concurrency.limit), "in_flight": self.concurrency.in_flight,
+                      "requests_per_minute": self.requests_per_minute, "tokens_per_minute": self.tokens_per_minute,
+                      "paced_requests_per_minute": round(self.request_bucket.rate_per_minute, 1)})
+        return stats
+
+
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+def get_llm_scheduler() -> LLMCallScheduler:
+    """Returns the process-wide scheduler every Gemini call goes through."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMCallScheduler()
+        return _scheduler
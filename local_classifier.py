@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter
+
+# --- Pre-Classifier Configuration ---
+DEFAULT_EXAMPLES_FILE = "verified_examples.jsonl"
+DEFAULT_CONFIDENCE_THRESHOLD = 85
+MIN_MODEL_SIMILARITY = 0.2  # Below this cosine similarity the TF-IDF model has no opinion
+# The model's confidence is scaled down until the best match reaches this cosine similarity, so
+# a document that is merely closer to one weak centroid than to another is not a confident hit.
+CONFIDENT_MODEL_SIMILARITY = 0.5
+MIN_TRAINED_CATEGORIES = 2
+MIN_EXAMPLES_PER_CATEGORY = 3  # Categories with fewer verified examples are left out of the model
+HEAD_CHARS = 3000  # Keyword rules only look at the title/first page, not the whole document
+
+# Phrases that identify a category on their own when they appear in the filename or on the first page.
+# Lower-case phrases match in any case; patterns written with capitals are acronyms and match
+# case-sensitively, so "bom" or "eco-friendly" in running text is not taken as evidence.
+KEYWORD_RULES = {
+    "Bill of Materials (BOM)": [r"bill of materials?", r"\bBOM\b", r"parts? list"],
+    "Failure Mode and Effects Analysis (FMEA)": [r"\bD?P?FMEA\b", r"failure modes? and effects? analysis"],
+    "Engineering Change Request (ECR)": [r"engineering change request", r"\bECR\b"],
+    "Engineering Change Order (ECO)": [r"engineering change order", r"\bECO\b", r"\bECN\b"],
+    "Test Plan / Test Case": [r"test plan", r"test cases?", r"test specification"],
+    "Test Report / Validation Report": [r"test report", r"validation report", r"verification report"],
+    "Requirements Document (System/Software)": [r"requirements? (specification|document)", r"\b[SP]RS\b", r"\bSyRS\b"],
+    "Technical Specification": [r"technical specification", r"\bspec(ification)? sheet\b"],
+    "User Manual / Operator Guide": [r"user manual", r"operator('s)? (guide|manual)", r"installation guide"],
+    "Manufacturing Process Plan": [r"process plan", r"manufacturing plan", r"routing sheet"],
+    "Quality Inspection Report": [r"inspection report", r"first article inspection", r"\bFAI\b"],
+    "Supplier Qualification Document": [r"supplier qualification", r"supplier audit", r"\bPPAP\b"],
+    "Project Plan": [r"project plan", r"project schedule"],
+    "Risk Analysis Report": [r"risk analysis", r"risk assessment", r"hazard analysis"],
+    "CAD Drawing (2D/3D)": [r"\bdrawing (no|number)\b", r"\btitle block\b", r"\bscale 1:\d+"],
+}
+_COMPILED_RULES = {category: [re.compile(pattern, 0 if any(ch.isupper() for ch in pattern) else re.IGNORECASE) for pattern in patterns]
+                   for category, patterns in KEYWORD_RULES.items()}
+
+_TOKEN = re.compile(r"[a-zA-Z][a-zA-Z0-9\-]{2,}")
+_STOPWORDS = frozenset("""
+the and for with that this from are was were will shall should must have has had not but all any can its into
+than then they them their there these those which while what when where who whom why how our your you his her
+per via use used using been being also such may each other only more most some same both very page date rev
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens without stopwords or pure numbers."""
+    return [token for token in (match.group().lower() for match in _TOKEN.finditer(text)) if token not in _STOPWORDS]
+
+
+class TfidfCentroidModel:
+    """
+    Minimal TF-IDF nearest-centroid text classifier (pure Python, CPU only).
+    Each category is represented by the normalized mean TF-IDF vector of its examples;
+    a document is assigned to the centroid with the highest cosine similarity.
+    """
+
+    def __init__(self):
+        self.idf = {}
+        self.centroids = {}
+
+    def fit(self, texts: list[str], labels: list[str]) -> "TfidfCentroidModel":
+        token_counts = [Counter(tokenize(text)) for text in texts]
+        document_frequency = Counter(term for counts in token_counts for term in counts)
+        total = len(texts)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        sums = {}
+        for counts, label in zip(token_counts, labels):
+            centroid = sums.setdefault(label, Counter())
+            for term, weight in self._vectorize(counts).items():
+                centroid[term] += weight
+        self.centroids = {label: self._normalize(vector) for label, vector in sums.items()}
+        return self
+
+    def _vectorize(self, counts: Counter) -> dict:
+        vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        return self._normalize(vector)
+
+    @staticmethod
+    def _normalize(vector: dict) -> dict:
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def predict(self, text: str) -> list[tuple[str, float]]:
+        """Returns (category, cosine similarity) pairs, best first."""
+        vector = self._vectorize(Counter(tokenize(text)))
+        scores = [(label, sum(weight * centroid.get(term, 0.0) for term, weight in vector.items()))
+                  for label, centroid in self.centroids.items()]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    def top_terms(self, text: str, count: int) -> list[str]:
+        vector = self._vectorize(Counter(tokenize(text)))
+        return [term for term, _ in sorted(vector.items(), key=lambda item: item[1], reverse=True)[:count]]
+
+
+class LocalPreClassifier:
+    """
+    CPU-only first pass over PLM_DOCUMENT_TYPES that answers obvious documents without the LLM.
+    Combines keyword rules (filename and first page) with a TF-IDF model trained from documents
+    users marked "Manually Verified". classify() returns a result shaped like the Gemini response
+    when the combined confidence reaches the threshold, otherwise None.
+    """
+
+    def __init__(self, examples_path: str = DEFAULT_EXAMPLES_FILE, document_types: list[str] | None = None):
+        self.examples_path = examples_path
+        self.document_types = document_types
+        self._lock = threading.Lock()
+        self._examples = []
+        self._model = None
+        self._model_dirty = False
+        self.stats = {"documents": 0, "hits": 0, "local_seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0}
+        self._examples_read = 0  # Bytes of the examples file already loaded
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Loads examples appended to the examples file since it was last read, e.g. by the app
+        while a background worker keeps running. Returns the number of new examples.
+        """
+        with self._lock:
+            if not os.path.exists(self.examples_path) or os.path.getsize(self.examples_path) <= self._examples_read:
+                return 0
+            with open(self.examples_path, "r", encoding="utf-8") as f:
+                f.seek(self._examples_read)
+                chunk = f.read()
+            complete = chunk[:chunk.rfind("\n") + 1]  # A line still being written is picked up next time
+            new_examples = [json.loads(line) for line in complete.splitlines() if line.strip()]
+            self._examples_read += len(complete.encode("utf-8"))
+            self._examples.extend(new_examples)
+            self._model_dirty = self._model_dirty or bool(new_examples)
+            return len(new_examples)
+
+    # --- Training ---
+
+    def add_example(self, text: str, category: str, tags: list[str]) -> None:
+        """Records a manually verified document as training data (persisted to disk)."""
+        example = {"text": text[:HEAD_CHARS * 3], "category": category, "tags": tags}
+        with self._lock:
+            self._examples.append(example)
+            self._model_dirty = True
+            with open(self.examples_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(example) + "\n")
+            self._examples_read = os.path.getsize(self.examples_path)
+
+    def _get_model(self) -> TfidfCentroidModel | None:
+        with self._lock:
+            if self._model_dirty:
+                per_category = Counter(example["category"] for example in self._examples)
+                trained = [example for example in self._examples if per_category[example["category"]] >= MIN_EXAMPLES_PER_CATEGORY]
+                self._model = None
+                if len({example["category"] for example in trained}) >= MIN_TRAINED_CATEGORIES:
+                    self._model = TfidfCentroidModel().fit([example["text"] for example in trained],
+                                                          [example["category"] for example in trained])
+                self._model_dirty = False
+            return self._model
+
+    @property
+    def example_count(self) -> int:
+        return len(self._examples)
+
+    # --- Classification ---
+
+    def _rule_match(self, filename: str, text: str) -> tuple[str | None, int, str]:
+        """Returns (category, confidence, matched phrase) from the keyword rules."""
+        stem = os.path.splitext(filename)[0].replace("_", " ").replace("-", " ")
+        head = text[:HEAD_CHARS]
+        filename_hits, head_hits = {}, Counter()
+        for category, patterns in _COMPILED_RULES.items():
+            if self.document_types is not None and category not in self.document_types:
+                continue
+            for pattern in patterns:
+                filename_match = pattern.search(stem)
+                if filename_match and category not in filename_hits:
+                    filename_hits[category] = filename_match.group()
+                head_hits[category] += len(pattern.findall(head))
+
+        if len(filename_hits) == 1:
+            category, phrase = next(iter(filename_hits.items()))
+            confidence = 92 if head_hits[category] else 88
+            return category, confidence, f"filename contains '{phrase}'"
+        ranked = head_hits.most_common(2)
+        if ranked and ranked[0][1] >= 2 and (len(ranked) == 1 or ranked[1][1] == 0):
+            category, hits = ranked[0]
+            return category, min(90, 78 + 3 * hits), f"first page mentions the category {hits} times"
+        return None, 0, ""
+
+    def classify(self, filename: str, text: str, threshold: int = DEFAULT_CONFIDENCE_THRESHOLD) -> dict | None:
+        """Classifies a document locally, or returns None if it should go to the LLM."""
+        started = time.perf_counter()
+        result = None
+        try:
+            rule_category, rule_confidence, rule_reason = self._rule_match(filename, text)
+            model = self._get_model()
+            model_category, model_confidence = None, 0
+            if model is not None:
+                scores = model.predict(text[:HEAD_CHARS * 3])
+                if scores and scores[0][1] >= MIN_MODEL_SIMILARITY:
+                    best, second = scores[0][1], scores[1][1] if len(scores) > 1 else 0.0
+                    margin = best / (best + second)  # How clearly the best centroid wins
+                    closeness = min(1.0, best / CONFIDENT_MODEL_SIMILARITY)  # How similar the document is to it at all
+                    model_category, model_confidence = scores[0][0], min(95, int(100 * margin * closeness))
+
+            if rule_category and model_category and rule_category != model_category:
+                return None  # The two signals disagree: let the LLM decide
+            category = rule_category or model_category
+            confidence = max(rule_confidence, model_confidence)
+            if rule_category and model_category:
+                confidence = min(99, confidence + 5)
+            if not category or confidence < threshold:
+                return None
+
+            reasons = []
+            if rule_category:
+                reasons.append(rule_reason)
+            if model_category:
+                reasons.append(f"similar to {self.example_count} manually verified documents (model confidence {model_confidence}%)")
+            tags = model.top_terms(text, 6) if model is not None else [token for token, _ in Counter(tokenize(text[:HEAD_CHARS])).most_common(6)]
+            result = {
+                "category": category, "confidence_score": confidence, "tags": tags,
+                "reasoning": f"Classified locally without AI: {'; '.join(reasons)}.", "classifier": "local"
+            }
+            return result
+        finally:
+            with self._lock:
+                self.stats["documents"] += 1
+                self.stats["hits"] += result is not None
+                self.stats["local_seconds"] += time.perf_counter() - started
+
+    # --- Reporting ---
+
+    def record_llm_call(self, seconds: float) -> None:
+        with self._lock:
+            self.stats["llm_calls"] += 1
+            self.stats["llm_seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,74 @@
+import re
+import hashlib
+from array import array
+
+# --- Near-Duplicate Detection ---
+# Successive revisions and re-exports of a document share almost all of their text. Each
+# document gets a MinHash signature of its word shingles; the fraction of equal signature
+# slots estimates the Jaccard similarity of two shingle sets. Signatures use one-permutation
+# hashing (one hash per shingle, split into NUM_PERMUTATIONS bins, empty bins filled from
+# their neighbour), so building one costs a single pass over the text rather than a pass per
+# permutation. For sublinear lookups the signature is cut into LSH bands: documents that
+# share at least one band bucket are the only candidates compared. With 16 bands of 8 rows,
+# pairs at 0.8 similarity are found with ~95% probability and pairs at 0.9 almost always,
+# while pairs below 0.5 rarely become candidates at all.
+SHINGLE_WORDS = 5
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+MIN_SHINGLES = 20  # Shorter texts (cover pages, one-line files) are too generic to call duplicates
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+
+_HASH_BITS = 61
+# Borrowed bins are offset by their distance to the donor, so two documents only agree on a
+# borrowed bin when both borrowed the same value from the same distance.
+_BORROW_OFFSET = 1 << (_HASH_BITS - 6)
+_WORD = re.compile(r"\w+")
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", errors="replace"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set[int]:
+    """Hashed, lower-cased word n-grams of text."""
+    words = _WORD.findall(text.lower())
+    return {_hash64(" ".join(words[index:index + size])) >> (64 - _HASH_BITS) for index in range(len(words) - size + 1)}
+
+
+def minhash_signature(text: str) -> bytes | None:
+    """
+    NUM_PERMUTATIONS 64-bit MinHash values of the text's shingles, packed as bytes for storage.
+    Returns None when the text has fewer than MIN_SHINGLES shingles.
+    """
+    hashes = shingles(text)
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    bins = [None] * NUM_PERMUTATIONS
+    for value in hashes:
+        index, rest = value % NUM_PERMUTATIONS, value // NUM_PERMUTATIONS
+        if bins[index] is None or rest < bins[index]:
+            bins[index] = rest
+    filled = list(bins)
+    for index in range(NUM_PERMUTATIONS):
+        distance = 1
+        while filled[index] is None:
+            donor = bins[(index + distance) % NUM_PERMUTATIONS]
+            if donor is not None:
+                filled[index] = donor + distance * _BORROW_OFFSET
+            distance += 1
+    return array("Q", filled).tobytes()
+
+
+def estimate_similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    a, b = array("Q", signature_a), array("Q", signature_b)
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERMUTATIONS
+
+
+def lsh_band_keys(signature: bytes) -> list[int]:
+    """One bucket key per LSH band (signed 63-bit, so it fits an SQLite INTEGER)."""
+    band_bytes = LSH_ROWS * 8
+    return [int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * band_bytes:(band + 1) * band_bytes], digest_size=8).digest(),
+                           "little", signed=True) >> 1
+            for band in range(LSH_BANDS)]
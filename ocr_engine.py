@@ -0,0 +1,186 @@
+import os
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator, Optional
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from pipeline_metrics import get_metrics_registry
+from upload_spool import DocumentSource, copy_source, is_path
+
+# --- OCR Configuration ---
+# Each in-flight page is one rasterized image held by a worker process, so this caps peak memory.
+DEFAULT_OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+DEFAULT_MAX_IN_FLIGHT_PAGES = int(os.environ.get("OCR_MAX_IN_FLIGHT_PAGES", 2 * DEFAULT_OCR_WORKERS))
+DEFAULT_OCR_DPI = 200
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _init_ocr_worker():
+    # Tesseract is multi-threaded by default; with one process per core that oversubscribes the CPU.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_page_range(pdf_path: str, first_page: int, last_page: int, dpi: int) -> tuple[list[str], float]:
+    """Worker: rasterizes pages first_page..last_page (1-based, inclusive) and OCRs them in order. Also returns the seconds spent."""
+    started = time.perf_counter()
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    try:
+        return [pytesseract.image_to_string(image) for image in images], time.perf_counter() - started
+    finally:
+        for image in images:
+            image.close()
+
+
+def get_ocr_pool(workers: int = DEFAULT_OCR_WORKERS) -> ProcessPoolExecutor:
+    """
+    Returns the shared OCR process pool, creating it on first use.
+    The pool is shared by every document so concurrent uploads cannot start more
+    OCR processes than there are cores. Uses 'spawn' so the (threaded) Streamlit
+    server process is never forked.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_ocr_worker)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class PdfOcrSession:
+    """
+    OCR access to one PDF, used as a context manager.
+    A PDF given as bytes or a stream is spooled to a temporary file once (a path is used as
+    is); worker processes then rasterize and OCR bounded page ranges from it, so page images
+    never have to be pickled between processes and the document is not re-spooled for every
+    batch of pages.
+    """
+
+    def __init__(self, source: DocumentSource, max_in_flight_pages: int = DEFAULT_MAX_IN_FLIGHT_PAGES,
+                 workers: int = DEFAULT_OCR_WORKERS, dpi: int = DEFAULT_OCR_DPI):
+        self.max_in_flight_pages = max(1, max_in_flight_pages)
+        self.workers = workers
+        self.dpi = dpi
+        self._owns_file = not is_path(source)
+        if self._owns_file:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+                copy_source(source, spool)
+                self.pdf_path = spool.name
+        else:
+            self.pdf_path = os.fspath(source)
+        self._page_count = None
+
+    @property
+    def page_count(self) -> int:
+        if self._page_count is None:
+            self._page_count = int(pdfinfo_from_path(self.pdf_path)["Pages"])
+        return self._page_count
+
+    def iter_pages(self, page_numbers: Optional[list[int]] = None, pages_per_task: int = 1,
+                   on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+        """
+        Streams the OCR text of the given 1-based page numbers (default: every page) in the order given.
+        At most max_in_flight_pages pages are rasterized at any time.
+        on_progress(pages_done, total_pages) is called as pages complete.
+        """
+        if page_numbers is None:
+            page_numbers = list(range(1, self.page_count + 1))
+        pages_per_task = max(1, pages_per_task)
+        max_in_flight_tasks = max(1, self.max_in_flight_pages // pages_per_task)
+        ranges = _group_page_ranges(page_numbers, pages_per_task)
+        pool = get_ocr_pool(self.workers)
+        metrics = get_metrics_registry()
+
+        pending = {}
+        finished = {}
+        next_range = 0
+        next_to_emit = 0
+        pages_done = 0
+        try:
+            while next_to_emit < len(ranges):
+                while next_range < len(ranges) and len(pending) < max_in_flight_tasks:
+                    first, last = ranges[next_range]
+                    pending[pool.submit(_ocr_page_range, self.pdf_path, first, last, self.dpi)] = next_range
+                    next_range += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    range_index = pending.pop(future)
+                    try:
+                        page_texts, seconds = future.result()
+                    except Exception:
+                        metrics.record("ocr_page", 0.0, "error")
+                        raise
+                    # Worker time (rasterize + OCR) per page, attributed to the document being extracted
+                    for page_text in page_texts:
+                        metrics.record("ocr_page", seconds / max(1, len(page_texts)), chars=len(page_text))
+                    finished[range_index] = page_texts
+                    first, last = ranges[range_index]
+                    pages_done += last - first + 1
+                    if on_progress:
+                        on_progress(pages_done, len(page_numbers))
+
+                # Emit the contiguous run of finished ranges so output stays in page order.
+                while next_to_emit in finished:
+                    for page_text in finished.pop(next_to_emit):
+                        yield page_text
+                    next_to_emit += 1
+        except BrokenProcessPool:
+            _reset_ocr_pool()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        if self._owns_file and os.path.exists(self.pdf_path):
+            os.remove(self.pdf_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _group_page_ranges(page_numbers: list[int], pages_per_task: int) -> list[tuple[int, int]]:
+    """Groups page numbers into consecutive (first, last) runs of at most pages_per_task pages."""
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and page_number == ranges[-1][1] + 1 and page_number - ranges[-1][0] < pages_per_task:
+            ranges[-1] = (ranges[-1][0], page_number)
+        else:
+            ranges.append((page_number, page_number))
+    return ranges
+
+
+def iter_ocr_pages(source: DocumentSource, max_in_flight_pages: int = DEFAULT_MAX_IN_FLIGHT_PAGES,
+                   workers: int = DEFAULT_OCR_WORKERS, dpi: int = DEFAULT_OCR_DPI, pages_per_task: int = 1,
+                   on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Streams the OCR text of every page of a PDF, in page order."""
+    with PdfOcrSession(source, max_in_flight_pages, workers, dpi) as session:
+        yield from session.iter_pages(pages_per_task=pages_per_task, on_progress=on_progress)
+
+
+def ocr_pdf(source: DocumentSource, **kwargs) -> str:
+    """OCRs every page of a PDF and returns the text joined in page order."""
+    return "".join(page_text + "\n" for page_text in iter_ocr_pages(source, **kwargs))
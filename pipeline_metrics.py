@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Pipeline Metrics ---
+# Every stage of the classification pipeline (read, extract, OCR per page, near-duplicate
+# lookup, prompt build, LLM call, JSON parse) reports its duration, sizes and outcome
+# here. The registry keeps per (stage, file type) totals plus a window of recent durations
+# for percentiles, and a bounded trace of recent events. It is shown in the app's sidebar
+# and can be exported as Prometheus text (file or HTTP endpoint) and as a JSONL trace.
+#   PIPELINE_TRACE_FILE: append every event to this JSONL file
+#   PIPELINE_METRICS_PORT: serve Prometheus text on http://0.0.0.0:<port>/metrics (started by the
+#   app and the CLI through serve_metrics_from_env, never by pool or worker processes)
+PIPELINE_STAGES = ("read", "extract", "ocr_page", "near_duplicate", "prompt_build", "llm_call", "json_parse")
+DURATION_WINDOW = 2048  # Recent durations kept per (stage, file type) for percentiles
+TRACE_BUFFER = 5000  # Recent events kept in memory for the trace download
+QUANTILES = (0.5, 0.95, 0.99)
+COUNTED_FIELDS = ("bytes", "chars", "tokens")
+
+# The document a stage is working on. Set by the pipeline per worker thread / task, so stages
+# deep inside extraction or the Gemini client are attributed to the right file type.
+_current_document = contextvars.ContextVar("current_document", default=None)
+
+
+def file_type_of(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    return extension or "unknown"
+
+
+@contextmanager
+def document_context(document: str, file_type: str | None = None):
+    """Attributes the metrics recorded inside the block to document and its file type (by default its extension)."""
+    token = _current_document.set((document, file_type or file_type_of(document)))
+    try:
+        yield
+    finally:
+        _current_document.reset(token)
+
+
+def _quantile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class _StageStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.outcomes = {}
+        self.totals = dict.fromkeys(COUNTED_FIELDS, 0)
+        self.durations = deque(maxlen=DURATION_WINDOW)
+
+
+class MetricsRegistry:
+    """Thread-safe, in-process store of stage timings; shared by every session, worker and CLI run."""
+
+    def __init__(self, trace_file: str | None = None):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._trace = deque(maxlen=TRACE_BUFFER)
+        self._trace_file = None
+        self.started_at = time.time()
+        if trace_file:
+            self.set_trace_file(trace_file)
+
+    def set_trace_file(self, path: str | None) -> None:
+        """Appends every following event to path as one JSON line (None stops writing)."""
+        with self._lock:
+            if self._trace_file:
+                self._trace_file.close()
+            self._trace_file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    def record(self, stage: str, seconds: float, outcome: str = "ok", file_type: str | None = None,
+               document: str | None = None, **counts) -> None:
+        """Records one stage execution; counts may give bytes, chars and tokens handled."""
+        if document is None:
+            document, context_file_type = _current_document.get() or (None, None)
+            file_type = file_type or context_file_type
+        file_type = file_type or file_type_of(document)
+        event = {"ts": round(time.time(), 3), "stage": stage, "file_type": file_type, "document": document,
+                 "seconds": round(seconds, 6), "outcome": outcome,
+                 **{field: value for field, value in counts.items() if value is not None}}
+        with self._lock:
+            stats = self._stats.get((stage, file_type))
+            if stats is None:
+                stats = self._stats[(stage, file_type)] = _StageStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+            stats.durations.append(seconds)
+            for field in COUNTED_FIELDS:
+                if isinstance(counts.get(field), (int, float)):
+                    stats.totals[field] += counts[field]
+            self._trace.append(event)
+            if self._trace_file:
+                self._trace_file.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def timed(self, stage: str, file_type: str | None = None, **counts) -> Iterator[dict]:
+        """
+        Times the block as one execution of stage. The yielded dict can be updated with counts
+        (bytes, chars, tokens) and an "outcome"; an exception records outcome "error" and propagates.
+        """
+        span = dict(counts)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span["outcome"] = "error"
+            raise
+        finally:
+            outcome = span.pop("outcome", "ok")
+            self.record(stage, time.perf_counter() - started, outcome, file_type, **span)
+
+    def snapshot(self) -> list[dict]:
+        """One row per (stage, file type): counts, outcomes, totals and duration percentiles in ms."""
+        stage_order = {stage: index for index, stage in enumerate(PIPELINE_STAGES)}
+        rows = []
+        with self._lock:
+            for (stage, file_type), stats in sorted(self._stats.items(), key=lambda item: (stage_order.get(item[0][0], 99), item[0])):
+                durations = sorted(stats.durations)
+                rows.append({
+                    "stage": stage, "file_type": file_type, "count": stats.count,
+                    "errors": stats.outcomes.get("error", 0), "outcomes": dict(stats.outcomes),
+                    "total_seconds": round(stats.seconds, 3), "mean_ms": round(stats.seconds / stats.count * 1000, 2),
+                    **{f"p{int(q * 100)}_ms": round(_quantile(durations, q) * 1000, 2) for q in QUANTILES},
+                    **stats.totals,
+                })
+        return rows
+
+    def export_state(self, trace_events: int | None = 1000) -> dict:
+        """A JSON-serializable copy of the totals, recent durations and last trace_events events (None: all), for merge_state()."""
+        with self._lock:
+            trace = list(self._trace)
+            return {
+                "stats": [{"stage": stage, "file_type": file_type, "count": stats.count, "seconds": stats.seconds,
+                           "outcomes": dict(stats.outcomes), "totals": dict(stats.totals), "durations": list(stats.durations)}
+                          for (stage, file_type), stats in self._stats.items()],
+                "trace": trace if trace_events is None else trace[max(0, len(trace) - trace_events):],
+            }
+
+    def merge_state(self, state: dict) -> None:
+        """Adds another registry's export_state() (e.g. a job worker's) to this one."""
+        with self._lock:
+            for item in state["stats"]:
+                key = (item["stage"], item["file_type"])
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _StageStats()
+                stats.count += item["count"]
+                stats.seconds += item["seconds"]
+                for outcome, count in item["outcomes"].items():
+                    stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + count
+                for field in COUNTED_FIELDS:
+                    stats.totals[field] += item["totals"].get(field, 0)
+                stats.durations.extend(item["durations"])
+            if state["trace"]:
+                self._trace = deque(sorted([*self._trace, *state["trace"]], key=lambda event: event["ts"]), maxlen=TRACE_BUFFER)
+
+    def recent_events(self) -> list[dict]:
+        with self._lock:
+            return list(self._trace)
+
+    def trace_jsonl(self) -> str:
+        return "".join(json.dumps(event) + "\n" for event in self.recent_events())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._trace.clear()
+            self.started_at = time.time()
+
+    def to_prometheus(self) -> str:
+        """The registry in Prometheus text exposition format."""
+        def labels(**values):
+            return "{" + ",".join(f'{key}="{str(value)}"' for key, value in values.items()) + "}"
+
+        with self._lock:
+            items = [(key, (stats.count, stats.seconds), sorted(stats.durations), dict(stats.outcomes), dict(stats.totals))
+                     for key, stats in sorted(self._stats.items())]
+        lines = ["# HELP pipeline_stage_duration_seconds Duration of classification pipeline stages (quantiles over recent executions).",
+                 "# TYPE pipeline_stage_duration_seconds summary"]
+        for (stage, file_type), (count, seconds), durations, _, _ in items:
+            for q in QUANTILES:
+                lines.append(f"pipeline_stage_duration_seconds{labels(stage=stage, file_type=file_type, quantile=q)} {_quantile(durations, q):.6f}")
+            lines.append(f"pipeline_stage_duration_seconds_sum{labels(stage=stage, file_type=file_type)} {seconds:.6f}")
+            lines.append(f"pipeline_stage_duration_seconds_count{labels(stage=stage, file_type=file_type)} {count}")
+        lines += ["# HELP pipeline_stage_outcomes_total Stage executions by outcome.", "# TYPE pipeline_stage_outcomes_total counter"]
+        for (stage, file_type), _, _, outcomes, _ in items:
+            for outcome, count in sorted(outcomes.items()):
+                lines.append(f"pipeline_stage_outcomes_total{labels(stage=stage, file_type=file_type, outcome=outcome)} {count}")
+        for field in COUNTED_FIELDS:
+            lines += [f"# HELP pipeline_stage_{field}_total {field.capitalize()} handled by each stage.", f"# TYPE pipeline_stage_{field}_total counter"]
+            for (stage, file_type), _, _, _, totals in items:
+                if totals[field]:
+                    lines.append(f"pipeline_stage_{field}_total{labels(stage=stage, file_type=file_type)} {totals[field]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Writes to_prometheus() atomically, e.g. for node_exporter's textfile collector."""
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary_path, path)
+
+
+_registry_lock = threading.Lock()
+_registry = None
+_metrics_server = None
+_serve_attempted = False
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(os.environ.get("PIPELINE_TRACE_FILE"))
+        return _registry
+
+
+def serve_metrics_from_env(render: Optional[Callable[[], str]] = None) -> ThreadingHTTPServer | None:
+    """
+    Starts the HTTP endpoint if PIPELINE_METRICS_PORT is set. A port that is already taken is
+    logged, not raised, so a second app or CLI process on the same host keeps working.
+    """
+    global _serve_attempted
+    port = os.environ.get("PIPELINE_METRICS_PORT")
+    with _registry_lock:
+        if not port or (_serve_attempted and _metrics_server is None):
+            return _metrics_server  # Not configured, or the port was taken on an earlier attempt
+        _serve_attempted = True
+    try:
+        return start_metrics_server(int(port), render=render)
+    except OSError as e:
+        logger.warning(f"Could not serve pipeline metrics on port {port}: {e}")
+        return None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", render: Optional[Callable[[], str]] = None) -> ThreadingHTTPServer:
+    """
+    Serves Prometheus text at /metrics from a daemon thread (once per process): render(), or
+    this process's registry by default.
+    """
+    render = render or (lambda: get_metrics_registry().to_prometheus())
+    global _metrics_server
+    with _registry_lock:
+        if _metrics_server is None:
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _metrics_server
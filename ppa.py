@@ -2,7 +2,9 @@ import streamlit as st
 import os
 from datetime import datetime
 import zipfile # For handling ZIP files
-import io      # For handling byte streams with ZIP files
+import shutil
+
+from upload_spool import COPY_CHUNK_SIZE, copy_source
 
 # --- Configuration and Constants ---
 # NOTE: expected_base_filename is now also in English for consistency
@@ -83,18 +85,17 @@ init_session_state()
 # --- Core Function for Saving and Logging ---
 def save_and_log_file(uploaded_file_obj, active_release_name, doc_item_config):
     uploaded_filename = uploaded_file_obj.name
-    file_bytes = uploaded_file_obj.getvalue()
-    
     final_file_content_to_save = None
+    zip_member_name = None  # The PDF inside an uploaded ZIP, copied out of the archive when saving
     final_target_extension = ".pdf" 
 
     original_name_part, original_extension = os.path.splitext(uploaded_filename)
 
     if original_extension.lower() == ".pdf":
-        final_file_content_to_save = file_bytes
+        final_file_content_to_save = uploaded_file_obj
     elif original_extension.lower() == ".zip":
         try:
-            with zipfile.ZipFile(io.BytesIO(file_bytes), 'r') as z:
+            with zipfile.ZipFile(uploaded_file_obj, 'r') as z: # Read in place; members are decompressed on demand
                 # expected_pdf_in_zip_basename must use the English version now
                 expected_pdf_in_zip_basename = (doc_item_config['expected_base_filename'] + ".pdf").lower()
                 found_pdf_path_in_zip = None
@@ -106,7 +107,7 @@ def save_and_log_file(uploaded_file_obj, active_release_name, doc_item_config):
                         break
                 
                 if found_pdf_path_in_zip:
-                    final_file_content_to_save = z.read(found_pdf_path_in_zip)
+                    final_file_content_to_save, zip_member_name = uploaded_file_obj, found_pdf_path_in_zip
                     st.info(f"Extracted '{os.path.basename(found_pdf_path_in_zip)}' from uploaded ZIP '{uploaded_filename}'.")
                 else:
                     st.error(f"Error: ZIP file '{uploaded_filename}' does not contain the expected PDF "
@@ -139,7 +140,12 @@ def save_and_log_file(uploaded_file_obj, active_release_name, doc_item_config):
         save_path = os.path.join(target_dir, new_filename)
 
         with open(save_path, "wb") as f:
-            f.write(final_file_content_to_save)
+            if zip_member_name:
+                # Decompressed straight into the destination file, without an intermediate copy
+                with zipfile.ZipFile(final_file_content_to_save) as z, z.open(zip_member_name) as member:
+                    shutil.copyfileobj(member, f, COPY_CHUNK_SIZE)
+            else:
+                copy_source(final_file_content_to_save, f)
         log_message = (f"{datetime.now().isoformat()} - Release: {active_release_name} - Uploaded: '{uploaded_filename}' "
                        f"for '{doc_item_config['display_name_EN']}' -> Saved as: '{new_filename}' in '{target_dir}'")
         with open(LOG_FILE, "a", encoding="utf-8") as log_f:
@@ -0,0 +1,183 @@
+import re
+from collections import Counter
+from typing import Callable
+
+from llm_scheduler import estimate_tokens
+
+# --- Context Builder Configuration ---
+# The first few thousand characters of a controlled document are mostly cover page,
+# revision table and page furniture. The classifier gets a cleaned, sampled view instead:
+# title, headings, table/figure captions, the opening section and excerpts from the rest.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1500
+HEADER_FOOTER_MAX_CHARS = 100  # Only short lines can be running headers/footers
+HEADER_FOOTER_MIN_REPEATS = 3
+TITLE_MAX_LINES = 3
+HEADING_MAX_CHARS = 80
+EXCERPT_CHARS = 400
+# Share of the budget each part may use, in the order they are filled.
+HEADINGS_SHARE = 0.2
+CAPTIONS_SHARE = 0.1
+OPENING_SECTION_SHARE = 0.4
+FIT_ATTEMPTS = 3
+
+_NUMBERS = re.compile(r"\d+")
+_INLINE_SPACE = re.compile(r"[ \t \f\v]+")
+_TOC_LEADER = re.compile(r"(\.{4,}|…{2,}|\s{2,})\s*\d+\s*$")
+_DATE = re.compile(r"\b(\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{1,2}[- ](jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[- ]\d{2,4})\b", re.I)
+_REVISION_HEADING = re.compile(r"^(revision|change|document|version|amendment)\s+(history|record|log|table|index)\b|^record of (revisions|changes)\b", re.I)
+_REVISION_ROW = re.compile(r"^(rev(ision)?\.?\s*)?[A-Z]{0,2}\d{0,3}[A-Z]?\b", re.I)
+_NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[A-Z]\.|appendix [A-Z0-9]+[.:]?|section \d+[.:]?)\s+[A-Z]", re.I)
+_CAPTION = re.compile(r"^(table|figure|fig\.|drawing|chart)\s*[A-Z]?[\d.\-]+\s*[:.\-–]?\s*\S", re.I)
+
+
+def normalize_lines(text: str) -> list[str]:
+    """Splits text into lines with runs of spaces collapsed and at most one blank line in a row."""
+    lines = []
+    for raw_line in text.splitlines():
+        line = _INLINE_SPACE.sub(" ", raw_line).strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return lines
+
+
+def strip_repeated_lines(lines: list[str], min_repeats: int = HEADER_FOOTER_MIN_REPEATS) -> list[str]:
+    """
+    Drops running headers/footers: short lines that repeat (ignoring page numbers and dates)
+    at least min_repeats times. Page number lines ("Page 3 of 12") are dropped entirely; for
+    text-only repeats the first occurrence is kept, since it is often the title.
+    """
+    def signature(line):
+        return _NUMBERS.sub("#", line.lower())
+    counts = Counter(signature(line) for line in lines if line and len(line) <= HEADER_FOOTER_MAX_CHARS)
+    seen = set()
+    kept = []
+    for line in lines:
+        key = signature(line)
+        if line and len(line) <= HEADER_FOOTER_MAX_CHARS and counts[key] >= min_repeats:
+            if key in seen or "#" in key:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept
+
+
+def _is_revision_row(line: str) -> bool:
+    return bool(_DATE.search(line)) and len(line) <= 200 and bool(_REVISION_ROW.match(line))
+
+
+def strip_revision_tables(lines: list[str]) -> list[str]:
+    """
+    Removes revision/change history tables: a "Revision History"-style heading and the rows
+    after it, plus any unlabelled run of three or more dated revision rows.
+    """
+    kept = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _REVISION_HEADING.match(line):
+            i += 1
+            # Column header row(s), then dated rows; stop at the first line that is neither.
+            while i < len(lines) and (not lines[i] or _is_revision_row(lines[i])
+                                      or (len(lines[i]) <= 60 and re.search(r"\b(rev|date|description|author|change)\b", lines[i], re.I))):
+                i += 1
+            continue
+        if _is_revision_row(line):
+            end = i
+            while end < len(lines) and _is_revision_row(lines[end]):
+                end += 1
+            if end - i >= 3:
+                i = end
+                continue
+        kept.append(line)
+        i += 1
+    return kept
+
+
+def clean_document_text(text: str) -> list[str]:
+    """Normalized lines without page furniture, revision tables or table-of-contents leaders."""
+    lines = strip_revision_tables(strip_repeated_lines(normalize_lines(text)))
+    return [_TOC_LEADER.sub("", line).strip() if _TOC_LEADER.search(line) and len(line) <= 120 else line for line in lines]
+
+
+def is_heading(line: str) -> bool:
+    if not line or len(line) > HEADING_MAX_CHARS or line.endswith((".", ",", ";")):
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    letters = [ch for ch in line if ch.isalpha()]
+    return len(letters) >= 4 and all(ch.isupper() for ch in letters)
+
+
+def _clip_words(text: str, char_budget: int) -> str:
+    return text[:char_budget].rsplit(" ", 1)[0] if len(text) > char_budget else text
+
+
+def _take_lines(lines: list[str], char_budget: int, separator: str, clip_last: bool = False) -> str:
+    """Joins whole lines up to char_budget; with clip_last the line that does not fit is cut at a word boundary."""
+    taken, used = [], 0
+    for line in lines:
+        if used + len(line) + len(separator) > char_budget:
+            if clip_last and char_budget - used > 40:
+                taken.append(_clip_words(line, char_budget - used - len(separator)))
+            break
+        taken.append(line)
+        used += len(line) + len(separator)
+    return separator.join(taken)
+
+
+def _assemble(lines: list[str], char_budget: int) -> str:
+    """Builds the sampled context from cleaned lines within roughly char_budget characters."""
+    content = [(index, line) for index, line in enumerate(lines) if line]
+    title_lines = [line for _, line in content[:TITLE_MAX_LINES] if len(line) <= 150]
+    title_end = content[len(title_lines) - 1][0] + 1 if title_lines else 0
+    headings = [line for _, line in content if is_heading(line) and line not in title_lines]
+    captions = [line for _, line in content if _CAPTION.match(line)]
+
+    parts = []
+    if title_lines:
+        parts.append("Title: " + " / ".join(title_lines))
+    if headings:
+        parts.append("Headings: " + _take_lines(list(dict.fromkeys(headings)), int(char_budget * HEADINGS_SHARE), " | "))
+    if captions:
+        parts.append("Table/figure captions: " + _take_lines(list(dict.fromkeys(captions)), int(char_budget * CAPTIONS_SHARE), " | "))
+
+    # Opening section: body text after the title, skipping a table of contents made only of headings.
+    body = [line for line in lines[title_end:] if line and not is_heading(line)]
+    opening_budget = int(char_budget * OPENING_SECTION_SHARE)
+    opening = _take_lines(body, opening_budget, "\n", clip_last=True)
+    if opening:
+        parts.append("Opening section:\n" + opening)
+
+    # Excerpts spread evenly over the rest of the document fill whatever budget is left.
+    remaining = char_budget - sum(len(part) + 2 for part in parts)
+    rest = "\n".join(body[opening.count("\n") + 1 if opening else 0:])
+    if remaining > EXCERPT_CHARS // 2 and rest:
+        count = max(1, remaining // (EXCERPT_CHARS + 8))
+        step = max(1, len(rest) // count)
+        size = min(EXCERPT_CHARS, remaining // count - 8)
+        excerpts = [_clip_words(rest[start:start + size + 20].split(" ", 1)[-1], size).strip()
+                    for start in range(step // 2, len(rest), step)][:count]
+        parts.append("Excerpts:\n" + "\n".join(f"[...] {excerpt}" for excerpt in excerpts if excerpt))
+    return "\n\n".join(parts)
+
+
+def build_prompt_context(text: str, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+                         count_tokens: Callable[[str], int] = estimate_tokens) -> tuple[str, int]:
+    """
+    Returns (context, token_count) for a document: the cleaned text if it fits token_budget,
+    otherwise a sampled view of it. count_tokens measures the result (pass the model's token
+    counter for exact numbers); the sample is shrunk and re-measured until it fits.
+    """
+    lines = clean_document_text(text)
+    cleaned = "\n".join(lines).strip()
+    if estimate_tokens(cleaned) <= token_budget:
+        return cleaned, count_tokens(cleaned)
+
+    char_budget = token_budget * 4
+    for _ in range(FIT_ATTEMPTS):
+        context = _assemble(lines, char_budget)
+        tokens = count_tokens(context)
+        if tokens <= token_budget:
+            return context, tokens
+        char_budget = int(char_budget * token_budget / tokens * 0.95)
+    return context, tokens
@@ -0,0 +1,404 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+
+from local_classifier import tokenize
+from near_duplicates import estimate_similarity, lsh_band_keys
+
+# --- Results Store Configuration ---
+DEFAULT_RESULTS_FILE = "tagger_results.db"
+
+# Columns returned for listings; extracted_text is large and only loaded on demand.
+_LISTING_COLUMNS = ("filename", "category", "confidence", "tags", "reasoning", "status", "timestamp", "content_hash", "classifier", "fingerprint", "duplicate_of")
+SORTABLE_COLUMNS = ("timestamp", "confidence", "category", "status", "filename")
+# Columns added after the first release; stores created earlier get them on open.
+_ADDED_COLUMNS = {"fingerprint": "TEXT", "minhash": "BLOB", "duplicate_of": "TEXT", "has_text": "INTEGER NOT NULL DEFAULT 0"}
+NEAR_DUPLICATE_CANDIDATES = 50  # Candidates sharing the most LSH buckets that are compared exactly
+
+
+def normalize_tag(tag: str) -> str:
+    """Canonical form used for tag lookups: trimmed, lower-cased, single-spaced."""
+    return " ".join(str(tag).lower().split())
+
+
+def index_terms(record: dict) -> set[tuple[str, str]]:
+    """
+    (term, field) pairs a document is findable by: each whole tag and category, plus the
+    individual words of tags, category and reasoning (so 'fmea' finds the FMEA category).
+    """
+    terms = set()
+    for tag in record.get("tags") or []:
+        terms.add((normalize_tag(tag), "tag"))
+        terms.update((word, "tag") for word in tokenize(str(tag)))
+    category = record.get("category") or ""
+    terms.add((normalize_tag(category), "category"))
+    terms.update((word, "category") for word in tokenize(category))
+    terms.update((word, "reasoning") for word in tokenize(record.get("reasoning") or ""))
+    return {(term, field) for term, field in terms if term}
+
+
+_QUERY_TOKEN = re.compile(r'"([^"]+)"|(\S+)')
+
+def parse_search_query(query: str) -> list[list[tuple[str, bool]]]:
+    """
+    Parses a search box query into OR-groups of AND-ed (term, is_prefix) pairs.
+    Words are AND-ed, OR (upper case) separates alternatives, a trailing * makes a prefix
+    search and "double quotes" match a whole multi-word tag or category.
+    Example: 'brake caliper OR rotor*' -> [[('brake', False), ('caliper', False)], [('rotor', True)]]
+    """
+    groups = [[]]
+    for quoted, word in _QUERY_TOKEN.findall(query):
+        if word == "OR":
+            if groups[-1]:
+                groups.append([])
+            continue
+        term = normalize_tag(quoted or word)
+        is_prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            groups[-1].append((term, is_prefix))
+    return [group for group in groups if group]
+
+
+class ResultsStore:
+    """
+    SQLite-backed store of classified documents, shared by every session and app replica
+    that points at the same file. Category, status, confidence and timestamp are indexed,
+    and tags, categories and reasoning keywords feed an inverted index that is updated in
+    the same transaction as every write, so filtered, paginated and searched queries stay
+    fast at hundreds of thousands of documents.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULTS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache keeps the hot part of the term index in memory
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    filename TEXT NOT NULL UNIQUE,
+                    category TEXT NOT NULL,
+                    confidence INTEGER NOT NULL DEFAULT 0,
+                    tags TEXT NOT NULL DEFAULT '[]',
+                    reasoning TEXT,
+                    status TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    content_hash TEXT,
+                    classifier TEXT,
+                    extracted_text TEXT,
+                    fingerprint TEXT,
+                    minhash BLOB,
+                    duplicate_of TEXT,
+                    has_text INTEGER NOT NULL DEFAULT 0 -- extracted_text is stored and non-empty; queried instead of the text
+                );
+                CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category);
+                CREATE INDEX IF NOT EXISTS idx_documents_status_category ON documents(status, category);
+                CREATE INDEX IF NOT EXISTS idx_documents_confidence ON documents(confidence);
+                CREATE INDEX IF NOT EXISTS idx_documents_timestamp ON documents(timestamp);
+                CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+
+                -- Inverted index: normalized term -> documents. The primary key doubles as a sorted
+                -- term index, so exact and prefix lookups are range scans.
+                CREATE TABLE IF NOT EXISTS search_terms (
+                    term TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    PRIMARY KEY (term, field, document_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_search_terms_document ON search_terms(document_id);
+
+                -- MinHash LSH buckets (see near_duplicates): documents sharing a bucket are near-duplicate candidates.
+                CREATE TABLE IF NOT EXISTS minhash_bands (
+                    band_key INTEGER NOT NULL,
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    PRIMARY KEY (band_key, document_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_minhash_bands_document ON minhash_bands(document_id);
+            """)
+            # Rows from before a column existed keep NULL there: no fingerprint counts as stale, no minhash as not indexed.
+            existing_columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+            for column, column_type in _ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+                    if column == "has_text":
+                        self._conn.execute("UPDATE documents SET has_text = 1 WHERE extracted_text IS NOT NULL AND extracted_text != ''")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_fingerprint ON documents(fingerprint)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_duplicate_of ON documents(duplicate_of)")
+            # Covers count_stale, so the results page never reads the rows (and their text) to show the notice
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_stale ON documents(has_text, fingerprint, status)")
+            # Only documents still waiting for a MinHash signature, so counting them for the upload page is cheap.
+            # Named in those queries (INDEXED BY): the planner would otherwise pick idx_documents_stale and read every row.
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_unindexed ON documents(id) WHERE minhash IS NULL AND has_text = 1")
+            self._conn.commit()
+
+    # --- Writes ---
+
+    def upsert(self, record: dict) -> None:
+        """Inserts or replaces the record for record['filename'], including its tag rows."""
+        with self._lock:
+            self._upsert_locked(record)
+            self._conn.commit()
+
+    def _upsert_locked(self, record: dict) -> None:
+        tags = list(record.get("tags") or [])
+        document_id = self._conn.execute("""
+            INSERT INTO documents (filename, category, confidence, tags, reasoning, status, timestamp, content_hash, classifier, extracted_text,
+                                   fingerprint, minhash, duplicate_of, has_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET
+                category = excluded.category, confidence = excluded.confidence, tags = excluded.tags,
+                reasoning = excluded.reasoning, status = excluded.status, timestamp = excluded.timestamp,
+                content_hash = excluded.content_hash, classifier = excluded.classifier,
+                extracted_text = COALESCE(excluded.extracted_text, documents.extracted_text),
+                has_text = CASE WHEN excluded.extracted_text IS NULL THEN documents.has_text ELSE excluded.has_text END,
+                fingerprint = excluded.fingerprint,
+                minhash = COALESCE(excluded.minhash, documents.minhash),
+                duplicate_of = excluded.duplicate_of
+            RETURNING id
+        """, (record["filename"], record.get("category", "N/A"), int(record.get("confidence") or 0), json.dumps(tags),
+              record.get("reasoning"), record.get("status", "Error"), record.get("timestamp", ""),
+              record.get("content_hash"), record.get("classifier"), record.get("extracted_text"),
+              record.get("fingerprint"), record.get("minhash"), record.get("duplicate_of"),
+              int(bool(record.get("extracted_text"))))).fetchone()[0]
+        self._conn.execute("DELETE FROM search_terms WHERE document_id = ?", (document_id,))
+        self._conn.executemany("INSERT OR IGNORE INTO search_terms (term, field, document_id) VALUES (?, ?, ?)",
+                               [(term, field, document_id) for term, field in index_terms({**record, "tags": tags})])
+        if record.get("minhash") is not None:
+            self._set_minhash_locked(document_id, record["minhash"])
+
+    def _set_minhash_locked(self, document_id: int, signature: bytes) -> None:
+        self._conn.execute("UPDATE documents SET minhash = ? WHERE id = ?", (signature, document_id))
+        self._conn.execute("DELETE FROM minhash_bands WHERE document_id = ?", (document_id,))
+        if signature:
+            self._conn.executemany("INSERT OR IGNORE INTO minhash_bands (band_key, document_id) VALUES (?, ?)",
+                                   [(band_key, document_id) for band_key in lsh_band_keys(signature)])
+
+    def set_minhash(self, filename: str, signature: bytes) -> None:
+        """
+        Indexes a document for near-duplicate lookups without touching its classification.
+        An empty signature marks a text too short to index, so it is not offered for indexing again.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM documents WHERE filename = ?", (filename,)).fetchone()
+            if row is not None:
+                self._set_minhash_locked(row["id"], signature)
+                self._conn.commit()
+
+    def copy(self, source_filename: str, filename: str) -> bool:
+        """
+        Stores the record of source_filename, with its text and MinHash signature, under
+        filename as well (an identical upload under a new name). Returns False if there is no such record.
+        """
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_LISTING_COLUMNS)}, extracted_text, minhash FROM documents WHERE filename = ?",
+                                     (source_filename,)).fetchone()
+            if row is None:
+                return False
+            self._upsert_locked({**self._row_to_record(row), "filename": filename})
+            self._conn.commit()
+        return True
+
+    def update_classification(self, filename: str, category: str, tags: list[str], status: str) -> None:
+        """Applies a manual edit from the results page."""
+        record = self.get(filename)
+        if record is None:
+            return
+        record.update({"category": category, "tags": tags, "status": status})
+        self.upsert(record)
+
+    # --- Reads ---
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> dict:
+        record = dict(row)
+        record["tags"] = json.loads(record["tags"])
+        return record
+
+    def get(self, filename: str, include_text: bool = False) -> dict | None:
+        columns = ", ".join(_LISTING_COLUMNS + (("extracted_text",) if include_text else ()))
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM documents WHERE filename = ?", (filename,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def find_by_content_hash(self, content_hash: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_LISTING_COLUMNS)} FROM documents WHERE content_hash = ? LIMIT 1",
+                                     (content_hash,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    # A document is stale when it was classified under another prompt/taxonomy/model fingerprint.
+    # Manual verifications are never overwritten, and only documents whose extracted text was
+    # stored can be re-classified without re-reading the original file.
+    _STALE_WHERE = "has_text = 1 AND (fingerprint IS NULL OR fingerprint != ?) AND status != 'Manually Verified'"
+
+    def count_stale(self, fingerprint: str) -> int:
+        """
+        Number of documents iter_stale() would return. Runs on every results page rerun, so it
+        is counted from idx_documents_stale alone: "fingerprint != ?" as three range seeks
+        (missing, lower, higher), which skips the current documents instead of scanning them.
+        """
+        matching = "SELECT COUNT(*) FROM documents WHERE has_text = 1 AND status != 'Manually Verified' AND "
+        with self._lock:
+            return self._conn.execute(f"SELECT ({matching}fingerprint IS NULL) + ({matching}fingerprint < ?1) + ({matching}fingerprint > ?1)",
+                                      (fingerprint,)).fetchone()[0]
+
+    def iter_stale(self, fingerprint: str, page_size: int = 200):
+        """
+        Yields (filename, extracted_text) for every stale document, a page at a time.
+        Pages are keyed on id rather than OFFSET, so documents re-classified (and so no longer
+        stale) while the caller iterates do not shift later pages.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT id, filename, extracted_text FROM documents WHERE id > ? AND {self._STALE_WHERE} "
+                                          "ORDER BY id LIMIT ?", (last_id, fingerprint, page_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["filename"], row["extracted_text"]
+            last_id = rows[-1]["id"]
+
+    def find_near_duplicate(self, signature: bytes, threshold: float, fingerprint: str, exclude_filename: str | None = None) -> tuple[dict, float] | None:
+        """
+        The most similar classified document whose estimated similarity to signature reaches
+        threshold, as (record, similarity), or None. Only documents that can lend their
+        classification are considered: manually verified ones, and ones classified under the
+        current fingerprint that did not inherit their own classification or fail. Candidates
+        come from the LSH buckets, so the cost depends on how many documents share a bucket,
+        not on the size of the store.
+        """
+        band_keys = lsh_band_keys(signature)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT d.id, d.minhash, COUNT(*) AS shared_bands FROM minhash_bands b JOIN documents d ON d.id = b.document_id
+                WHERE b.band_key IN ({', '.join('?' * len(band_keys))}) AND d.filename != ?
+                  AND (d.status = 'Manually Verified' OR (d.fingerprint = ? AND d.status != 'Error' AND COALESCE(d.classifier, '') != 'inherited'))
+                GROUP BY d.id ORDER BY shared_bands DESC LIMIT ?
+            """, band_keys + [exclude_filename or "", fingerprint, NEAR_DUPLICATE_CANDIDATES]).fetchall()
+            best_id, best_similarity = None, threshold
+            for row in rows:
+                similarity = estimate_similarity(signature, row["minhash"])
+                if similarity >= best_similarity:
+                    best_id, best_similarity = row["id"], similarity
+            if best_id is None:
+                return None
+            best = self._conn.execute(f"SELECT {', '.join(_LISTING_COLUMNS)} FROM documents WHERE id = ?", (best_id,)).fetchone()
+        return self._row_to_record(best), best_similarity
+
+    def duplicate_clusters(self, limit: int = 50) -> list[dict]:
+        """Documents that others inherited their classification from, with those near-duplicates; largest clusters first."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT duplicate_of, COUNT(*) AS size, json_group_array(filename) AS members FROM documents
+                WHERE duplicate_of IS NOT NULL GROUP BY duplicate_of ORDER BY size DESC, duplicate_of LIMIT ?
+            """, (limit,)).fetchall()
+        return [{"filename": row["duplicate_of"], "duplicates": json.loads(row["members"])} for row in rows]
+
+    def count_unindexed(self) -> int:
+        """Documents with stored text but no MinHash signature (classified before near-duplicate detection)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents INDEXED BY idx_documents_unindexed WHERE minhash IS NULL AND has_text = 1").fetchone()[0]
+
+    def iter_unindexed(self, page_size: int = 200):
+        """Yields (filename, extracted_text) for every document count_unindexed() counts, a page at a time."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT id, filename, extracted_text FROM documents INDEXED BY idx_documents_unindexed "
+                                          "WHERE id > ? AND minhash IS NULL AND has_text = 1 ORDER BY id LIMIT ?",
+                                          (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["filename"], row["extracted_text"]
+            last_id = rows[-1]["id"]
+
+    @staticmethod
+    def _search_subquery(groups: list[list[tuple[str, bool]]]) -> tuple[str, list]:
+        """SQL selecting the ids of documents that match any group, where a group matches only if all its terms do."""
+        group_sql, params = [], []
+        for group in groups:
+            term_sql = []
+            for term, is_prefix in group:
+                if is_prefix:
+                    term_sql.append("SELECT document_id FROM search_terms WHERE term >= ? AND term < ?")
+                    params.extend([term, term + "\U0010ffff"])
+                else:
+                    term_sql.append("SELECT document_id FROM search_terms WHERE term = ?")
+                    params.append(term)
+            # Compound operators in SQLite bind left to right with equal precedence, so each group
+            # is its own subselect; otherwise "a OR b c" would run as "(a OR b) AND c".
+            group_sql.append(f"SELECT document_id FROM ({' INTERSECT '.join(term_sql)})")
+        return " UNION ".join(group_sql), params
+
+    def _where(self, status=None, category=None, min_confidence=None, max_confidence=None, tag=None, search=None) -> tuple[str, list]:
+        clauses, params = [], []
+        for column, value in (("status", status), ("category", category)):
+            if value:
+                values = [value] if isinstance(value, str) else list(value)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?")
+            params.append(min_confidence)
+        if max_confidence is not None:
+            clauses.append("confidence <= ?")
+            params.append(max_confidence)
+        if tag:
+            clauses.append("id IN (SELECT document_id FROM search_terms WHERE term = ? AND field = 'tag')")
+            params.append(normalize_tag(tag))
+        if search:
+            groups = parse_search_query(search)
+            if groups:
+                subquery, search_params = self._search_subquery(groups)
+                clauses.append(f"id IN ({subquery})")
+                params.extend(search_params)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, status=None, category=None, min_confidence=None, max_confidence=None, tag=None, search=None,
+              order_by: str = "timestamp", descending: bool = True, limit: int = 50, offset: int = 0) -> list[dict]:
+        """
+        Returns one page of documents matching the filters; status/category accept a value or a list.
+        search uses the inverted index (see parse_search_query for the syntax).
+        """
+        if order_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by '{order_by}'. Choose one of {SORTABLE_COLUMNS}.")
+        where, params = self._where(status, category, min_confidence, max_confidence, tag, search)
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT {', '.join(_LISTING_COLUMNS)} FROM documents{where} "
+               f"ORDER BY {order_by} {direction}, id {direction} LIMIT ? OFFSET ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit, offset]).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def count(self, status=None, category=None, min_confidence=None, max_confidence=None, tag=None, search=None) -> int:
+        where, params = self._where(status, category, min_confidence, max_confidence, tag, search)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+
+    def categories(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT category FROM documents ORDER BY category")]
+
+    def suggest_terms(self, prefix: str, limit: int = 10) -> list[str]:
+        """Indexed terms starting with prefix, for search-as-you-type suggestions."""
+        prefix = normalize_tag(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT term FROM search_terms WHERE term >= ? AND term < ? ORDER BY term LIMIT ?",
+                                      (prefix, prefix + "\U0010ffff", limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        return self.count()
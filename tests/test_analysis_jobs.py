@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+import analysis_jobs
+from analysis_jobs import JobQueue, LEASE_SECONDS, RETRY_BACKOFF_SECONDS, SPOOL_GRACE_SECONDS
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Starts at the real time, so spool files written now are "fresh" until the clock moves on.
+    fake = FakeClock(analysis_jobs.time.time())
+    monkeypatch.setattr(analysis_jobs.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "spool"))
+
+
+def _uploads(*names: str) -> list[tuple[str, bytes, str]]:
+    return [(name, name.encode(), f"hash-{name}") for name in names]
+
+
+def test_claim_hands_out_each_task_once(queue):
+    job_id = queue.enqueue_uploads(_uploads("a.txt", "b.txt", "c.txt"), {"llm_concurrency": 2})
+    job, tasks = queue.claim("worker-1", 2)
+    assert job["id"] == job_id and job["options"] == {"llm_concurrency": 2}
+    assert [task["filename"] for task in tasks] == ["a.txt", "b.txt"]
+    _, tasks = queue.claim("worker-2", 2)
+    assert [task["filename"] for task in tasks] == ["c.txt"]
+    assert queue.claim("worker-3", 2) is None
+
+
+def test_expired_lease_returns_task_to_queue(queue, clock):
+    queue.enqueue_uploads(_uploads("a.txt"), {})
+    _, [task] = queue.claim("worker-1", 1)
+    clock.advance(LEASE_SECONDS - 1)
+    queue.heartbeat("worker-1")  # Renews the lease
+    clock.advance(LEASE_SECONDS - 1)
+    assert queue.claim("worker-2", 1) is None
+
+    clock.advance(2)
+    _, [reclaimed] = queue.claim("worker-2", 1)
+    assert reclaimed["id"] == task["id"] and reclaimed["attempts"] == 2
+
+
+def test_expired_lease_without_attempts_left_fails_task(queue, clock):
+    job_id = queue.enqueue_uploads(_uploads("a.txt"), {}, max_attempts=1)
+    queue.claim("worker-1", 1)
+    clock.advance(LEASE_SECONDS + 1)
+    assert queue.claim("worker-2", 1) is None
+    [row] = queue.snapshot(job_id)["files"]
+    assert row["status"] == "error"
+    assert queue.snapshot(job_id)["finished"]
+
+
+def test_retry_backs_off_then_gives_up(queue, clock):
+    queue.enqueue_uploads(_uploads("a.txt"), {}, max_attempts=2)
+    _, [task] = queue.claim("worker-1", 1)
+    assert queue.retry(task["id"], "quota exceeded")
+    assert queue.task_status(task["id"]) == "queued"
+    clock.advance(RETRY_BACKOFF_SECONDS - 1)
+    assert queue.claim("worker-1", 1) is None
+
+    clock.advance(2)
+    _, [task] = queue.claim("worker-1", 1)
+    assert task["attempts"] == 2
+    assert not queue.retry(task["id"], "quota exceeded")
+
+
+def test_release_task_does_not_use_up_an_attempt(queue):
+    queue.enqueue_uploads(_uploads("a.txt"), {})
+    _, [task] = queue.claim("worker-1", 1)
+    queue.release_task(task["id"])
+    _, [task] = queue.claim("worker-1", 1)
+    assert task["attempts"] == 1
+
+
+def test_cancel_stops_tasks_not_yet_started(queue):
+    job_id = queue.enqueue_uploads(_uploads("a.txt", "b.txt", "c.txt"), {})
+    _, [started, claimed] = queue.claim("worker-1", 2)
+    queue.set_task_status(started["id"], "extracting")
+    queue.cancel(job_id)
+
+    statuses = {row["filename"]: row["status"] for row in queue.snapshot(job_id)["files"]}
+    assert statuses == {"a.txt": "extracting", "b.txt": "cancelled", "c.txt": "cancelled"}
+    assert queue.claim("worker-2", 2) is None
+    queue.set_task_status(claimed["id"], "extracting")  # Ignored: the task is finished
+    assert queue.task_status(claimed["id"]) == "cancelled"
+
+
+def test_release_spool_keeps_files_of_unfinished_tasks(queue, clock):
+    queue.enqueue_uploads(_uploads("a.txt", "b.txt"), {})
+    path_a, path_b = queue.spool_path("hash-a.txt"), queue.spool_path("hash-b.txt")
+    assert open(path_a, "rb").read() == b"a.txt"
+    assert queue.release_spool() == 0  # Within the grace period
+
+    _, [task_a, _] = queue.claim("worker-1", 2)
+    queue.complete(task_a["id"], "worker-1", {"status": "Auto-Classified", "category": "Other", "reasoning": ""})
+    clock.advance(SPOOL_GRACE_SECONDS + 1)
+    assert queue.release_spool() == 1
+    assert not os.path.exists(path_a) and os.path.exists(path_b)
+
+
+def test_worker_counters_add_up_and_reset(queue):
+    reset_seen = queue.stats_reset_at()
+    assert queue.publish_worker_stats("worker-1", {}, {"llm_calls": 3}, reset_seen)
+    assert queue.publish_worker_stats("worker-2", {}, {"llm_calls": 4, "cache_hits": 1}, reset_seen)
+    assert queue.worker_counters() == {"llm_calls": 7, "cache_hits": 1}
+
+    queue.reset_worker_stats()
+    assert queue.worker_counters() == {}
+    assert not queue.publish_worker_stats("worker-1", {}, {"llm_calls": 3}, reset_seen)  # Totals from before the reset
+
+
+def test_reused_spool_file_is_refreshed(queue, clock):
+    path = queue.spool_path("hash-a.txt")
+    with open(path, "wb") as f:
+        f.write(b"a.txt")
+    stale = clock.now - SPOOL_GRACE_SECONDS - 60
+    os.utime(path, (stale, stale))  # Left behind by a job that finished long ago
+
+    queue.enqueue_uploads(_uploads("a.txt"), {})
+    assert os.path.getmtime(path) > clock.now - SPOOL_GRACE_SECONDS
+    assert queue.release_spool() == 0
@@ -0,0 +1,65 @@
+import pytest
+
+import document_classifier
+import gemini_client
+import job_worker
+from analysis_jobs import JobQueue
+from llm_backends import FakeGeminiBackend, FakeLLMServer
+from results_store import ResultsStore
+
+TEST_PLAN = "Test plan for the brake controller. Test cases cover the firmware update and the fault handling. " * 5
+PARTS_LIST = "Bill of materials for the pump housing: item, part number, quantity and supplier for every part. " * 5
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """A job queue and results store in tmp_path, with the offline LLM stand-in answering without delay."""
+    monkeypatch.setenv("CLASSIFICATION_CACHE_FILE", str(tmp_path / "cache.db"))
+    monkeypatch.setenv("PRECLASSIFIER_EXAMPLES_FILE", str(tmp_path / "examples.jsonl"))
+    monkeypatch.setattr(document_classifier, "_classification_cache", None)
+    monkeypatch.setattr(document_classifier, "_local_classifier", None)
+    monkeypatch.setattr(gemini_client, "_backend", FakeGeminiBackend(FakeLLMServer(median_latency_ms=0)))
+    queue = JobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "spool"))
+    store = ResultsStore(str(tmp_path / "results.db"))
+    return queue, store
+
+
+def _run_one_claim(queue, store, worker_id: str = "worker-1") -> int:
+    queue.heartbeat(worker_id)
+    job, tasks = queue.claim(worker_id, 10)
+    return job_worker.process_claimed_tasks(queue, store, "offline", worker_id, job, tasks)
+
+
+def test_upload_job_results_reach_store_and_queue(pipeline):
+    queue, store = pipeline
+    files = [("plan.txt", TEST_PLAN.encode(), "hash-plan"), ("parts.txt", PARTS_LIST.encode(), "hash-parts")]
+    job_id = queue.enqueue_uploads(files, {"preclassify_threshold": None, "unknown_option": 1})
+    assert _run_one_claim(queue, store) == 2
+
+    snapshot = queue.snapshot(job_id)
+    assert snapshot["finished"] and {row["status"] for row in snapshot["files"]} == {"done"}
+    record = store.get("plan.txt")
+    assert record["content_hash"] == "hash-plan" and record["category"] != "Error"
+
+
+def test_stored_job_reclassifies_from_stored_text(pipeline):
+    queue, store = pipeline
+    queue.enqueue_uploads([("plan.txt", TEST_PLAN.encode(), "hash-plan")], {"preclassify_threshold": None})
+    _run_one_claim(queue, store)
+
+    job_id = queue.enqueue_stored(["plan.txt", "deleted.txt"], {"preclassify_threshold": None})
+    assert _run_one_claim(queue, store) == 1
+    statuses = {row["filename"]: row["status"] for row in queue.snapshot(job_id)["files"]}
+    assert statuses == {"plan.txt": "done", "deleted.txt": "error"}
+    assert store.get("plan.txt")["content_hash"] == "hash-plan"  # Kept from the upload
+
+
+def test_cancelled_tasks_are_skipped(pipeline):
+    queue, store = pipeline
+    job_id = queue.enqueue_uploads([("plan.txt", TEST_PLAN.encode(), "hash-plan")], {})
+    queue.heartbeat("worker-1")
+    job, tasks = queue.claim("worker-1", 10)
+    queue.cancel(job_id)
+    assert job_worker.process_claimed_tasks(queue, store, "offline", "worker-1", job, tasks) == 0
+    assert store.get("plan.txt") is None
+    assert queue.snapshot(job_id)["files"][0]["status"] == "cancelled"
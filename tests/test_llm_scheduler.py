@@ -0,0 +1,64 @@
+import pytest
+
+import llm_scheduler
+from llm_scheduler import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds + 1e-6  # Like a real sleep, never returns early
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_scheduler.time, "monotonic", fake)
+    return fake
+
+
+def _tokens_granted(bucket: TokenBucket, clock: FakeClock, amount: float, seconds: float) -> float:
+    """Acquires amount repeatedly for seconds of simulated time, sleeping as told; returns the total granted."""
+    granted = 0.0
+    end = clock.now + seconds
+    while clock.now < end:
+        wait_seconds = bucket.try_acquire(amount)
+        if wait_seconds:
+            clock.sleep(wait_seconds)
+        else:
+            granted += amount
+    return granted
+
+
+@pytest.mark.parametrize("amount", [10, 100, 2000, 10000])
+def test_throughput_stays_within_rate(clock, amount):
+    tokens_per_minute = 6000
+    bucket = TokenBucket(tokens_per_minute)
+    granted = _tokens_granted(bucket, clock, amount, seconds=600)
+    # Ten minutes at the quota, plus at most the initial burst and one request in flight.
+    assert granted <= 10 * tokens_per_minute + bucket.capacity + amount
+    assert granted >= 9 * tokens_per_minute
+
+
+def test_oversized_request_waits_for_full_bucket_and_leaves_debt(clock):
+    bucket = TokenBucket(6000)  # Capacity 100 tokens
+    assert bucket.try_acquire(2000) == 0.0
+    wait_seconds = bucket.try_acquire(10)
+    # 1900 tokens of debt plus the 10 requested, refilled at 100 tokens per second.
+    assert wait_seconds == pytest.approx(19.1)
+
+
+def test_scheduler_paces_calls_to_token_quota(clock, monkeypatch):
+    monkeypatch.setattr(llm_scheduler.time, "sleep", clock.sleep)
+    scheduler = llm_scheduler.LLMCallScheduler(requests_per_minute=1000, tokens_per_minute=6000)
+    started = clock.now
+    for _ in range(30):
+        scheduler.call(lambda deadline: "ok", estimated_tokens=2000, deadline_seconds=None)
+    elapsed_minutes = (clock.now - started) / 60
+    # 60,000 tokens at 6,000 per minute take about ten minutes, less the initial burst.
+    assert 30 * 2000 / elapsed_minutes <= 6000 * 1.05
@@ -0,0 +1,40 @@
+from local_classifier import LocalPreClassifier, MIN_EXAMPLES_PER_CATEGORY
+
+BOM_TEXT = "bill of materials item part number quantity supplier material assembly " * 5
+FMEA_TEXT = "failure mode effects severity occurrence detection risk priority number " * 5
+
+
+def test_lowercase_acronyms_in_running_text_are_not_evidence(tmp_path):
+    classifier = LocalPreClassifier(str(tmp_path / "examples.jsonl"))
+    assert classifier.classify("bom dia.txt", "Greetings from the Lisbon office.") is None
+    text = "An eco-friendly packaging concept for the eco design award. " * 3
+    assert classifier.classify("notes.txt", text) is None
+
+
+def test_capitalized_acronym_in_filename_is_evidence(tmp_path):
+    classifier = LocalPreClassifier(str(tmp_path / "examples.jsonl"))
+    result = classifier.classify("ECO_4711.pdf", "Change approved by the board.")
+    assert result["category"] == "Engineering Change Order (ECO)"
+
+
+def test_model_needs_several_examples_per_category(tmp_path):
+    classifier = LocalPreClassifier(str(tmp_path / "examples.jsonl"))
+    classifier.add_example(BOM_TEXT, "Bill of Materials (BOM)", [])
+    classifier.add_example(FMEA_TEXT, "Failure Mode and Effects Analysis (FMEA)", [])
+    assert classifier.classify("doc.txt", "quantity supplier assembly overview") is None
+
+    for _ in range(MIN_EXAMPLES_PER_CATEGORY - 1):
+        classifier.add_example(BOM_TEXT, "Bill of Materials (BOM)", [])
+        classifier.add_example(FMEA_TEXT, "Failure Mode and Effects Analysis (FMEA)", [])
+    result = classifier.classify("doc.txt", "item part number quantity supplier material assembly " * 3)
+    assert result is not None and result["category"] == "Bill of Materials (BOM)"
+
+
+def test_weak_similarity_is_not_confident(tmp_path):
+    classifier = LocalPreClassifier(str(tmp_path / "examples.jsonl"))
+    for _ in range(MIN_EXAMPLES_PER_CATEGORY):
+        classifier.add_example(BOM_TEXT, "Bill of Materials (BOM)", [])
+        classifier.add_example(FMEA_TEXT, "Failure Mode and Effects Analysis (FMEA)", [])
+    # Shares one term with the BOM examples and nothing with the FMEA ones.
+    text = "supplier meeting minutes agenda attendees catering parking building visitors badge lunch"
+    assert classifier.classify("minutes.txt", text) is None
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from near_duplicates import MIN_SHINGLES, estimate_similarity, minhash_signature, shingles
+from results_store import ResultsStore
+
+FINGERPRINT = "fp-1"
+
+
+def _words(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    return [f"w{rng.randrange(5000)}" for _ in range(count)]
+
+
+def _revise(words: list[str], changes: int, seed: int) -> list[str]:
+    """The same text with changes words replaced, spread evenly, like a revised document."""
+    rng = random.Random(seed)
+    revised = list(words)
+    for index in range(0, len(words), len(words) // changes)[:changes]:
+        revised[index] = f"edit{rng.randrange(10 ** 6)}"
+    return revised
+
+
+def _jaccard(text_a: str, text_b: str) -> float:
+    a, b = shingles(text_a), shingles(text_b)
+    return len(a & b) / len(a | b)
+
+
+def _record(filename: str, text: str, **fields) -> dict:
+    return {"filename": filename, "category": "Project Plan", "confidence": 90, "tags": [], "reasoning": "",
+            "status": "Auto-Classified", "fingerprint": FINGERPRINT, "extracted_text": text, "minhash": minhash_signature(text), **fields}
+
+
+def test_short_texts_get_no_signature():
+    assert minhash_signature(" ".join(_words(1, MIN_SHINGLES + 3))) is None
+    assert minhash_signature(" ".join(_words(1, MIN_SHINGLES + 4))) is not None
+
+
+@pytest.mark.parametrize("changes", [1, 5, 20, 60])
+def test_similarity_estimate_tracks_jaccard(changes):
+    words = _words(2, 800)
+    original, revised = " ".join(words), " ".join(_revise(words, changes, seed=3))
+    estimate = estimate_similarity(minhash_signature(original), minhash_signature(revised))
+    assert abs(estimate - _jaccard(original, revised)) < 0.1
+
+
+def test_unrelated_texts_are_dissimilar():
+    assert estimate_similarity(minhash_signature(" ".join(_words(4, 500))), minhash_signature(" ".join(_words(5, 500)))) < 0.05
+
+
+def test_store_lookup_respects_threshold(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    words = _words(6, 800)
+    store.upsert(_record("plan_rev_a.txt", " ".join(words)))
+    light_revision = minhash_signature(" ".join(_revise(words, 3, seed=7)))  # Jaccard about 0.96
+    heavy_revision = minhash_signature(" ".join(_revise(words, 40, seed=8)))  # Jaccard about 0.6
+
+    match = store.find_near_duplicate(light_revision, 0.9, FINGERPRINT)
+    assert match is not None and match[0]["filename"] == "plan_rev_a.txt" and match[1] >= 0.9
+    assert store.find_near_duplicate(heavy_revision, 0.9, FINGERPRINT) is None
+    assert store.find_near_duplicate(light_revision, 0.9, "another-fingerprint") is None  # Classified under an old prompt
+
+
+def test_copy_keeps_signature(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    text = " ".join(_words(9, 400))
+    store.upsert(_record("plan.txt", text))
+    assert store.copy("plan.txt", "plan (copy).txt")
+    store.upsert(_record("plan.txt", "replaced " * 5, minhash=b""))  # The original no longer matches
+
+    match = store.find_near_duplicate(minhash_signature(text), 0.9, FINGERPRINT)
+    assert match is not None and match[0]["filename"] == "plan (copy).txt"
+    assert not store.copy("missing.txt", "other.txt")
@@ -0,0 +1,50 @@
+import pytest
+
+from results_store import ResultsStore
+
+
+def _record(filename: str, tags: list[str], **fields) -> dict:
+    return {"filename": filename, "category": "Project Plan", "confidence": 90, "tags": tags, "reasoning": "",
+            "status": "Auto-Classified", "timestamp": filename, **fields}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultsStore(str(tmp_path / "results.db"))
+
+
+@pytest.mark.parametrize("search", ["rotor OR brake caliper", "brake caliper OR rotor"])
+def test_search_groups_do_not_depend_on_term_order(store, search):
+    store.upsert(_record("a", ["rotor"]))
+    store.upsert(_record("b", ["brake", "caliper"]))
+    store.upsert(_record("c", ["caliper"]))
+    assert sorted(row["filename"] for row in store.query(search=search)) == ["a", "b"]
+    assert store.count(search=search) == 2
+
+
+def test_stale_documents_need_stored_text(store):
+    store.upsert(_record("old.txt", [], fingerprint="v1", extracted_text="old prompt"))
+    store.upsert(_record("current.txt", [], fingerprint="v2", extracted_text="current prompt"))
+    store.upsert(_record("unversioned.txt", [], extracted_text="before fingerprints"))
+    store.upsert(_record("verified.txt", [], fingerprint="v1", extracted_text="checked", status="Manually Verified"))
+    store.upsert(_record("no_text.txt", [], fingerprint="v1"))
+    store.upsert(_record("empty.txt", [], fingerprint="v1", extracted_text=""))
+    store.update_classification("old.txt", "Project Plan", ["edited"], "Auto-Classified")  # Written back without its text
+
+    stale = sorted(filename for filename, _ in store.iter_stale("v2"))
+    assert stale == ["old.txt", "unversioned.txt"]
+    assert store.count_stale("v2") == 2
+    assert store.count_stale("v0") == store.count_stale("v3") == 3
+
+
+def test_unindexed_documents_need_stored_text(store):
+    store.upsert(_record("legacy.txt", [], extracted_text="classified before near-duplicate detection"))
+    store.upsert(_record("indexed.txt", [], extracted_text="already indexed", minhash=b"\x01" * 1024))
+    store.upsert(_record("too_short.txt", [], extracted_text="short"))
+    store.set_minhash("too_short.txt", b"")  # Marked as too short to index
+    store.upsert(_record("no_text.txt", []))
+    assert store.count_unindexed() == 1
+    assert [filename for filename, _ in store.iter_unindexed()] == ["legacy.txt"]
+
+    store.set_minhash("legacy.txt", b"\x02" * 1024)
+    assert store.count_unindexed() == 0
@@ -0,0 +1,42 @@
+import io
+import pathlib
+
+import pytest
+
+from upload_spool import copy_source, hash_source, open_source, source_size
+
+CONTENT = b"%PDF-1.4 spooled upload " * 100
+
+
+@pytest.fixture
+def sources(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(CONTENT)
+    return [CONTENT, str(path), pathlib.Path(path), io.BytesIO(CONTENT)]
+
+
+def test_every_source_kind_reads_the_same(sources):
+    expected_hash = hash_source(CONTENT)
+    for source in sources:
+        assert source_size(source) == len(CONTENT)
+        assert hash_source(source) == expected_hash
+        destination = io.BytesIO()
+        assert copy_source(source, destination) == len(CONTENT)
+        assert destination.getvalue() == CONTENT
+
+
+def test_stream_keeps_its_position():
+    stream = io.BytesIO(CONTENT)
+    stream.seek(10)
+    with open_source(stream) as opened:
+        assert opened.read(4) == b"%PDF"
+    assert stream.tell() == 10
+
+
+@pytest.mark.parametrize("source", [None, 42, ["upload.pdf"]])
+def test_unsupported_source_is_rejected(source):
+    with pytest.raises(TypeError):
+        source_size(source)
+    with pytest.raises(TypeError):
+        with open_source(source):
+            pass
@@ -0,0 +1,296 @@
+import os
+import codecs
+import re
+import logging
+import zipfile
+import itertools
+import xml.etree.ElementTree as ElementTree
+from typing import Callable, Iterable, Iterator, Optional
+
+import PyPDF2
+import docx
+import openpyxl
+
+from ocr_engine import iter_ocr_pages, PdfOcrSession, DEFAULT_MAX_IN_FLIGHT_PAGES
+from upload_spool import DocumentSource, open_source, iter_chunks
+
+# Extraction helpers are shared by the Streamlit app and offline tools, so problems are
+# reported through logging. The app forwards these records to the page as st.* messages.
+logger = logging.getLogger(__name__)
+
+PAGE_TEXT_MIN_CHARS = 20  # A page whose text layer is shorter than this is treated as scanned
+PAGE_MIN_READABLE_RATIO = 0.6  # Below this share of letters/digits/whitespace the text layer is garbage
+PDF_PAGE_WINDOW = max(8, DEFAULT_MAX_IN_FLIGHT_PAGES)  # Pages inspected per batch before OCR-ing the ones that need it
+_CID_GLYPH = re.compile(r"\(cid:\d+\)")
+XLSX_MAX_ROWS_PER_SHEET = 10000  # KGAS exports and BOMs can have hundreds of thousands of rows per sheet
+DOCX_CELL_SEPARATOR = " | "
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_PART = re.compile(r"word/(header|footer)(\d*)\.xml")
+
+# --- Chunk Streams ---
+# Each extractor is a generator over natural units (pages, paragraphs, rows) so callers
+# can stop reading a document as soon as they have enough text. Documents are read through
+# a file object (see upload_spool.open_source), so a path or an open upload is never copied
+# into a byte string first.
+
+def iter_pdf_pages(source: DocumentSource) -> Iterator[str]:
+    """Yields the text layer of each PDF page, in order."""
+    with open_source(source) as stream:
+        pdf_reader = PyPDF2.PdfReader(stream)
+        for page in pdf_reader.pages:
+            yield page.extract_text() or ""
+
+def page_needs_ocr(page_text: str) -> bool:
+    """True if a page's text layer is empty, too short, or mostly unmapped glyphs / symbols."""
+    stripped = _CID_GLYPH.sub("", page_text).strip()
+    if len(stripped) < PAGE_TEXT_MIN_CHARS:
+        return True
+    readable = sum(1 for ch in stripped if ch.isalnum() or ch.isspace())
+    return readable / len(stripped) < PAGE_MIN_READABLE_RATIO
+
+def iter_pdf_pages_hybrid(source: DocumentSource, on_ocr_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """
+    Yields the text of each PDF page in order, OCR-ing only the pages whose text layer is unusable.
+    Pages are inspected in windows of PDF_PAGE_WINDOW; the pages of a window that need OCR are
+    processed in parallel, and the PDF is only spooled for OCR if at least one page needs it.
+    """
+    ocr_session = None
+    ocr_failed = False
+    ocr_pages_done = 0
+    ocr_pages_planned = 0
+    pages = enumerate(iter_pdf_pages(source), start=1)
+    try:
+        while True:
+            window = list(itertools.islice(pages, PDF_PAGE_WINDOW))
+            if not window:
+                break
+            texts = dict(window)
+            ocr_page_numbers = [page_number for page_number, page_text in window if page_needs_ocr(page_text)]
+
+            if ocr_page_numbers and not ocr_failed:
+                if ocr_session is None:
+                    logger.info("Some pages have no usable text layer. Running OCR on those pages only; this may be slow for large files.")
+                    ocr_session = PdfOcrSession(source)
+                ocr_pages_planned += len(ocr_page_numbers)
+                def report_progress(pages_done, _window_total):
+                    if on_ocr_progress:
+                        on_ocr_progress(ocr_pages_done + pages_done, ocr_pages_planned)
+                try:
+                    for page_number, ocr_text in zip(ocr_page_numbers, ocr_session.iter_pages(ocr_page_numbers, on_progress=report_progress)):
+                        if ocr_text.strip():
+                            texts[page_number] = ocr_text
+                    ocr_pages_done += len(ocr_page_numbers)
+                except Exception as e:
+                    # Keep going with the text layer; one failed OCR setup should not lose the digital pages.
+                    logger.error(f"OCR processing failed. Please ensure Tesseract is installed and configured correctly. Error: {e}")
+                    ocr_failed = True
+
+            for page_number, _ in window:
+                yield texts[page_number]
+    finally:
+        if ocr_session is not None:
+            ocr_session.close()
+
+def iter_docx_paragraphs(source: DocumentSource) -> Iterator[str]:
+    """Yields the text of each body paragraph in a .docx file via python-docx (tables, headers and footers are not included)."""
+    with open_source(source) as stream:
+        document = docx.Document(stream)
+    for para in document.paragraphs:
+        yield para.text
+
+def _iter_wordprocessing_part(part) -> Iterator[str]:
+    """
+    Stream-parses one WordprocessingML part (document, header or footer) and yields each
+    paragraph outside tables and each table row (cells joined by DOCX_CELL_SEPARATOR) in
+    document order. Nested tables and text boxes are flattened into the enclosing cell or
+    paragraph. Finished top-level elements are cleared, so memory stays flat however long
+    the document is.
+    """
+    paragraphs = []  # Text pieces of the open paragraphs (text boxes nest paragraphs in paragraphs)
+    cells = []  # Paragraph texts of the open table cells
+    rows = []  # Cell texts of the open table rows
+    container = None
+    depth = 0
+    for event, element in ElementTree.iterparse(part, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            depth += 1
+            if tag == f"{_W}body" or (container is None and tag in (f"{_W}hdr", f"{_W}ftr")):
+                container, container_depth = element, depth
+            elif tag == f"{_W}p":
+                paragraphs.append([])
+            elif tag == f"{_W}tc":
+                cells.append([])
+            elif tag == f"{_W}tr":
+                rows.append([])
+            continue
+
+        depth -= 1
+        if tag == f"{_W}t" and paragraphs:
+            paragraphs[-1].append(element.text or "")
+        elif tag == f"{_W}tab" and paragraphs:
+            paragraphs[-1].append("\t")
+        elif tag in (f"{_W}br", f"{_W}cr") and paragraphs:
+            paragraphs[-1].append("\n")
+        elif tag == f"{_W}p":
+            text = "".join(paragraphs.pop())
+            if paragraphs:
+                paragraphs[-1].append(" " + text if text else "")
+            elif cells:
+                cells[-1].append(text)
+            else:
+                yield text
+        elif tag == f"{_W}tc":
+            cell_text = " ".join(text for text in cells.pop() if text)
+            if rows:
+                rows[-1].append(cell_text)
+        elif tag == f"{_W}tr":
+            row = rows.pop()
+            while row and not row[-1]:
+                row.pop()
+            row_text = DOCX_CELL_SEPARATOR.join(row)
+            if cells:
+                cells[-1].append(row_text)  # A row of a nested table
+            elif row_text:
+                yield row_text
+        if container is not None and depth == container_depth:
+            container.clear()  # A top-level paragraph or table is done; drop it
+
+def iter_docx_blocks(source: DocumentSource) -> Iterator[str]:
+    """
+    Yields the text of a .docx file without building the python-docx object model: header
+    lines first (they usually carry the title and document number), then body paragraphs and
+    table rows in order, then footer lines. Parts are decompressed and parsed incrementally,
+    so a character budget stops reading early. Repeated header/footer lines (first page,
+    even and default variants) are only yielded once.
+    """
+    with open_source(source) as stream, zipfile.ZipFile(stream) as package:
+        names = package.namelist()
+        def header_footer_lines(kind):
+            parts = sorted((int(match.group(2) or 0), name) for name in names
+                           for match in [_DOCX_PART.fullmatch(name)] if match and match.group(1) == kind)
+            seen = set()
+            for _, name in parts:
+                with package.open(name) as part:
+                    for line in _iter_wordprocessing_part(part):
+                        if line.strip() and line not in seen:
+                            seen.add(line)
+                            yield line
+        yield from header_footer_lines("header")
+        with package.open("word/document.xml") as part:
+            yield from _iter_wordprocessing_part(part)
+        yield from header_footer_lines("footer")
+
+def iter_xlsx_rows(source: DocumentSource, max_rows_per_sheet: Optional[int] = XLSX_MAX_ROWS_PER_SHEET) -> Iterator[str]:
+    """
+    Yields one line of space-separated cell values per worksheet row.
+    The workbook is opened read-only with plain values, so rows are parsed lazily from the
+    sheet XML instead of building a styled cell object for every cell. At most
+    max_rows_per_sheet rows are read from each sheet so one huge sheet cannot hide the rest.
+    """
+    with open_source(source) as stream:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                rows = worksheet.iter_rows(values_only=True)
+                if max_rows_per_sheet is not None:
+                    rows = itertools.islice(rows, max_rows_per_sheet)
+                for row in rows:
+                    yield " ".join(str(value) for value in row if value)
+        finally:
+            workbook.close()
+
+def iter_txt_chunks(source: DocumentSource, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """Yields UTF-8 decoded text in chunks; raises UnicodeDecodeError on invalid input."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open_source(source) as stream:
+        for chunk in iter_chunks(stream, chunk_size):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+def take_text(chunks: Iterable[str], char_budget: Optional[int] = None, separator: str = "\n") -> str:
+    """
+    Joins chunks with separator, stopping as soon as char_budget characters are collected.
+    The underlying generator is closed early, so the rest of the document is never read.
+    """
+    parts = []
+    collected = 0
+    iterator = iter(chunks)
+    try:
+        for chunk in iterator:
+            parts.append(chunk + separator)
+            collected += len(chunk) + len(separator)
+            if char_budget is not None and collected >= char_budget:
+                break
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+    text = "".join(parts)
+    return text[:char_budget] if char_budget is not None else text
+
+# --- Extractors ---
+
+def perform_ocr(source: DocumentSource, char_budget: Optional[int] = None,
+                on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Performs OCR on a PDF if it's image-based, streaming pages through the shared OCR process pool."""
+    logger.info("Standard text extraction failed. Attempting OCR on the document. This may be slow for large files.")
+    try:
+        pages = iter_ocr_pages(source, max_in_flight_pages=DEFAULT_MAX_IN_FLIGHT_PAGES, on_progress=on_progress)
+        return take_text(pages, char_budget)
+    except Exception as e:
+        logger.error(f"OCR processing failed. Please ensure Tesseract is installed and configured correctly. Error: {e}")
+        return ""
+
+def extract_text_from_pdf(source: DocumentSource, char_budget: Optional[int] = None,
+                          on_ocr_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Extracts text from a PDF page by page, OCR-ing only pages without a usable text layer."""
+    try:
+        return take_text((page_text for page_text in iter_pdf_pages_hybrid(source, on_ocr_progress) if page_text), char_budget)
+    except Exception as e:
+        logger.error(f"Error reading PDF file: {e}. Attempting OCR as a fallback.")
+        return perform_ocr(source, char_budget, on_ocr_progress)
+
+def extract_text_from_docx(source: DocumentSource, char_budget: Optional[int] = None) -> str:
+    """Extracts text from a .docx file, including tables, headers and footers."""
+    try:
+        return take_text(iter_docx_blocks(source), char_budget)
+    except Exception as e:
+        logger.error(f"Error reading Word document: {e}")
+        return ""
+
+def extract_text_from_xlsx(source: DocumentSource, char_budget: Optional[int] = None,
+                           max_rows_per_sheet: Optional[int] = XLSX_MAX_ROWS_PER_SHEET) -> str:
+    """Extracts text from all cells in an .xlsx file, reading at most max_rows_per_sheet rows per sheet."""
+    try:
+        return take_text(iter_xlsx_rows(source, max_rows_per_sheet), char_budget)
+    except Exception as e:
+        logger.error(f"Error reading Excel file: {e}")
+        return ""
+
+def extract_text_from_txt(source: DocumentSource, char_budget: Optional[int] = None) -> str:
+    """Extracts text from a .txt file."""
+    try:
+        return take_text(iter_txt_chunks(source), char_budget, separator="")
+    except Exception as e:
+        logger.error(f"Error reading text file: {e}")
+        return ""
+
+def extract_text(filename: str, source: DocumentSource, char_budget: Optional[int] = None,
+                 on_ocr_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Dispatches to the right extractor based on the file extension. source is the file's
+    content, a path to it or an open binary stream (see upload_spool.DocumentSource).
+    With a char_budget, extraction stops once that many characters are available,
+    so a huge document costs about the same as a short one.
+    """
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension == ".pdf":
+        return extract_text_from_pdf(source, char_budget, on_ocr_progress)
+    elif file_extension == ".docx":
+        return extract_text_from_docx(source, char_budget)
+    elif file_extension == ".xlsx":
+        return extract_text_from_xlsx(source, char_budget)
+    elif file_extension == ".txt":
+        return extract_text_from_txt(source, char_budget)
+    return ""
@@ -0,0 +1,103 @@
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Union
+
+# --- Upload Spooling ---
+# Uploads and documents are handled as streams rather than byte strings, so a multi-hundred-MB
+# scan or ZIP is never copied whole into memory: it is hashed and copied in COPY_CHUNK_SIZE
+# pieces, and PyPDF2, zipfile, openpyxl and python-docx read it through a seekable file
+# object. A document source is its content as bytes (small files, tests), a path to the file
+# on disk as str or os.PathLike (job spool, CLI), or an open binary stream (e.g. a Streamlit
+# UploadedFile). Text is never a source: a str is always taken as a path.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+DocumentSource = Union[bytes, str, os.PathLike, BinaryIO]
+
+
+def is_path(source: DocumentSource) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _check_source(source) -> None:
+    if not (isinstance(source, (bytes, bytearray, memoryview)) or is_path(source)
+            or (hasattr(source, "read") and hasattr(source, "seek"))):
+        raise TypeError(f"Expected bytes, a path or a seekable binary stream as document source, got {type(source).__name__}")
+
+
+def iter_chunks(stream: BinaryIO, chunk_size: int = COPY_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the rest of a binary stream in chunks of at most chunk_size bytes."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def open_source(source: DocumentSource) -> Iterator[BinaryIO]:
+    """
+    A seekable binary stream over a document source, positioned at the start. Paths are
+    opened (and closed again) here; streams are rewound, returned to their previous position
+    afterwards and left open for their owner; bytes are wrapped without copying.
+    Raises TypeError for anything else.
+    """
+    _check_source(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    elif is_path(source):
+        with open(source, "rb") as stream:
+            yield stream
+    else:
+        position = source.tell()
+        source.seek(0)
+        try:
+            yield source
+        finally:
+            source.seek(position)  # Another reader of the same stream (e.g. PyPDF2 while OCR spools it) keeps its place
+
+
+def source_size(source: DocumentSource) -> int:
+    """Size of a document source in bytes, without reading it. Raises TypeError for anything else."""
+    _check_source(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if is_path(source):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def hash_source(source: DocumentSource) -> str:
+    """SHA-256 hex digest of a document source, read in chunks."""
+    digest = hashlib.sha256()
+    with open_source(source) as stream:
+        for chunk in iter_chunks(stream):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_source(source: DocumentSource, destination: BinaryIO) -> int:
+    """Copies a document source into an open binary file in chunks. Returns the number of bytes copied."""
+    with open_source(source) as stream:
+        shutil.copyfileobj(stream, destination, COPY_CHUNK_SIZE)
+        return stream.tell()
+
+
+def write_source_atomically(source: DocumentSource, path: str) -> None:
+    """Writes a document source to path via a temporary file in the same directory, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".", suffix=".part", delete=False) as partial:
+        try:
+            copy_source(source, partial)
+        except BaseException:
+            partial.close()
+            os.remove(partial.name)
+            raise
+    os.replace(partial.name, path)
+